@@ -1,2 +1,2 @@
 """Models package for LCM and hybrid selector."""
-from . import lcm, hybrid
+from . import instrument, plan_features, sql_features, lcm, hybrid
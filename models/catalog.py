@@ -0,0 +1,212 @@
+"""In-memory catalog statistics for cardinality-aware features.
+
+`scripts/catalog_snapshot.py` takes one bulk snapshot of the database
+statistics (pg_class reltuples/relpages, pg_stats and index definitions) and
+caches it as JSON together with the schema version it was taken at. This
+module loads that snapshot once and derives features from it without any
+database round trip:
+
+- `plan_catalog_vector(plan)`: sizes of the relations a plan scans, the
+  planner's scan selectivities against them, and distinct counts / skew of
+  the join keys (layout `CATALOG_FEATURE_NAMES`)
+- `sql_catalog_vector(query)`: the same idea from the query text, via the
+  tables and predicates parsed by `sql_features` (layout
+  `SQL_CATALOG_FEATURE_NAMES`); it only depends on the query template
+
+Without a snapshot both return zeros and `load_catalog()` returns None. The
+`*_matrix` functions load the snapshot once per batch and pass it down.
+"""
+import os
+import re
+import json
+from functools import lru_cache
+
+import numpy as np
+
+from .plan_features import _root, SCAN_TYPES
+from .sql_features import sql_features, query_template
+from . import instrument
+
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "results", "catalog_snapshot.json")
+
+_COLUMN_RE = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*)\.([A-Za-z_][A-Za-z0-9_]*)\b")
+_JOIN_CONDS = ("Hash Cond", "Merge Cond", "Join Filter", "Index Cond")
+
+
+class Catalog:
+    """Table sizes, column statistics and indexes of one snapshot."""
+
+    def __init__(self, snapshot):
+        self.version = snapshot.get("version")
+        self.taken_at = snapshot.get("taken_at")
+        self.tables = snapshot.get("tables", {})
+        self.columns = snapshot.get("columns", {})
+        self.indexes = snapshot.get("indexes", {})
+        # Leading columns of every index, the ones an index scan can search on
+        self._leading = {(t, idx["columns"][0]) for t, idxs in self.indexes.items()
+                         for idx in idxs if idx.get("columns")}
+
+    def rows(self, table):
+        t = self.tables.get(table)
+        return max(float(t["reltuples"]), 0.0) if t else 0.0
+
+    def pages(self, table):
+        t = self.tables.get(table)
+        return float(t["relpages"]) if t else 0.0
+
+    def n_distinct(self, table, column):
+        # pg_stats stores negative n_distinct as a fraction of the row count
+        s = self.columns.get(f"{table}.{column}")
+        if not s or s.get("n_distinct") is None:
+            return 0.0
+        nd = float(s["n_distinct"])
+        return -nd * self.rows(table) if nd < 0 else nd
+
+    def top_frequency(self, table, column):
+        # Frequency of the most common value: how skewed the column is
+        s = self.columns.get(f"{table}.{column}")
+        freqs = s.get("most_common_freqs") if s else None
+        return float(freqs[0]) if freqs else 0.0
+
+    def is_indexed(self, table, column):
+        return (table, column) in self._leading
+
+
+_loaded = {}
+
+
+def load_catalog(path=SNAPSHOT_PATH):
+    """The cached snapshot at `path` (reloaded when the file changes), or None."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "r", encoding="utf-8") as f:
+            cached = (mtime, Catalog(json.load(f)))
+        _loaded[path] = cached
+        _plan_vector_text.cache_clear()
+        _sql_vector_text.cache_clear()
+    return cached[1]
+
+
+CATALOG_FEATURE_NAMES = [
+    "cat_scan_rows_total", "cat_scan_rows_max", "cat_scan_pages_total",
+    "cat_scan_selectivity_min", "cat_scan_selectivity_mean",
+    "cat_join_ndistinct_min", "cat_join_ndistinct_max", "cat_join_key_skew_max",
+]
+N_CATALOG_FEATURES = len(CATALOG_FEATURE_NAMES)
+
+SQL_CATALOG_FEATURE_NAMES = [
+    "sql_cat_rows_log_sum", "sql_cat_rows_max", "sql_cat_pages_total",
+    "sql_cat_indexed_join_columns", "sql_cat_indexed_filter_columns", "sql_cat_join_ndistinct_min",
+]
+N_SQL_CATALOG_FEATURES = len(SQL_CATALOG_FEATURE_NAMES)
+
+
+def _plan_vector(catalog, root):
+    scans, conds, aliases = [], [], {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        rel = node.get("Relation Name")
+        if rel is not None:
+            aliases[node.get("Alias", rel)] = rel
+            if node.get("Node Type") in SCAN_TYPES:
+                scans.append((rel, node.get("Plan Rows", 0.0) or 0.0))
+        for key in _JOIN_CONDS:
+            if key in node:
+                conds.append(node[key])
+        stack.extend(node.get("Plans", ()))
+
+    vec = np.zeros(N_CATALOG_FEATURES, dtype=np.float64)
+    if scans:
+        sizes = np.array([catalog.rows(rel) for rel, _ in scans])
+        sel = np.array([min(est / size, 1.0) if size > 0 else 1.0 for (_, est), size in zip(scans, sizes)])
+        vec[0:5] = [sizes.sum(), sizes.max(), sum(catalog.pages(rel) for rel, _ in scans), sel.min(), sel.mean()]
+
+    keys = {(aliases[a], c) for cond in conds for a, c in _COLUMN_RE.findall(cond) if a in aliases}
+    nds = [catalog.n_distinct(t, c) for t, c in keys]
+    nds = [nd for nd in nds if nd > 0]
+    if nds:
+        vec[5:7] = [min(nds), max(nds)]
+    if keys:
+        vec[7] = max(catalog.top_frequency(t, c) for t, c in keys)
+    return vec
+
+
+@lru_cache(maxsize=65536)
+def _plan_vector_text(plan_text, catalog):
+    vec = _plan_vector(catalog, _root(json.loads(plan_text)))
+    vec.setflags(write=False)
+    return vec
+
+
+def plan_catalog_vector(plan, catalog=None):
+    """Catalog features of one plan (JSON text, parsed dict/list or None) against `catalog`
+    (default: the current snapshot)."""
+    if catalog is None:
+        catalog = load_catalog()
+    if catalog is None or plan is None or (isinstance(plan, float) and np.isnan(plan)) or plan == "":
+        return np.zeros(N_CATALOG_FEATURES, dtype=np.float64)
+    if isinstance(plan, str):
+        return _plan_vector_text(plan, catalog)
+    return _plan_vector(catalog, _root(plan))
+
+
+@instrument.timed("featurize.catalog")
+def plan_catalog_matrix(plans):
+    plans = list(plans)
+    out = np.zeros((len(plans), N_CATALOG_FEATURES), dtype=np.float64)
+    catalog = load_catalog()
+    if catalog is None:
+        return out
+    for i, plan in enumerate(plans):
+        out[i] = plan_catalog_vector(plan, catalog)
+    return out
+
+
+@lru_cache(maxsize=65536)
+def _sql_vector_text(text, catalog):
+    f = sql_features(text)
+    tables = f["tables"]
+    vec = np.zeros(N_SQL_CATALOG_FEATURES, dtype=np.float64)
+    if tables:
+        sizes = [catalog.rows(t) for t in tables.values()]
+        vec[0:3] = [float(np.log1p(sizes).sum()), max(sizes), sum(catalog.pages(t) for t in tables.values())]
+
+    def columns(predicates):
+        return {(tables[a], c) for p in predicates for a, c in _COLUMN_RE.findall(p) if a in tables}
+
+    join_cols = columns(f["join_predicates"])
+    vec[3] = sum(catalog.is_indexed(t, c) for t, c in join_cols)
+    vec[4] = sum(catalog.is_indexed(t, c) for t, c in columns(f["filters"]))
+    nds = [nd for nd in (catalog.n_distinct(t, c) for t, c in join_cols) if nd > 0]
+    vec[5] = min(nds) if nds else 0.0
+    vec.setflags(write=False)
+    return vec
+
+
+def sql_catalog_vector(query, catalog=None):
+    """Catalog features of one query's text (zeros without a snapshot or SQL)."""
+    if catalog is None:
+        catalog = load_catalog()
+    if catalog is None or not isinstance(query, str) or not query.strip():
+        return np.zeros(N_SQL_CATALOG_FEATURES, dtype=np.float64)
+    # Tables, join keys and filtered columns do not depend on the literals
+    return _sql_vector_text(query_template(query), catalog)
+
+
+@instrument.timed("featurize.sql_catalog")
+def sql_catalog_matrix(queries):
+    queries = list(queries)
+    out = np.zeros((len(queries), N_SQL_CATALOG_FEATURES), dtype=np.float64)
+    catalog = load_catalog()
+    if catalog is None:
+        return out
+    for i, query in enumerate(queries):
+        out[i] = sql_catalog_vector(query, catalog)
+    return out
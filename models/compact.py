@@ -0,0 +1,161 @@
+"""Compact, memory-mapped artifact format for tree models.
+
+`export_model` flattens a fitted sklearn RandomForestRegressor or
+DecisionTreeClassifier into plain arrays (feature, threshold, left/right
+child, value), all trees concatenated, and writes them into one file:
+
+    MAGIC | uint32 header length | JSON header | 64-byte aligned raw arrays
+
+`load_compact` memory-maps the arrays (read-only, so worker processes share
+the same pages) without importing sklearn, and `CompactTreeModel.predict` runs
+batched inference in pure NumPy with predictions identical to sklearn's.
+"""
+import os
+import json
+import struct
+
+import numpy as np
+
+
+MAGIC = b"WEKCMF1\n"
+_ALIGN = 64
+
+
+def _aligned(pos):
+    return (pos + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _tree_arrays(model):
+    # A forest exposes estimators_, a single tree is its own only estimator
+    trees = [est.tree_ for est in getattr(model, "estimators_", [model])]
+    classes = getattr(model, "classes_", None)
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset = 0
+    for t in trees:
+        is_leaf = t.children_left == -1
+        if classes is None:
+            node_value = t.value[:, 0, 0]
+        else:
+            # Classifier leaves predict their majority class
+            node_value = np.asarray(classes, dtype=np.float64)[np.argmax(t.value[:, 0, :], axis=1)]
+        feature.append(np.where(is_leaf, 0, t.feature).astype(np.int32))
+        threshold.append(t.threshold.astype(np.float64))
+        left.append(np.where(is_leaf, -1, t.children_left + offset).astype(np.int32))
+        right.append(np.where(is_leaf, -1, t.children_right + offset).astype(np.int32))
+        value.append(node_value.astype(np.float64))
+        roots.append(offset)
+        offset += t.node_count
+    return {
+        "feature": np.concatenate(feature),
+        "threshold": np.concatenate(threshold),
+        "left": np.concatenate(left),
+        "right": np.concatenate(right),
+        "value": np.concatenate(value),
+        "roots": np.asarray(roots, dtype=np.int32),
+    }, max(t.max_depth for t in trees)
+
+
+def export_model(model, path):
+    """Write a fitted RandomForestRegressor / DecisionTree model to `path`."""
+    arrays, max_depth = _tree_arrays(model)
+    names = getattr(model, "feature_names_in_", None)
+    header = {
+        "kind": "regressor" if getattr(model, "classes_", None) is None else "classifier",
+        "n_features": int(model.n_features_in_),
+        "feature_names": [str(n) for n in names] if names is not None else None,
+        "max_depth": int(max_depth),
+        "arrays": {},
+    }
+
+    # Arrays follow the header; offsets are relative to the (aligned) start of the data section
+    layout = []
+    pos = 0
+    for name, arr in arrays.items():
+        pos = _aligned(pos)
+        header["arrays"][name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": pos}
+        layout.append((pos, arr))
+        pos += arr.nbytes
+    head = json.dumps(header).encode("utf-8")
+    base = _aligned(len(MAGIC) + 4 + len(head))
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(head)))
+        f.write(head)
+        for rel, arr in layout:
+            f.seek(base + rel)
+            f.write(np.ascontiguousarray(arr).tobytes())
+    os.replace(tmp, path)
+    return path
+
+
+class CompactTreeModel:
+    """Read-only tree ensemble backed by memory-mapped arrays.
+
+    Exposes `predict` and `feature_names_in_` so it can stand in for the
+    sklearn model anywhere the LCM or the hybrid selector is used.
+    """
+
+    def __init__(self, header, arrays):
+        self.kind = header["kind"]
+        self.n_features_in_ = header["n_features"]
+        if header["feature_names"] is not None:
+            self.feature_names_in_ = np.asarray(header["feature_names"], dtype=object)
+        self.max_depth = header["max_depth"]
+        self._feature = arrays["feature"]
+        self._threshold = arrays["threshold"]
+        self._left = arrays["left"]
+        self._right = arrays["right"]
+        self._value = arrays["value"]
+        self._roots = np.asarray(arrays["roots"])
+
+    def predict(self, X):
+        # sklearn evaluates splits on float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        n = X.shape[0]
+        n_trees = len(self._roots)
+        # One cursor per (tree, row) pair; only pairs that have not reached a leaf advance
+        node = np.repeat(self._roots, n)
+        row = np.tile(np.arange(n), n_trees)
+        active = np.arange(node.size)
+        while active.size:
+            current = node[active]
+            left = self._left[current]
+            inner = left != -1
+            active, current, left = active[inner], current[inner], left[inner]
+            go_left = X[row[active], self._feature[current]] <= self._threshold[current]
+            node[active] = np.where(go_left, left, self._right[current])
+
+        leaf_values = self._value[node].reshape(n_trees, n)
+        if self.kind == "classifier":
+            return leaf_values[0]
+        # Same accumulation order as sklearn: sum the trees, then divide
+        return leaf_values.sum(axis=0) / len(self._roots)
+
+
+def load_compact(path):
+    """Map a file written by `export_model`; no arrays are copied into memory."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a compact model file")
+        (n,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(n))
+    base = _aligned(len(MAGIC) + 4 + n)
+    buf = np.memmap(path, dtype=np.uint8, mode="r")
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        start = base + spec["offset"]
+        count = int(np.prod(spec["shape"]))
+        arrays[name] = buf[start:start + count * dtype.itemsize].view(dtype).reshape(spec["shape"])
+    return CompactTreeModel(header, arrays)
+
+
+if __name__ == "__main__":
+    # python -m models.compact: re-export the pickled LCM and hybrid selector
+    from . import lcm, hybrid
+    print(f"Wrote {lcm.export_compact()}")
+    print(f"Wrote {hybrid.export_compact()}")
@@ -1,15 +1,16 @@
 import os
-import joblib
-import pandas as pd
-from sklearn.linear_model import LinearRegression
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_absolute_error
-from .lcm import get_feature_matrix
+import time
 
+import numpy as np
+from .lcm import get_feature_matrix, cached_feature_matrix, align_features, get_target, get_censored, censored_abs_error, load_training_data
+from .compact import export_model, load_compact
+from . import instrument
+from . import lcm as lcm_module
+from .prediction_cache import PredictionCache, cached_predict, feature_key, CACHE_DIR
 
 BASE_MODEL_PATH = os.path.join(os.path.dirname(__file__), "baseline_linreg.pkl")
 HYBRID_MODEL_PATH = os.path.join(os.path.dirname(__file__), "hybrid_selector.pkl")
+HYBRID_COMPACT_PATH = os.path.join(os.path.dirname(__file__), "hybrid_selector.cmf")
 
 
 class BaselineIdentity:
@@ -31,14 +32,19 @@ def load_baseline():
     return BaselineIdentity()
 
 
-def train_hybrid_selector(csv_path, random_state=42, max_depth=4):
-    df = pd.read_csv(csv_path)
-    X = get_feature_matrix(df)
-    y_true = df["actual_runtime_ms"].fillna(0)
+def train_hybrid_selector(data, random_state=42, max_depth=4):
+    import joblib
+    from sklearn.tree import DecisionTreeClassifier
+    from sklearn.model_selection import train_test_split
+
+    df = load_training_data(data)
+    X = cached_feature_matrix(df)
+    y_true = get_target(df)
+    censored = get_censored(df)
 
     # Train baseline and LCM predictions on a split so we can label which predictor is better
-    X_train, X_val, y_train, y_val, df_train, df_val = train_test_split(
-        X, y_true, df, test_size=0.3, random_state=random_state)
+    X_train, X_val, y_train, y_val, df_train, df_val, c_train, c_val = train_test_split(
+        X, y_true, df, censored, test_size=0.3, random_state=random_state)
 
     # Baseline is the raw PostgreSQL estimated_cost (no training)
     baseline = BaselineIdentity()
@@ -55,49 +61,157 @@ def train_hybrid_selector(csv_path, random_state=42, max_depth=4):
     except Exception:
         # fallback: train a small lcm here
         from .lcm import train_and_save
-        lcm_model = train_and_save(csv_path, overwrite=True)
+        lcm_model = train_and_save(df, overwrite=True)
 
     # Baseline prediction uses raw estimated_cost column
     pred_baseline = baseline.predict(df_val[["estimated_cost"]].fillna(0))
-    pred_lcm = lcm_model.predict(X_val)
+    pred_lcm = lcm_model.predict(align_features(lcm_model, X_val))
 
     # Create label: 1 if LCM is better (lower absolute error), else 0
-    err_baseline = abs(pred_baseline - y_val)
-    err_lcm = abs(pred_lcm - y_val)
+    # Censored rows (timed out) only penalize predictions below their budget
+    err_baseline = censored_abs_error(pred_baseline, y_val, c_val)
+    err_lcm = censored_abs_error(pred_lcm, y_val, c_val)
     choose_lcm = (err_lcm < err_baseline).astype(int)
 
     # Train a small decision tree to choose which predictor to use given features
     selector = DecisionTreeClassifier(max_depth=max_depth, random_state=random_state)
-    selector.fit(X_val, choose_lcm)
+    with instrument.span("model.fit"):
+        selector.fit(X_val, choose_lcm)
 
     # Save only the hybrid selector (baseline is identity, no need to persist)
     joblib.dump(selector, HYBRID_MODEL_PATH)
-    print(f"Saved hybrid selector to {HYBRID_MODEL_PATH}")
+    export_model(selector, HYBRID_COMPACT_PATH)
+    print(f"Saved hybrid selector to {HYBRID_MODEL_PATH} (compact: {HYBRID_COMPACT_PATH})")
     return baseline, lcm_model, selector
 
 
-def load_hybrid():
-    if not os.path.exists(HYBRID_MODEL_PATH):
+def export_compact():
+    # Re-export the pickled selector into the compact format
+    import joblib
+    return export_model(joblib.load(HYBRID_MODEL_PATH), HYBRID_COMPACT_PATH)
+
+
+@instrument.timed("model.load")
+def load_hybrid(compact=True):
+    if compact and os.path.exists(HYBRID_COMPACT_PATH):
+        selector = load_compact(HYBRID_COMPACT_PATH)
+    elif os.path.exists(HYBRID_MODEL_PATH):
+        import joblib
+        selector = joblib.load(HYBRID_MODEL_PATH)
+    else:
         raise FileNotFoundError("Hybrid selector not found. Run train_hybrid_selector().")
     # Baseline remains identity (raw Postgres estimates)
     baseline = BaselineIdentity()
-    selector = joblib.load(HYBRID_MODEL_PATH)
     try:
         from .lcm import load_model as load_lcm
-        lcm = load_lcm()
+        lcm = load_lcm(compact=compact)
     except Exception:
         lcm = None
     return baseline, lcm, selector
 
 
-def predict_hybrid(df):
-    baseline, lcm, selector = load_hybrid()
-    X = get_feature_matrix(df)
+class HybridPredictor:
+    """Selector-first hybrid inference.
 
-    base_pred = baseline.predict(df[["estimated_cost"]].fillna(0))
-    lcm_pred = lcm.predict(X)
+    The selector routes every row first; the LCM is evaluated only on the rows
+    routed to it and the baseline (the raw estimated_cost) fills in the rest, so
+    a batch costs one selector pass plus the LCM on its share of the rows.
+    With a `cache`, LCM rows whose exact feature values were predicted before
+    are looked up instead; the baseline branch is never cached. `stats`
+    accumulates per-branch row counts and seconds over all calls.
+    """
 
-    choose_lcm = selector.predict(X)
-    # If choose_lcm==1 use lcm_pred else base_pred
-    result = [lcm_pred[i] if choose_lcm[i] == 1 else base_pred[i] for i in range(len(choose_lcm))]
-    return result
+    def __init__(self, baseline, lcm, selector):
+        self.baseline = baseline
+        self.lcm = lcm
+        self.selector = selector
+        self.stats = {"calls": 0, "rows": 0, "lcm_rows": 0, "baseline_rows": 0,
+                      "selector_sec": 0.0, "lcm_sec": 0.0, "baseline_sec": 0.0}
+
+    def route(self, X):
+        """Boolean mask of the rows the selector sends to the LCM."""
+        return np.asarray(self.selector.predict(align_features(self.selector, X))) == 1
+
+    def predict(self, df, X=None, cache=None):
+        if X is None:
+            X = get_feature_matrix(df)
+        t0 = time.perf_counter()
+        with instrument.span("hybrid.selector"):
+            choose_lcm = self.route(X)
+        t1 = time.perf_counter()
+
+        out = np.empty(len(choose_lcm), dtype=np.float64)
+        use_base = ~choose_lcm
+        out[use_base] = self.baseline.predict(df.loc[use_base, ["estimated_cost"]].fillna(0))
+        t2 = time.perf_counter()
+
+        n_lcm = int(choose_lcm.sum())
+        if n_lcm:
+            if self.lcm is None:
+                raise FileNotFoundError("The selector routes rows to the LCM but no LCM model was found.")
+            X_lcm = align_features(self.lcm, X[choose_lcm])
+            with instrument.span("hybrid.lcm"):
+                if cache is None:
+                    out[choose_lcm] = self.lcm.predict(X_lcm)
+                else:
+                    out[choose_lcm] = cached_predict(cache, list(X_lcm.to_numpy(dtype=np.float64)),
+                                                     lambda idx: self.lcm.predict(X_lcm.iloc[idx]),
+                                                     key=feature_key)
+        t3 = time.perf_counter()
+
+        st = self.stats
+        st["calls"] += 1
+        st["rows"] += len(out)
+        st["lcm_rows"] += n_lcm
+        st["baseline_rows"] += len(out) - n_lcm
+        st["selector_sec"] += t1 - t0
+        st["baseline_sec"] += t2 - t1
+        st["lcm_sec"] += t3 - t2
+        return out
+
+
+_predictor = None
+_predictor_key = None
+_prediction_cache = None
+
+ARTIFACT_PATHS = [HYBRID_COMPACT_PATH, HYBRID_MODEL_PATH, lcm_module.COMPACT_PATH, lcm_module.MODEL_PATH]
+
+
+def _artifact_key():
+    return tuple(os.stat(p).st_mtime_ns if os.path.exists(p) else None for p in ARTIFACT_PATHS)
+
+
+def get_predictor():
+    """Process-wide HybridPredictor; the models are reloaded only when their files change."""
+    global _predictor, _predictor_key
+    key = _artifact_key()
+    if _predictor is None or key != _predictor_key:
+        _predictor = HybridPredictor(*load_hybrid())
+        _predictor_key = key
+    return _predictor
+
+
+def prediction_cache(persist=False):
+    """Process-wide cache of the LCM branch, keyed by exact feature values. It invalidates
+    itself when any model artifact changes; with `persist` it is also loaded from and saved
+    to results/prediction_cache/hybrid.pkl."""
+    global _prediction_cache
+    if _prediction_cache is None:
+        _prediction_cache = PredictionCache(ARTIFACT_PATHS, os.path.join(CACHE_DIR, "hybrid.pkl") if persist else None)
+    return _prediction_cache
+
+
+def predict_hybrid(df, X=None, cache=False):
+    """Hybrid predictions for `df` (NumPy array); pass `X` to reuse an already built feature
+    matrix. `cache=True` reuses LCM predictions of identical feature rows (`prediction_cache()`);
+    evaluation and reports leave it off."""
+    return get_predictor().predict(df, X, cache=prediction_cache() if cache else None)
+
+
+def branch_stats():
+    """Per-branch row counts and seconds of the shared predictor since it was loaded,
+    with the hit/miss counters of the prediction cache once it is in use."""
+    stats = dict(get_predictor().stats)
+    if _prediction_cache is not None:
+        stats["cache"] = _prediction_cache.stats()
+    return stats
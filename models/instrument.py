@@ -0,0 +1,203 @@
+"""Lightweight spans for finding where a run spends its time.
+
+Hot paths are wrapped in named spans:
+
+    with instrument.span("postgres.explain"):
+        cursor.execute(...)
+
+    @instrument.timed("model.predict")
+    def predict(...): ...
+
+Disabled (the default), `span()` returns one shared no-op context manager and
+`timed` functions pay a single flag check, so instrumented code runs as before.
+Enabled, every span adds its wall time to a per-name counter; the time of
+nested spans is subtracted from their parent's "self" time, so the breakdown
+printed at exit shows where the time actually went (Postgres, JSON, pandas,
+sklearn, file I/O).
+
+Enable it with the WEK_PROFILE environment variable or the `--profile` flag of
+the scripts; the value is a comma-separated list of outputs:
+
+    summary   per-span breakdown printed at exit (also what "1" means)
+    trace     Chrome trace (chrome://tracing, Perfetto) in PROFILE_DIR
+    pstats    cProfile dump in PROFILE_DIR (python -m pstats <file>);
+              cProfile itself slows the run down noticeably
+
+    WEK_PROFILE=summary,trace python scripts/generate_plans.py
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from functools import wraps
+
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "results", "profile")
+PROFILE_OUTPUTS = ("summary", "trace", "pstats")
+
+_enabled = False
+_outputs = set()
+_stats = {}            # name -> [count, total_ns, self_ns]
+_events = []           # Chrome trace events, only with "trace"
+_lock = threading.Lock()
+_local = threading.local()
+_profiler = None
+_started_ns = 0
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("name", "start", "child_ns")
+
+    def __init__(self, name):
+        self.name = name
+        self.child_ns = 0
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        elapsed = end - self.start
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].child_ns += elapsed
+        with _lock:
+            s = _stats.get(self.name)
+            if s is None:
+                s = _stats[self.name] = [0, 0, 0]
+            s[0] += 1
+            s[1] += elapsed
+            s[2] += elapsed - self.child_ns
+            if "trace" in _outputs:
+                _events.append({"name": self.name, "ph": "X", "pid": os.getpid(),
+                                "tid": threading.get_ident(),
+                                "ts": (self.start - _started_ns) / 1000.0, "dur": elapsed / 1000.0})
+        return False
+
+
+def span(name):
+    """Context manager timing the enclosed block under `name` (no-op when disabled)."""
+    if not _enabled:
+        return _NO_SPAN
+    return _Span(name)
+
+
+def timed(name):
+    """Decorator form of `span`."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def enabled():
+    return _enabled
+
+
+def enable(outputs="summary"):
+    """Start collecting; `outputs` is a comma-separated subset of PROFILE_OUTPUTS."""
+    global _enabled, _profiler, _started_ns
+    requested = {o.strip() for o in outputs.split(",") if o.strip()}
+    if "1" in requested:
+        requested = (requested - {"1"}) | {"summary"}
+    unknown = requested - set(PROFILE_OUTPUTS)
+    if unknown:
+        raise ValueError(f"Unknown profile output(s) {sorted(unknown)}; choose from {PROFILE_OUTPUTS}")
+    if _enabled:
+        _outputs.update(requested)
+        return
+    _outputs.update(requested)
+    _started_ns = time.perf_counter_ns()
+    _enabled = True
+    if "pstats" in _outputs:
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    atexit.register(report)
+
+
+def configure(profile=None):
+    """Enable from a `--profile` value, falling back to the WEK_PROFILE environment variable."""
+    value = profile or os.environ.get("WEK_PROFILE")
+    if value and value != "0":
+        enable(value)
+
+
+def add_profile_argument(parser):
+    parser.add_argument("--profile", nargs="?", const="summary", default=None,
+                        help="time the hot paths: comma-separated summary,trace,pstats (default summary); "
+                             "same as the WEK_PROFILE environment variable")
+
+
+def breakdown():
+    """[(name, count, total_sec, self_sec)] sorted by self time, heaviest first."""
+    with _lock:
+        rows = [(name, c, total / 1e9, own / 1e9) for name, (c, total, own) in _stats.items()]
+    return sorted(rows, key=lambda r: -r[3])
+
+
+def _output_path(suffix):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    script = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0] or "python"
+    return os.path.join(PROFILE_DIR, f"{script}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}{suffix}")
+
+
+def report(out=sys.stderr):
+    """Print the breakdown and write the requested trace/pstats files."""
+    global _enabled, _profiler
+    if not _enabled:
+        return
+    _enabled = False
+    if _profiler is not None:
+        _profiler.disable()
+        path = _output_path(".pstats")
+        _profiler.dump_stats(path)
+        print(f"cProfile stats written to {path}", file=out)
+        _profiler = None
+
+    wall = (time.perf_counter_ns() - _started_ns) / 1e9
+    if "summary" in _outputs:
+        rows = breakdown()
+        print(f"\nProfile ({wall:.3f}s wall since start)", file=out)
+        print(f"{'span':<32}{'calls':>9}{'total s':>11}{'self s':>11}{'self %':>8}", file=out)
+        for name, count, total, own in rows:
+            share = 100.0 * own / wall if wall > 0 else 0.0
+            print(f"{name:<32}{count:>9}{total:>11.3f}{own:>11.3f}{share:>7.1f}%", file=out)
+        covered = sum(r[3] for r in rows)
+        print(f"{'(outside spans)':<32}{'':>9}{'':>11}{max(wall - covered, 0.0):>11.3f}", file=out)
+
+    if "trace" in _outputs:
+        path = _output_path(".trace.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": _events, "displayTimeUnit": "ms"}, f)
+        print(f"Chrome trace written to {path}", file=out)
+
+
+# Scripts that never call configure() still honour the environment variable
+configure()
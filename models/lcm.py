@@ -1,56 +1,384 @@
 import os
-import joblib
+import json
+import hashlib
+
+import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_absolute_error
+
+from .plan_features import plan_feature_matrix, PLAN_FEATURE_NAMES
+from .catalog import load_catalog, plan_catalog_matrix, sql_catalog_matrix, CATALOG_FEATURE_NAMES, SQL_CATALOG_FEATURE_NAMES
+from .sql_features import sql_feature_matrix, SQL_FEATURE_NAMES
+from .compact import export_model, load_compact
+from . import instrument
+from .prediction_cache import PredictionCache, cached_predict, CACHE_DIR
+
+# sklearn and joblib are imported inside the training/pickle functions only: loading the
+# compact artifact for inference must not pay for importing them
 
 
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "lcm.pkl")
+COMPACT_PATH = os.path.join(os.path.dirname(__file__), "lcm.cmf")
+# Training sidecar: data hash and hyperparameters of the saved model, and the hashes of
+# the rows it was trained/validated on (see train_and_save)
+META_PATH = os.path.join(os.path.dirname(__file__), "lcm.meta.json")
+ROWS_PATH = os.path.join(os.path.dirname(__file__), "lcm.rows.npz")
+# Featurized training rows, keyed by their feature inputs (see cached_feature_matrix);
+# once it would grow past FEATURE_CACHE_MAX_ROWS it only keeps the current dataset's rows
+FEATURE_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  "results", "lcm_feature_cache.npz")
+FEATURE_CACHE_MAX_ROWS = 100_000
+# Incremental updates add trees; past this multiple of n_estimators the forest is rebuilt
+MAX_TREES_FACTOR = 2
+
+
+BASE_FEATURES = ["join_count", "estimated_cost", "estimated_rows"]
+# Columns (besides plan_json) that training and evaluation read from the metrics table
+TRAINING_COLUMNS = (["query_name", "category", "query_text"] + BASE_FEATURES
+                    + ["actual_runtime_ms", "runtime_median_ms", "censored"])
+# Row inputs of the feature matrix
+FEATURE_INPUTS = BASE_FEATURES + ["plan_json", "query_text"]
+# What identifies a labeled sample for the training sidecar: features, plan, SQL and labels (not the name)
+ROW_COLUMNS = FEATURE_INPUTS + ["actual_runtime_ms", "runtime_median_ms", "censored"]
+# Full layout of a candidate's feature row; each model uses the subset it was fitted on
+CANDIDATE_FEATURES = (BASE_FEATURES + PLAN_FEATURE_NAMES + CATALOG_FEATURE_NAMES + SQL_FEATURE_NAMES
+                      + SQL_CATALOG_FEATURE_NAMES)
+
 
+def load_training_data(data):
+    # Training entry points accept either a DataFrame or the path of a metrics CSV
+    if isinstance(data, pd.DataFrame):
+        return data
+    return pd.read_csv(data)
 
+
+@instrument.timed("featurize")
 def get_feature_matrix(df):
-    # Basic features we extract from the collected CSV
-    # Keep it simple and robust: join_count, estimated_cost, estimated_rows
-    features = df[["join_count", "estimated_cost", "estimated_rows"]].copy()
+    # Basic features we extract from the collected CSV: join_count, estimated_cost, estimated_rows
+    features = df[BASE_FEATURES].copy()
     # Fill missing values defensively
     features = features.fillna(0)
+    # Plan-tree features (per node type counts/costs/rows, depth, workers, operator mix)
+    # whenever the full plan is available
+    if "plan_json" in df.columns:
+        plan_feats = pd.DataFrame(plan_feature_matrix(df["plan_json"]),
+                                  columns=PLAN_FEATURE_NAMES, index=df.index)
+        features = pd.concat([features, plan_feats], axis=1)
+        # Cardinality features from the catalog snapshot, when one has been taken
+        if load_catalog() is not None:
+            cat_feats = pd.DataFrame(plan_catalog_matrix(df["plan_json"]),
+                                     columns=CATALOG_FEATURE_NAMES, index=df.index)
+            features = pd.concat([features, cat_feats], axis=1)
+    # Query-text features (relations, predicates, aggregates, join-graph shape) when the rows
+    # carry their SQL; rows without it get zeros
+    if "query_text" in df.columns:
+        sql_feats = pd.DataFrame(sql_feature_matrix(df["query_text"]),
+                                 columns=SQL_FEATURE_NAMES, index=df.index)
+        features = pd.concat([features, sql_feats], axis=1)
+        # The query's tables, join keys and filtered columns against the catalog snapshot
+        if load_catalog() is not None:
+            sql_cat_feats = pd.DataFrame(sql_catalog_matrix(df["query_text"]),
+                                         columns=SQL_CATALOG_FEATURE_NAMES, index=df.index)
+            features = pd.concat([features, sql_cat_feats], axis=1)
     return features
 
 
-def train_and_save(csv_path, overwrite=False, n_estimators=100, random_state=42):
-    df = pd.read_csv(csv_path)
-    X = get_feature_matrix(df)
-    y = df["actual_runtime_ms"].fillna(0)
+def align_features(model, X):
+    # Models trained before plan features existed only know the basic columns: give each
+    # model exactly the columns it was fitted on (missing ones as 0)
+    names = getattr(model, "feature_names_in_", None)
+    if names is None or list(X.columns) == list(names):
+        return X
+    return X.reindex(columns=list(names), fill_value=0)
+
+
+def get_target(df):
+    # Training label: the median of the repeated timed runs when the collector recorded them,
+    # otherwise the single-sample actual_runtime_ms of older collections
+    if "runtime_median_ms" in df.columns:
+        return df["runtime_median_ms"].fillna(df["actual_runtime_ms"]).fillna(0)
+    return df["actual_runtime_ms"].fillna(0)
+
+
+def get_censored(df):
+    # Rows cut short by the collector's statement_timeout: their label is only a lower bound
+    if "censored" in df.columns:
+        return df["censored"].fillna(False).astype(bool).to_numpy()
+    return np.zeros(len(df), dtype=bool)
+
+
+def censored_abs_error(preds, y, censored):
+    # Absolute error that respects censoring: predicting anything >= the budget of a
+    # censored row is correct, only under-predictions count
+    preds = np.asarray(preds, dtype=float)
+    y = np.asarray(y, dtype=float)
+    err = np.abs(preds - y)
+    return np.where(censored, np.maximum(0.0, y - preds), err)
+
+
+def fit_censored(model, X, y, censored, n_iter=3):
+    """Fit `model` on labels where some rows are right-censored (true value >= y).
+
+    Simple iterative imputation: fit, raise every censored label to
+    max(budget, prediction), refit. Without censored rows this is a plain fit.
+    """
+    y = np.asarray(y, dtype=float).copy()
+    censored = np.asarray(censored, dtype=bool)
+    model.fit(X, y)
+    if not censored.any():
+        return model
+    budget = y[censored].copy()
+    for _ in range(n_iter):
+        y[censored] = np.maximum(budget, model.predict(X[censored]))
+        model.fit(X, y)
+    return model
+
+
+def row_hashes(df, columns=ROW_COLUMNS):
+    """One uint64 per row over `columns` (those present): identifies a labeled sample."""
+    cols = [c for c in columns if c in df.columns]
+    return pd.util.hash_pandas_object(df[cols], index=False).to_numpy(dtype=np.uint64)
+
 
-    # Use a hold-out set internally for quick validation
-    X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=random_state)
+def data_hash(hashes):
+    # Order-independent digest of a training set
+    return hashlib.sha1(np.sort(hashes).tobytes()).hexdigest()
 
-    model = RandomForestRegressor(n_estimators=n_estimators, random_state=random_state)
-    model.fit(X_train, y_train)
 
-    preds = model.predict(X_val)
-    mae = mean_absolute_error(y_val, preds)
-    print(f"LCM trained — validation MAE: {mae:.3f} ms")
+def feature_columns(df):
+    # Columns get_feature_matrix produces for `df`
+    columns = list(BASE_FEATURES)
+    if "plan_json" in df.columns:
+        columns += PLAN_FEATURE_NAMES + (CATALOG_FEATURE_NAMES if load_catalog() is not None else [])
+    if "query_text" in df.columns:
+        columns += SQL_FEATURE_NAMES + (SQL_CATALOG_FEATURE_NAMES if load_catalog() is not None else [])
+    return columns
+
+
+def _read_feature_cache(path, columns, version):
+    try:
+        with np.load(path, allow_pickle=False) as f:
+            if list(f["columns"]) != columns or str(f["catalog_version"]) != str(version):
+                return None
+            return f["keys"], f["matrix"]
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+@instrument.timed("featurize.cached")
+def cached_feature_matrix(df, path=FEATURE_CACHE_PATH, max_rows=FEATURE_CACHE_MAX_ROWS):
+    """`get_feature_matrix(df)` backed by an on-disk cache of featurized rows.
+
+    Rows are keyed by the hash of their feature inputs (FEATURE_INPUTS), so
+    only rows not featurized by an earlier run are parsed; the cache is dropped
+    when the feature layout or the catalog snapshot changes, and holds at most
+    `max_rows` rows.
+    """
+    columns = feature_columns(df)
+    catalog = load_catalog()
+    version = catalog.version if catalog is not None else None
+    keys = row_hashes(df, FEATURE_INPUTS)
+
+    cached = _read_feature_cache(path, columns, version)
+    out = np.empty((len(df), len(columns)), dtype=np.float64)
+    missing = np.ones(len(df), dtype=bool)
+    if cached is not None and len(cached[0]):
+        cache_keys, cache_matrix = cached
+        pos = np.minimum(np.searchsorted(cache_keys, keys), len(cache_keys) - 1)
+        missing = cache_keys[pos] != keys
+        out[~missing] = cache_matrix[pos[~missing]]
+    if missing.any():
+        out[missing] = get_feature_matrix(df[missing]).to_numpy(dtype=np.float64)
+        # Merge the new rows into the (sorted, unique) cache; past the bound, rows of other
+        # datasets are dropped and only this one's are kept
+        if cached is not None and len(cached[0]) + int(missing.sum()) <= max_rows:
+            all_keys = np.concatenate([cached[0], keys[missing]])
+            all_rows = np.vstack([cached[1], out[missing]])
+        else:
+            all_keys, all_rows = keys, out
+        all_keys, first = np.unique(all_keys, return_index=True)
+        all_keys, first = all_keys[:max_rows], first[:max_rows]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, keys=all_keys, matrix=all_rows[first], columns=np.array(columns),
+                 catalog_version=np.array(str(version)))
+        os.replace(tmp, path)
+    return pd.DataFrame(out, columns=columns, index=df.index)
+
+
+def _read_meta():
+    try:
+        with open(META_PATH, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with np.load(ROWS_PATH, allow_pickle=False) as f:
+            meta["train_rows"], meta["val_rows"] = f["train"], f["val"]
+        return meta
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_meta(model, params, hashes, train_rows, val_rows):
+    with open(META_PATH, "w", encoding="utf-8") as f:
+        json.dump({"params": params, "data_hash": data_hash(hashes), "n_rows": int(len(hashes)),
+                   "n_trees": len(model.estimators_), "feature_names": list(model.feature_names_in_)},
+                  f, indent=2)
+    np.savez(ROWS_PATH, train=train_rows, val=val_rows)
+
+
+def _incremental_fit(model, df, hashes, meta, n_estimators, random_state, n_jobs):
+    """Add trees fitted on the rows `meta` has not seen, plus an equal-sized replay
+    sample of earlier training rows. Returns (train_rows, val_rows) or None when a
+    full retrain is needed instead."""
+    from sklearn.model_selection import train_test_split
+
+    seen = np.concatenate([meta["train_rows"], meta["val_rows"]])
+    new = ~np.isin(hashes, seen)
+    n_new = int(new.sum())
+    # Only append-only growth is incremental: changed or deleted rows need a rebuild
+    if n_new == 0 or not np.isin(seen, hashes).all():
+        return None
+    n_add = max(1, -(-n_estimators * n_new // len(seen)))
+    if len(model.estimators_) + n_add > MAX_TREES_FACTOR * n_estimators:
+        return None
+
+    df_new = df[new]
+    if n_new >= 5:
+        df_train, df_val = train_test_split(df_new, test_size=0.2, random_state=random_state)
+    else:
+        df_train, df_val = df_new, df_new.iloc[:0]
+    rng = np.random.default_rng(random_state + len(model.estimators_))
+    old_train = np.flatnonzero(np.isin(hashes, meta["train_rows"]))
+    replay = df.iloc[rng.choice(old_train, min(len(df_train), len(old_train)), replace=False)]
+    fit_df = pd.concat([df_train, replay])
+
+    names = list(model.feature_names_in_)
+    X = cached_feature_matrix(fit_df).reindex(columns=names, fill_value=0)
+    y = get_target(fit_df).to_numpy(dtype=float)
+    # Censored labels are raised to the current forest's prediction, as fit_censored would
+    censored = get_censored(fit_df)
+    if censored.any():
+        y[censored] = np.maximum(y[censored], model.predict(X[censored]))
+
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + n_add, n_jobs=n_jobs)
+    with instrument.span("model.fit"):
+        model.fit(X, y)
+    model.set_params(warm_start=False)
+
+    if len(df_val):
+        X_val = cached_feature_matrix(df_val).reindex(columns=names, fill_value=0)
+        mae = float(np.mean(censored_abs_error(model.predict(X_val), get_target(df_val), get_censored(df_val))))
+        print(f"LCM updated with {n_new} new rows (+{n_add} trees, {len(model.estimators_)} total) "
+              f"— validation MAE on new rows: {mae:.3f} ms")
+    else:
+        print(f"LCM updated with {n_new} new rows (+{n_add} trees, {len(model.estimators_)} total)")
+    train_rows = np.concatenate([meta["train_rows"], row_hashes(df_train)])
+    val_rows = np.concatenate([meta["val_rows"], row_hashes(df_val)])
+    return train_rows, val_rows
+
+
+def train_and_save(data, overwrite=False, n_estimators=100, random_state=42, n_jobs=-1,
+                   incremental=True, force=False):
+    """Train the LCM on `data` (DataFrame or CSV path) and save it.
+
+    The saved model carries a sidecar (META_PATH, ROWS_PATH) with the hash of
+    its training data and hyperparameters:
+    - same data and hyperparameters: the saved model is returned, no training
+    - the old rows plus new ones (e.g. after the nightly collection): with
+      `incremental`, trees fitted on the new rows are added (warm_start), so the
+      cost follows the new data; the forest is rebuilt once it would grow past
+      MAX_TREES_FACTOR * n_estimators trees
+    - anything else, or `force=True`: full retrain
+    Trees are fitted on `n_jobs` cores (-1: all).
+    """
+    import joblib
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.model_selection import train_test_split
+
+    df = load_training_data(data)
+    params = {"n_estimators": n_estimators, "random_state": random_state}
+    hashes = row_hashes(df)
+    saving = overwrite or not os.path.exists(MODEL_PATH)
+    meta = None if force or not os.path.exists(MODEL_PATH) else _read_meta()
+    if meta is not None and meta["params"] != params:
+        meta = None
+
+    if meta is not None and meta["data_hash"] == data_hash(hashes):
+        print("LCM is up to date with this data and hyperparameters — skipping training")
+        return joblib.load(MODEL_PATH)
+
+    model, rows = None, None
+    if meta is not None and incremental and saving:
+        model = joblib.load(MODEL_PATH)
+        if list(getattr(model, "feature_names_in_", [])) == feature_columns(df):
+            rows = _incremental_fit(model, df, hashes, meta, n_estimators, random_state, n_jobs)
+
+    if rows is None:
+        X = cached_feature_matrix(df)
+        y = get_target(df)
+        censored = get_censored(df)
+
+        # Use a hold-out set internally for quick validation
+        X_train, X_val, y_train, y_val, c_train, c_val, h_train, h_val = train_test_split(
+            X, y, censored, hashes, test_size=0.2, random_state=random_state)
+
+        model = RandomForestRegressor(n_estimators=n_estimators, random_state=random_state, n_jobs=n_jobs)
+        with instrument.span("model.fit"):
+            fit_censored(model, X_train, y_train, c_train)
+
+        preds = model.predict(X_val)
+        mae = float(np.mean(censored_abs_error(preds, y_val, c_val)))
+        print(f"LCM trained — validation MAE: {mae:.3f} ms")
+        rows = (h_train, h_val)
 
     # Ensure models directory exists
     os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
-    if overwrite or not os.path.exists(MODEL_PATH):
-        joblib.dump(model, MODEL_PATH)
-        print(f"Saved LCM to {MODEL_PATH}")
+    if saving:
+        with instrument.span("write.model"):
+            joblib.dump(model, MODEL_PATH)
+            export_model(model, COMPACT_PATH)
+            _write_meta(model, params, hashes, *rows)
+        print(f"Saved LCM to {MODEL_PATH} (compact: {COMPACT_PATH})")
 
     return model
 
 
-def load_model():
+def export_compact():
+    # Re-export the pickled LCM into the compact format (e.g. after replacing lcm.pkl by hand)
+    import joblib
+    return export_model(joblib.load(MODEL_PATH), COMPACT_PATH)
+
+
+@instrument.timed("model.load")
+def load_model(compact=True):
+    # The compact artifact predicts exactly like the pickled forest and loads in milliseconds;
+    # pass compact=False to get the sklearn object itself
+    if compact and os.path.exists(COMPACT_PATH):
+        return load_compact(COMPACT_PATH)
     if os.path.exists(MODEL_PATH):
+        import joblib
         return joblib.load(MODEL_PATH)
     raise FileNotFoundError(f"LCM model not found at {MODEL_PATH}. Run training first.")
 
 
 def predict(model, df):
-    X = get_feature_matrix(df)
-    return model.predict(X)
+    X = align_features(model, get_feature_matrix(df))
+    with instrument.span("model.predict"):
+        return model.predict(X)
+
+
+_prediction_cache = None
+
+
+def prediction_cache():
+    """Process-wide prediction cache of the saved LCM, persisted under results/prediction_cache/."""
+    global _prediction_cache
+    if _prediction_cache is None:
+        _prediction_cache = PredictionCache([COMPACT_PATH, MODEL_PATH], os.path.join(CACHE_DIR, "lcm.pkl"))
+    return _prediction_cache
+
+
+def _summary(candidate):
+    # Candidate without its (potentially multi-KB) plan tree, for one-line CSV summaries
+    return {k: v for k, v in candidate.items() if k != 'plan_json'}
 
 
 class PlanScorer:
@@ -58,12 +386,18 @@ class PlanScorer:
 
     The class expects a trained model available via `load_model()`.
     It converts a candidate plan dict into the feature vector expected by
-    the LCM (join_count, estimated_cost, estimated_rows) and returns
-    the model's runtime prediction (ms).
+    the LCM (join_count, estimated_cost, estimated_rows, plus the plan-tree
+    features when the candidate carries a `plan_json` and the SQL features of
+    its query when `queries` are passed) and returns the model's runtime
+    prediction (ms).
+
+    With a `cache` (see `prediction_cache()`), candidates whose plan fingerprint
+    (and query template) was scored before are not featurized or predicted again.
     """
 
-    def __init__(self, model=None):
+    def __init__(self, model=None, cache=None):
         self._model = model
+        self.cache = cache
 
     def ensure_model(self):
         if self._model is None:
@@ -72,49 +406,88 @@ class PlanScorer:
 
     def _features_from_plan(self, plan: dict):
         # plan is expected to contain keys like join_count, estimated_cost, estimated_rows
+        # and optionally the plan_json the candidate was built from
         return {
             'join_count': float(plan.get('join_count', 0)),
             'estimated_cost': float(plan.get('estimated_cost', 0)),
-            'estimated_rows': float(plan.get('estimated_rows', 0))
+            'estimated_rows': float(plan.get('estimated_rows', 0)),
+            'plan_json': plan.get('plan_json')
         }
 
-    def score_candidate(self, candidate: dict):
+    def _candidate_array(self, candidates: list, queries=None):
+        # One feature array for a whole batch of candidates, laid out as CANDIDATE_FEATURES;
+        # `queries` holds the SQL of each candidate's query (None where unknown)
+        base = np.array([[float(c.get(k, 0) or 0) for k in BASE_FEATURES] for c in candidates],
+                        dtype=np.float64).reshape(len(candidates), len(BASE_FEATURES))
+        plans = [c.get('plan_json') for c in candidates]
+        queries = queries if queries is not None else [None] * len(candidates)
+        return np.hstack([base, plan_feature_matrix(plans), plan_catalog_matrix(plans),
+                          sql_feature_matrix(queries), sql_catalog_matrix(queries)])
+
+    def _candidate_matrix(self, candidates: list, queries=None):
+        return pd.DataFrame(self._candidate_array(candidates, queries), columns=CANDIDATE_FEATURES)
+
+    def score_batch(self, candidates: list, queries=None):
+        """Predict runtimes (ms) for a list of candidates with a single `predict` call;
+        `queries` optionally gives the SQL of every candidate's query."""
+        if not candidates:
+            return np.empty(0, dtype=np.float64)
+        if self.cache is None:
+            return self._predict(candidates, queries)
+        # Fingerprints include the query template, so equal plans of different queries do not mix
+        items = candidates if queries is None else [dict(c, query_text=q) for c, q in zip(candidates, queries)]
+        return cached_predict(self.cache, items, lambda idx: self._predict(
+            [candidates[i] for i in idx], [queries[i] for i in idx] if queries is not None else None))
+
+    def _predict(self, candidates: list, queries=None):
         m = self.ensure_model()
-        feats = self._features_from_plan(candidate)
-        import pandas as _pd
-        X = _pd.DataFrame([feats])
-        # Use existing feature pipeline
-        Xf = get_feature_matrix(X)
-        pred = m.predict(Xf)[0]
-        return float(pred)
+        with instrument.span("featurize.candidates"):
+            X = align_features(m, self._candidate_matrix(candidates, queries))
+        with instrument.span("model.predict"):
+            return np.asarray(m.predict(X), dtype=np.float64)
+
+    def score_candidate(self, candidate: dict):
+        return float(self.score_batch([candidate])[0])
+
+    def choose_best_batch(self, groups: list, queries=None):
+        """Choose the cheapest candidate of every group (one group per query, whose SQL
+        `queries` optionally gives).
+
+        All candidates of all groups are scored in one `predict` call and the
+        per-group argmin is computed with vectorized ops. Returns a list of
+        (best_candidate, best_pred) tuples; empty groups give (None, None).
+        """
+        flat = [c for g in groups for c in g]
+        if not flat:
+            return [(None, None) for _ in groups]
+        flat_queries = [q for g, q in zip(groups, queries) for _ in g] if queries is not None else None
+        preds = self.score_batch(flat, flat_queries)
+        gid = np.repeat(np.arange(len(groups)), [len(g) for g in groups])
+
+        # Sort by (group, prediction): the first entry of each group is its argmin
+        valid = ~np.isnan(preds)
+        order = np.flatnonzero(valid)[np.lexsort((preds[valid], gid[valid]))]
+        sorted_gid = gid[order]
+        firsts = order[np.r_[True, sorted_gid[1:] != sorted_gid[:-1]]] if len(order) else order
+
+        results = [(None, None)] * len(groups)
+        for i in firsts:
+            results[gid[i]] = (flat[i], float(preds[i]))
+        return results
 
     def choose_best(self, candidates: list):
-        best = None
-        best_pred = None
-        for c in candidates:
-            try:
-                p = self.score_candidate(c)
-            except Exception:
-                p = None
-            if p is None:
-                continue
-            if best_pred is None or p < best_pred:
-                best_pred = p
-                best = c
-        return best, best_pred
+        return self.choose_best_batch([candidates])[0]
 
-    def pick_and_serialize(self, query_name: str, candidates: list, out_csv: str, chosen_dir: str = None):
-        """Choose the best candidate, append a short CSV row and optionally
-        write the chosen plan JSON into `chosen_dir/<query_name>.json`.
-        Returns a dict with chosen_pred_ms and chosen_plan.
+    def serialize_choice(self, query_name: str, best, best_pred, out_csv: str, chosen_dir: str = None):
+        """Append the short CSV row for an already chosen candidate and optionally
+        write its plan JSON into `chosen_dir/<query_name>.json`.
         """
-        best, best_pred = self.choose_best(candidates)
         # Append a simple CSV summary for compatibility
         import csv, json
         row = {
             'query_name': query_name,
             'chosen_pred_ms': best_pred if best_pred is not None else '',
-            'chosen_plan_summary': json.dumps(best) if best is not None else ''
+            'chosen_plan_summary': json.dumps(_summary(best)) if best is not None else ''
         }
         os.makedirs(os.path.dirname(out_csv), exist_ok=True)
         write_header = not os.path.exists(out_csv)
@@ -132,3 +505,11 @@ class PlanScorer:
                 json.dump(best, f, indent=2)
 
         return {'chosen_plan': best, 'chosen_pred_ms': best_pred}
+
+    def pick_and_serialize(self, query_name: str, candidates: list, out_csv: str, chosen_dir: str = None):
+        """Choose the best candidate, append a short CSV row and optionally
+        write the chosen plan JSON into `chosen_dir/<query_name>.json`.
+        Returns a dict with chosen_pred_ms and chosen_plan.
+        """
+        best, best_pred = self.choose_best(candidates)
+        return self.serialize_choice(query_name, best, best_pred, out_csv, chosen_dir)
@@ -0,0 +1,154 @@
+"""Fixed-width feature vectors from PostgreSQL JSON plans.
+
+`featurize_plan` walks an `EXPLAIN (FORMAT JSON)` plan tree once and returns a
+NumPy vector laid out as described by `PLAN_FEATURE_NAMES`:
+
+- per node type: node count, summed `Total Cost` and summed `Plan Rows`
+- tree shape: node count, max depth, planned parallel workers, parallel-aware nodes
+- operator mix: share of seq/index scans among scans and of hash/nested-loop/merge
+  joins among joins
+
+Only planner estimates are used, never `Actual ...` values, so the same vector can
+be computed for candidate plans that were never executed. Vectors of JSON plan
+text are cached (keyed by the text itself), so re-featurizing a corpus is cheap.
+"""
+import json
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+from . import instrument
+
+
+NODE_TYPES = [
+    "Seq Scan", "Index Scan", "Index Only Scan", "Bitmap Heap Scan", "Bitmap Index Scan",
+    "Nested Loop", "Hash Join", "Merge Join", "Hash", "Sort", "Incremental Sort",
+    "Aggregate", "Gather", "Gather Merge", "Materialize", "Memoize", "Limit", "Unique",
+    "Append", "Subquery Scan", "CTE Scan", "Result", "WindowAgg",
+]
+OTHER = "Other"
+
+SCAN_TYPES = {"Seq Scan", "Index Scan", "Index Only Scan", "Bitmap Heap Scan", "Subquery Scan", "CTE Scan"}
+INDEX_SCAN_TYPES = {"Index Scan", "Index Only Scan", "Bitmap Heap Scan"}
+JOIN_TYPES = {"Nested Loop", "Hash Join", "Merge Join"}
+
+_TYPE_INDEX = {t: i for i, t in enumerate(NODE_TYPES)}
+_TYPE_INDEX[OTHER] = len(NODE_TYPES)
+_N_TYPES = len(NODE_TYPES) + 1
+
+
+def _slug(node_type):
+    return node_type.lower().replace(" ", "_")
+
+
+PLAN_FEATURE_NAMES = (
+    [f"plan_{_slug(t)}_count" for t in NODE_TYPES + [OTHER]]
+    + [f"plan_{_slug(t)}_cost" for t in NODE_TYPES + [OTHER]]
+    + [f"plan_{_slug(t)}_rows" for t in NODE_TYPES + [OTHER]]
+    + [
+        "plan_node_count", "plan_max_depth", "plan_workers_planned", "plan_parallel_nodes",
+        "plan_seq_scan_frac", "plan_index_scan_frac",
+        "plan_hash_join_frac", "plan_nested_loop_frac", "plan_merge_join_frac",
+    ]
+)
+N_PLAN_FEATURES = len(PLAN_FEATURE_NAMES)
+
+_COST = _N_TYPES
+_ROWS = 2 * _N_TYPES
+_TAIL = 3 * _N_TYPES
+
+
+def _root(plan):
+    # Accept the raw EXPLAIN output ([{"Plan": ...}]), its first element, or a bare node
+    if isinstance(plan, list):
+        plan = plan[0] if plan else {}
+    if isinstance(plan, dict) and "Plan" in plan:
+        return plan["Plan"]
+    return plan or {}
+
+
+def _walk(root):
+    vec = np.zeros(N_PLAN_FEATURES, dtype=np.float64)
+    n_nodes = max_depth = workers = parallel = 0
+    n_scan = n_index = n_join = 0
+
+    stack = [(root, 1)]
+    while stack:
+        node, depth = stack.pop()
+        node_type = node.get("Node Type", OTHER)
+        i = _TYPE_INDEX.get(node_type, _TYPE_INDEX[OTHER])
+        vec[i] += 1
+        vec[_COST + i] += node.get("Total Cost", 0.0) or 0.0
+        vec[_ROWS + i] += node.get("Plan Rows", 0.0) or 0.0
+
+        n_nodes += 1
+        if depth > max_depth:
+            max_depth = depth
+        workers += node.get("Workers Planned", 0) or 0
+        if node.get("Parallel Aware"):
+            parallel += 1
+        if node_type in SCAN_TYPES:
+            n_scan += 1
+            if node_type in INDEX_SCAN_TYPES:
+                n_index += 1
+        elif node_type in JOIN_TYPES:
+            n_join += 1
+
+        for child in node.get("Plans", ()):
+            stack.append((child, depth + 1))
+
+    seq = vec[_TYPE_INDEX["Seq Scan"]]
+    vec[_TAIL:] = [
+        n_nodes, max_depth, workers, parallel,
+        seq / n_scan if n_scan else 0.0,
+        n_index / n_scan if n_scan else 0.0,
+        vec[_TYPE_INDEX["Hash Join"]] / n_join if n_join else 0.0,
+        vec[_TYPE_INDEX["Nested Loop"]] / n_join if n_join else 0.0,
+        vec[_TYPE_INDEX["Merge Join"]] / n_join if n_join else 0.0,
+    ]
+    return vec
+
+
+@lru_cache(maxsize=65536)
+def _featurize_text(plan_text):
+    vec = _walk(_root(json.loads(plan_text)))
+    vec.setflags(write=False)
+    return vec
+
+
+def featurize_plan(plan):
+    """Feature vector of one plan given as JSON text, a parsed dict/list, or None."""
+    if plan is None or (isinstance(plan, float) and np.isnan(plan)) or plan == "":
+        return np.zeros(N_PLAN_FEATURES, dtype=np.float64)
+    if isinstance(plan, str):
+        return _featurize_text(plan)
+    return _walk(_root(plan))
+
+
+@instrument.timed("featurize.plan_tree")
+def plan_feature_matrix(plans):
+    """Stack the feature vectors of an iterable of plans into an (n, N_PLAN_FEATURES) array."""
+    plans = list(plans)
+    out = np.empty((len(plans), N_PLAN_FEATURES), dtype=np.float64)
+    for i, plan in enumerate(plans):
+        out[i] = featurize_plan(plan)
+    return out
+
+
+def cache_info():
+    return _featurize_text.cache_info()
+
+
+def _shape(node):
+    children = ",".join(_shape(c) for c in node.get("Plans", ()))
+    label = "|".join(str(node.get(k, "")) for k in ("Node Type", "Join Type", "Strategy", "Relation Name", "Alias", "Index Name"))
+    return f"{label}({children})"
+
+
+def plan_shape_hash(plan):
+    """Hash of a plan's tree shape (operators, join types, relations, indexes), ignoring
+    costs and row counts: two plans with the same hash execute the same way."""
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return hashlib.sha1(_shape(_root(plan)).encode("utf-8")).hexdigest()
@@ -0,0 +1,244 @@
+"""Prediction cache keyed by a normalized plan fingerprint.
+
+Many candidates and collected rows share a plan shape and differ only slightly
+in their estimates. `plan_fingerprint` reduces a candidate (or a query_metrics
+row) to what the featurizers look at, with every cost and row count bucketed
+on a log scale (RESOLUTION buckets per doubling, ~4% wide):
+
+- join_count, bucketed estimated_cost / estimated_rows, and the query template
+  when the item carries its `query_text`
+- per plan node: node type, join type, strategy, relation, index, parallel
+  awareness, planned workers, bucketed Total Cost / Plan Rows, the join and
+  index conditions, and the children in order
+
+`PredictionCache` maps fingerprints to predictions with LRU eviction once
+`max_entries` is reached and counts hits, misses and evictions. It is bound to
+the hash of the model artifact files it serves (and the catalog snapshot
+version): when any of them changes, the entries are dropped. With a `path` it
+is loaded from disk on creation and written back at exit, so a restarted
+scorer starts warm. `feature_key` is the exact alternative to the fingerprint
+for callers that must not share predictions between nearby rows.
+"""
+import os
+import json
+import math
+import atexit
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+from .plan_features import _root
+from .sql_features import template_fingerprint
+from .catalog import load_catalog, SNAPSHOT_PATH
+
+
+RESOLUTION = 16
+MAX_ENTRIES = 200_000
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "results", "prediction_cache")
+
+_NODE_KEYS = ("Node Type", "Join Type", "Strategy", "Relation Name", "Index Name", "Parallel Aware",
+              "Workers Planned", "Hash Cond", "Merge Cond", "Join Filter", "Index Cond")
+
+
+def _bucket(value):
+    try:
+        v = float(value or 0.0)
+    except (TypeError, ValueError):
+        return "x"
+    if v != v:
+        return "nan"
+    b = int(round(math.log2(1.0 + abs(v)) * RESOLUTION))
+    return str(-b if v < 0 else b)
+
+
+def _node_signature(node):
+    label = "|".join(str(node.get(k, "")) for k in _NODE_KEYS)
+    children = ",".join(_node_signature(c) for c in node.get("Plans", ()))
+    return f"{label}|{_bucket(node.get('Total Cost'))}|{_bucket(node.get('Plan Rows'))}({children})"
+
+
+@lru_cache(maxsize=65536)
+def _plan_signature_text(plan_text):
+    return _node_signature(_root(json.loads(plan_text)))
+
+
+def _plan_signature(plan):
+    if plan is None or plan == "" or (isinstance(plan, float) and plan != plan):
+        return ""
+    if isinstance(plan, str):
+        return _plan_signature_text(plan)
+    return _node_signature(_root(plan))
+
+
+def plan_fingerprint(item):
+    """Fingerprint of a candidate dict or query_metrics row (needs the BASE_FEATURES keys,
+    optionally `plan_json` and `query_text`)."""
+    try:
+        joins = int(item.get("join_count") or 0)
+    except (TypeError, ValueError):
+        joins = 0
+    query = item.get("query_text")
+    template = template_fingerprint(query) if isinstance(query, str) and query.strip() else ""
+    key = (f"{joins}|{_bucket(item.get('estimated_cost'))}|{_bucket(item.get('estimated_rows'))}|"
+           f"{_plan_signature(item.get('plan_json'))}|{template}")
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def feature_key(row):
+    """Exact key of one feature row (a float64 array): equal keys mean equal model inputs."""
+    return hashlib.sha1(np.ascontiguousarray(row, dtype=np.float64).tobytes()).hexdigest()
+
+
+_hashes = {}
+
+
+def artifact_hash(path):
+    """sha1 of a model file's bytes (memoized by size and mtime); '' when it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+    stamp = (st.st_size, st.st_mtime_ns)
+    cached = _hashes.get(path)
+    if cached is None or cached[0] != stamp:
+        with open(path, "rb") as f:
+            cached = (stamp, hashlib.sha1(f.read()).hexdigest())
+        _hashes[path] = cached
+    return cached[1]
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class PredictionCache:
+    """LRU map fingerprint -> prediction, bound to the model artifacts in `artifacts`."""
+
+    def __init__(self, artifacts, path=None, max_entries=MAX_ENTRIES):
+        self.artifacts = list(artifacts)
+        self.path = path
+        self.max_entries = max_entries
+        self.version = None
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._dirty = False
+        if path:
+            self._load()
+            atexit.register(self.save)
+        self.check()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _current_version(self):
+        catalog = load_catalog()
+        parts = [artifact_hash(p) for p in self.artifacts] + [str(catalog.version) if catalog else ""]
+        return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+    def check(self):
+        """Drop every entry when a model artifact or the catalog snapshot changed.
+        Costs one stat per file unless something did change."""
+        stamp = tuple(_mtime(p) for p in self.artifacts + [SNAPSHOT_PATH])
+        if stamp == self._stamp:
+            return
+        version = self._current_version()
+        with self._lock:
+            self._stamp = stamp
+            if version != self.version:
+                if self._entries:
+                    self.invalidations += 1
+                    self._dirty = True
+                self._entries.clear()
+                self.version = version
+
+    def lookup(self, keys):
+        """(values, found): predictions for `keys` (NaN where missing) and the hit mask."""
+        values = np.full(len(keys), np.nan, dtype=np.float64)
+        found = np.zeros(len(keys), dtype=bool)
+        with self._lock:
+            entries = self._entries
+            for i, key in enumerate(keys):
+                v = entries.get(key)
+                if v is not None:
+                    entries.move_to_end(key)
+                    values[i] = v
+                    found[i] = True
+            hits = int(found.sum())
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return values, found
+
+    def update(self, keys, values):
+        with self._lock:
+            entries = self._entries
+            for key, value in zip(keys, values):
+                entries[key] = float(value)
+                entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits,
+                "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions, "invalidations": self.invalidations}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        self.check()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with self._lock:
+            with open(tmp, "wb") as f:
+                pickle.dump({"version": self.version, "entries": list(self._entries.items())}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            self._dirty = False
+        os.replace(tmp, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                saved = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return
+        # Entries of another model version are useless: check() compares before keeping them
+        self.version = saved.get("version")
+        self._entries = OrderedDict(saved.get("entries", ())[-self.max_entries:])
+
+
+def cached_predict(cache, items, predict, key=plan_fingerprint):
+    """Predictions for `items` (candidate dicts / row dicts by default): cached ones are
+    looked up and each distinct missing `key(item)` is computed once, by `predict(positions)`
+    which returns the predictions of the items at those positions."""
+    cache.check()
+    keys = [key(it) for it in items]
+    values, found = cache.lookup(keys)
+    if found.all():
+        return values
+    first = {}
+    for i in np.flatnonzero(~found):
+        first.setdefault(keys[i], i)
+    todo = list(first.values())
+    computed = np.asarray(predict(todo), dtype=np.float64)
+    cache.update([keys[i] for i in todo], computed)
+    by_key = dict(zip((keys[i] for i in todo), computed))
+    for i in np.flatnonzero(~found):
+        values[i] = by_key[keys[i]]
+    return values
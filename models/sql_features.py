@@ -0,0 +1,496 @@
+"""Structural features of SQL query text.
+
+`sql_features` tokenizes a query (strings, quoted identifiers, comments and
+numbers are recognized, so commas inside `IN (1, 2)` or string literals are
+not mistaken for anything), nests it by parentheses and walks every SELECT
+block, including subqueries and CTEs. It returns:
+
+- `n_relations`: base relations referenced (CTE names excluded), `n_joins`:
+  joins performed (relations of a block minus one, summed over blocks)
+- `join_shape` of the largest block's join graph: single, chain, star, tree,
+  cycle or disconnected (a cross product)
+- `tables` (alias -> table), `join_predicates`, `filters` and
+  `predicates_per_table` (filter conjuncts per table)
+- `n_aggregates`, `group_by_width` (widest GROUP BY) and `n_subqueries`
+
+Parses are cached by query text, so re-featurizing a corpus is cheap.
+`SQL_FEATURE_NAMES` / `sql_feature_vector` give the same information as a
+fixed-width NumPy vector.
+
+`query_template` strips the literals out of a query (`gs.season BETWEEN 2010
+AND 2015` -> `gs.season between ? and ?`); `template_fingerprint` identifies
+the template, so instances that differ only in constants can be grouped, and
+template-level features are computed once per template.
+"""
+import re
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+from . import instrument
+
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+|--[^\n]*|/\*.*?\*/)
+  | (?P<str>(?:[EeBbXxNn])?'(?:[^']|'')*')
+  | (?P<qident>"(?:[^"]|"")*")
+  | (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<param>\$\d+|%s|\?)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<op>::|<>|!=|<=|>=|\|\||[-+*/%<>=~!^&|#@])
+  | (?P<punct>[(),.;\[\]])
+""", re.X | re.S)
+
+AGGREGATES = {"COUNT", "SUM", "AVG", "MIN", "MAX", "STDDEV", "STDDEV_POP", "STDDEV_SAMP", "VARIANCE",
+              "VAR_POP", "VAR_SAMP", "ARRAY_AGG", "STRING_AGG", "BOOL_AND", "BOOL_OR", "EVERY",
+              "JSON_AGG", "JSONB_AGG", "PERCENTILE_CONT", "PERCENTILE_DISC", "MODE"}
+_CLAUSES = {"SELECT", "FROM", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "OFFSET", "WINDOW", "FETCH", "FOR"}
+_SET_OPS = {"UNION", "INTERSECT", "EXCEPT"}
+_JOIN_WORDS = {"JOIN", "INNER", "LEFT", "RIGHT", "FULL", "OUTER", "CROSS", "NATURAL", "LATERAL"}
+_ITEM_END = _JOIN_WORDS | {"ON", "USING"}
+JOIN_SHAPES = ["single", "chain", "star", "tree", "cycle", "disconnected"]
+
+
+def tokenize(text):
+    """List of (kind, value) tokens; whitespace and comments are dropped."""
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        m = _TOKEN_RE.match(text, pos)
+        if m is None:
+            tokens.append(("other", text[pos]))
+            pos += 1
+            continue
+        pos = m.end()
+        if m.lastgroup != "ws":
+            tokens.append((m.lastgroup, m.group()))
+    return tokens
+
+
+class _Group(list):
+    """Tokens between a pair of parentheses."""
+
+
+def _nest(tokens):
+    root = _Group()
+    stack = [root]
+    for tok in tokens:
+        if tok == ("punct", "("):
+            group = _Group()
+            stack[-1].append(group)
+            stack.append(group)
+        elif tok == ("punct", ")"):
+            if len(stack) > 1:
+                stack.pop()
+        else:
+            stack[-1].append(tok)
+    return root
+
+
+def _word(item):
+    # Upper-cased keyword/identifier value, or None for groups and other tokens
+    if isinstance(item, tuple) and item[0] == "ident":
+        return item[1].upper()
+    return None
+
+
+def _name(item):
+    if item[0] == "qident":
+        return item[1][1:-1].replace('""', '"')
+    return item[1].lower()
+
+
+def _is_query(group):
+    return isinstance(group, _Group) and _word(group[0] if group else None) in ("SELECT", "WITH", "VALUES")
+
+
+def _split(items, sep):
+    parts = [[]]
+    for item in items:
+        if sep(item):
+            parts.append([])
+        else:
+            parts[-1].append(item)
+    return [p for p in parts if p]
+
+
+def _conjuncts(items):
+    # Split a condition on top-level AND, keeping "BETWEEN x AND y" together
+    parts = [[]]
+    between = False
+    for item in items:
+        w = _word(item)
+        if w == "AND" and not between:
+            parts.append([])
+            continue
+        if w == "BETWEEN":
+            between = True
+        elif w == "AND":
+            between = False
+        parts[-1].append(item)
+    return [p for p in parts if p]
+
+
+def _render(items):
+    out = ""
+    for item in items:
+        text = "(" + _render(item) + ")" if isinstance(item, _Group) else item[1]
+        if out and not out.endswith((".", "(")) and text not in (".", ",", ")") and not text.startswith(")"):
+            out += " "
+        out += text
+    return out
+
+
+def _walk(items):
+    # Every token and group, descending into groups that are not subqueries
+    for item in items:
+        yield item
+        if isinstance(item, _Group) and not _is_query(item):
+            yield from _walk(item)
+
+
+class _Parse:
+    def __init__(self):
+        self.ctes = set()
+        self.blocks = []
+        self.tables = {}
+        self.n_relations = 0
+        self.join_predicates = []
+        self.filters = []
+        self.predicates_per_table = {}
+        self.n_aggregates = 0
+        self.group_by_width = 0
+        self.n_subqueries = 0
+
+    def statement(self, items):
+        if _word(items[0] if items else None) == "WITH":
+            items = self._ctes(items[1:])
+        for block in _split(items, lambda it: _word(it) in _SET_OPS):
+            if block and _word(block[0]) == "ALL":
+                block = block[1:]
+            if block and isinstance(block[0], _Group) and len(block) == 1:
+                self.statement(block[0])
+            else:
+                self.block(block)
+
+    def _ctes(self, items):
+        # name [(cols)] AS [NOT] [MATERIALIZED] (query), ... ; returns the main statement
+        i = 0
+        if _word(items[0] if items else None) == "RECURSIVE":
+            i = 1
+        while i < len(items):
+            if not isinstance(items[i], tuple) or items[i][0] not in ("ident", "qident"):
+                break
+            self.ctes.add(_name(items[i]))
+            j = i + 1
+            while j < len(items) and not _is_query(items[j]):
+                j += 1
+            if j < len(items):
+                self.n_subqueries += 1
+                self.statement(items[j])
+            i = j + 1
+            if i < len(items) and items[i] == ("punct", ","):
+                i += 1
+            else:
+                break
+        return items[i:]
+
+    def subqueries(self, items):
+        for item in items:
+            if isinstance(item, _Group):
+                if _is_query(item):
+                    self.n_subqueries += 1
+                    self.statement(item)
+                else:
+                    self.subqueries(item)
+
+    def block(self, items):
+        clauses = {}
+        current = None
+        for idx, item in enumerate(items):
+            w = _word(item)
+            prev = items[idx - 1] if idx else None
+            if w in _CLAUSES and not (w == "FOR" and current is None) and prev != ("punct", "."):
+                current = w
+                clauses.setdefault(current, [])
+                continue
+            if current is not None:
+                clauses[current].append(item)
+
+        aliases = {}
+        conjuncts = []
+        edges = set()
+        for item in self._from_items(clauses.get("FROM", [])):
+            kind, rel, alias, condition, using = item
+            if kind == "table" and rel not in self.ctes:
+                self.tables[alias] = rel
+                self.n_relations += 1
+            aliases[alias] = rel
+            if condition:
+                conjuncts.extend(_conjuncts(condition))
+            if using is not None and len(aliases) > 1:
+                previous = list(aliases)[-2]
+                edges.add(frozenset((previous, alias)))
+                self.join_predicates.append(f"{previous} JOIN {alias} USING ({_render(using)})")
+        conjuncts.extend(_conjuncts(clauses.get("WHERE", [])))
+
+        for conj in conjuncts:
+            self.subqueries(conj)
+            refs = self._aliases(conj, aliases)
+            if len(refs) >= 2:
+                self.join_predicates.append(_render(conj))
+                if len(refs) == 2:
+                    edges.add(frozenset(refs))
+            else:
+                self.filters.append(_render(conj))
+                for alias in refs:
+                    table = aliases[alias]
+                    self.predicates_per_table[table] = self.predicates_per_table.get(table, 0) + 1
+
+        for part in ("SELECT", "HAVING", "ORDER", "GROUP"):
+            self.subqueries(clauses.get(part, []))
+        for part in ("SELECT", "HAVING", "ORDER"):
+            tokens = list(_walk(clauses.get(part, [])))
+            self.n_aggregates += sum(1 for a, b in zip(tokens, tokens[1:])
+                                     if _word(a) in AGGREGATES and isinstance(b, _Group))
+        group_by = clauses.get("GROUP", [])
+        if group_by and _word(group_by[0]) == "BY":
+            width = len(_split(group_by[1:], lambda it: it == ("punct", ",")))
+            self.group_by_width = max(self.group_by_width, width)
+
+        self.blocks.append((list(aliases), edges))
+
+    def _from_items(self, items):
+        # (kind, relation, alias, ON condition, USING columns) per FROM item
+        out = []
+        i = 0
+        while i < len(items):
+            while i < len(items) and (items[i] == ("punct", ",") or _word(items[i]) in _JOIN_WORDS):
+                i += 1
+            if i >= len(items):
+                break
+            j = i
+            while j < len(items) and items[j] != ("punct", ",") and _word(items[j]) not in _ITEM_END:
+                j += 1
+            head = items[i:j]
+            condition, using = None, None
+            if j < len(items) and _word(items[j]) == "ON":
+                k = j + 1
+                while k < len(items) and items[k] != ("punct", ",") and _word(items[k]) not in _JOIN_WORDS:
+                    k += 1
+                condition, j = items[j + 1:k], k
+            elif j < len(items) and _word(items[j]) == "USING":
+                if j + 1 < len(items) and isinstance(items[j + 1], _Group):
+                    using = items[j + 1]
+                j += 2
+            i = j
+            if not head:
+                continue
+
+            if isinstance(head[0], _Group):
+                kind, rel = "subquery", None
+                if _is_query(head[0]):
+                    self.n_subqueries += 1
+                    self.statement(head[0])
+                rest = head[1:]
+            else:
+                # schema.table or table, optionally followed by a function call's arguments
+                parts = [head[0]]
+                k = 1
+                while k + 1 < len(head) and head[k] == ("punct", "."):
+                    parts.append(head[k + 1])
+                    k += 2
+                kind, rel = "table", _name(parts[-1])
+                if k < len(head) and isinstance(head[k], _Group):
+                    kind = "function"
+                    k += 1
+                rest = head[k:]
+            rest = [t for t in rest if _word(t) != "AS" and not isinstance(t, _Group)]
+            alias = _name(rest[0]) if rest and rest[0][0] in ("ident", "qident") else rel
+            if alias is None:
+                alias = f"subquery{self.n_subqueries}"
+            out.append((kind, rel or alias, alias, condition, using))
+        return out
+
+    @staticmethod
+    def _aliases(conj, aliases):
+        refs = set()
+        tokens = list(_walk(conj))
+        for a, dot, b in zip(tokens, tokens[1:], tokens[2:]):
+            if dot == ("punct", ".") and isinstance(a, tuple) and a[0] in ("ident", "qident") \
+                    and isinstance(b, tuple) and b[0] in ("ident", "qident"):
+                if _name(a) in aliases:
+                    refs.add(_name(a))
+        if not refs and len(aliases) == 1:
+            # Unqualified columns in a single-relation block belong to that relation
+            refs.add(next(iter(aliases)))
+        return refs
+
+
+def join_shape(nodes, edges):
+    """Shape of a join graph: single, chain, star, tree, cycle or disconnected."""
+    if len(nodes) <= 1:
+        return "single"
+    degree = {n: 0 for n in nodes}
+    parent = {n: n for n in nodes}
+
+    def find(n):
+        while parent[n] != n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+        return n
+
+    cyclic = False
+    for edge in edges:
+        a, b = tuple(edge)
+        degree[a] += 1
+        degree[b] += 1
+        ra, rb = find(a), find(b)
+        if ra == rb:
+            cyclic = True
+        parent[ra] = rb
+    if cyclic:
+        return "cycle"
+    if len({find(n) for n in nodes}) > 1:
+        return "disconnected"
+    if max(degree.values()) <= 2:
+        return "chain"
+    if max(degree.values()) == len(nodes) - 1:
+        return "star"
+    return "tree"
+
+
+@lru_cache(maxsize=65536)
+def _features_text(text):
+    p = _Parse()
+    statements = _split(_nest(tokenize(text)), lambda it: it == ("punct", ";"))
+    for items in statements:
+        p.statement(items)
+
+    largest = max(p.blocks, key=lambda b: len(b[0]), default=([], set()))
+    return {
+        "n_relations": p.n_relations,
+        "n_joins": sum(max(len(nodes) - 1, 0) for nodes, _ in p.blocks),
+        "join_shape": join_shape(*largest),
+        "tables": p.tables,
+        "join_predicates": p.join_predicates,
+        "filters": p.filters,
+        "predicates_per_table": p.predicates_per_table,
+        "n_join_predicates": len(p.join_predicates),
+        "n_filters": len(p.filters),
+        "n_aggregates": p.n_aggregates,
+        "group_by_width": p.group_by_width,
+        "n_subqueries": p.n_subqueries,
+    }
+
+
+def sql_features(query):
+    """Structural features of one query (see module docstring). The returned dict
+    is shared with the parse cache and must not be modified."""
+    return _features_text(query.strip())
+
+
+def count_joins(query):
+    return sql_features(query)["n_joins"]
+
+
+# Words after which a +/- sign belongs to the literal that follows (x > -5, BETWEEN -1 AND 1)
+_OPERAND_WORDS = {"SELECT", "WHERE", "AND", "OR", "NOT", "BETWEEN", "IN", "ON", "WHEN", "THEN", "ELSE",
+                  "LIMIT", "OFFSET", "HAVING", "BY", "VALUES", "IS", "LIKE", "ILIKE", "RETURNING"}
+
+
+def _expects_operand(tok):
+    kind, value = tok
+    return kind == "op" or tok in (("punct", "("), ("punct", ",")) or \
+        (kind == "ident" and value.upper() in _OPERAND_WORDS)
+
+
+@lru_cache(maxsize=65536)
+def _template_text(text):
+    out = []
+    for kind, value in tokenize(text):
+        if kind in ("str", "num", "param"):
+            if out and out[-1][0] == "op" and out[-1][1] in ("-", "+") and \
+                    (len(out) == 1 or _expects_operand(out[-2])):
+                out.pop()
+            out.append(("param", "?"))
+        elif kind == "ident":
+            out.append((kind, value.lower()))
+        else:
+            out.append((kind, value))
+    # A parenthesized list of literals is one parameter, whatever its length: IN (?, ?, ?) -> IN (?)
+    collapsed = []
+    for tok in out:
+        collapsed.append(tok)
+        if tok == ("punct", ")"):
+            i = len(collapsed) - 2
+            while i >= 0 and (collapsed[i] == ("param", "?") or collapsed[i] == ("punct", ",")):
+                i -= 1
+            if i >= 0 and collapsed[i] == ("punct", "(") and len(collapsed) - i > 3:
+                del collapsed[i + 1:]
+                collapsed += [("param", "?"), ("punct", ")")]
+    return " ".join(value for _, value in collapsed)
+
+
+def query_template(query):
+    """The query with every literal (numbers, strings, parameters) replaced by `?`, literal
+    lists collapsed to one `?`, identifiers lower-cased and whitespace/comments normalized:
+    queries that differ only in their constants share a template."""
+    return _template_text(query.strip())
+
+
+def template_fingerprint(query):
+    """Short stable id of a query's template."""
+    return hashlib.sha1(query_template(query).encode("utf-8")).hexdigest()[:16]
+
+
+def template_features(query):
+    """`sql_features` of the query's template: parsed once for all its instances."""
+    return _features_text(query_template(query))
+
+
+SQL_FEATURE_NAMES = [
+    "sql_relations", "sql_joins", "sql_join_predicates", "sql_filters", "sql_aggregates",
+    "sql_group_by_width", "sql_subqueries", "sql_max_table_predicates",
+] + [f"sql_shape_{s}" for s in JOIN_SHAPES]
+N_SQL_FEATURES = len(SQL_FEATURE_NAMES)
+
+
+@lru_cache(maxsize=65536)
+def _vector_text(text):
+    f = _features_text(text)
+    vec = np.zeros(N_SQL_FEATURES, dtype=np.float64)
+    vec[:8] = [
+        f["n_relations"], f["n_joins"], f["n_join_predicates"], f["n_filters"], f["n_aggregates"],
+        f["group_by_width"], f["n_subqueries"], max(f["predicates_per_table"].values(), default=0),
+    ]
+    vec[8 + JOIN_SHAPES.index(f["join_shape"])] = 1.0
+    vec.setflags(write=False)
+    return vec
+
+
+_NO_SQL = np.zeros(N_SQL_FEATURES, dtype=np.float64)
+_NO_SQL.setflags(write=False)
+
+
+def sql_feature_vector(query):
+    """Fixed-width vector laid out as `SQL_FEATURE_NAMES` (zeros when the SQL is unknown).
+    None of its entries depend on literals, so it is computed (and cached) once per
+    query template."""
+    if not isinstance(query, str) or not query.strip():
+        return _NO_SQL
+    return _vector_text(query_template(query))
+
+
+@instrument.timed("featurize.sql")
+def sql_feature_matrix(queries):
+    queries = list(queries)
+    out = np.empty((len(queries), N_SQL_FEATURES), dtype=np.float64)
+    for i, q in enumerate(queries):
+        out[i] = sql_feature_vector(q)
+    return out
+
+
+def cache_info():
+    return _features_text.cache_info()
@@ -0,0 +1,356 @@
+"""End-to-end pipeline benchmark with scaling curves.
+
+Times every stage of the pipeline at increasing workload sizes and core counts
+and records wall time, peak RSS and throughput:
+
+    collect        run_queries_baseline.collect_results on a generated workload
+                   (skipped when the database cannot be reached)
+    featurize      read query_metrics with plans + lcm.get_feature_matrix
+    train_lcm      lcm.train_and_save
+    train_hybrid   hybrid.train_hybrid_selector
+    score          PlanScorer.choose_best_batch over synthesized candidates
+    generate_plans scripts/generate_plans.py
+    website        scripts/generate_website.py
+
+Every (size, cores) pair runs in its own copy of the project (scripts/,
+models/, queries/, tables.sql and the collected results) under a temporary
+folder, so trained models and outputs never overwrite the real ones. The
+`query_metrics` table of the copy is resampled from the collected rows to the
+requested size, with estimates, runtimes and plan costs jittered so that every
+row has a distinct plan. Each stage runs in a fresh process pinned to the
+requested number of cores (sched_setaffinity plus the OMP/MKL/OpenBLAS thread
+variables), so its peak RSS is its own.
+
+Runs are appended to BENCHMARK_DIR/history.json. `--save-baseline` stores the
+results as the baseline; later runs are compared against it and the script
+exits with status 1 when a stage's wall time or peak RSS grows by more than
+BENCHMARK_REGRESSION_THRESHOLD.
+
+    python scripts/benchmark.py --sizes 100 1000 --cores 1 4
+    python scripts/benchmark.py --stages featurize train_lcm --save-baseline
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import (BENCHMARK_SIZES, BENCHMARK_CORES, BENCHMARK_DIR,
+                    BENCHMARK_REGRESSION_THRESHOLD)
+
+STAGES = ["collect", "featurize", "train_lcm", "train_hybrid", "score", "generate_plans", "website"]
+# What gets copied into the per-run sandbox
+COPY_ITEMS = ["scripts", "models", "queries", "tables.sql"]
+COPY_RESULTS = ["query_metrics.parquet", "query_metrics.csv", "plans"]
+THREAD_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]
+
+
+def _resolve(path):
+    return path if os.path.isabs(path) else os.path.join(ROOT, path)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---- Child side: one stage inside a sandbox -------------------------------------------------
+
+def _jitter_plan(node, factor):
+    node["Total Cost"] = round(node.get("Total Cost", 0.0) * factor, 2)
+    node["Startup Cost"] = round(node.get("Startup Cost", 0.0) * factor, 2)
+    node["Plan Rows"] = max(1, int(node.get("Plan Rows", 1) * factor))
+    for child in node.get("Plans", ()):
+        _jitter_plan(child, factor)
+
+
+def prepare_metrics(size, seed=0):
+    """Resample the sandbox's query_metrics to `size` rows with jittered numbers and plans."""
+    import numpy as np
+    import pandas as pd
+    import metrics_store
+
+    source = metrics_store.read_table("query_metrics", with_plans=True)
+    source = source[source["plan_json"].map(lambda p: isinstance(p, str))].reset_index(drop=True)
+    if source.empty:
+        raise RuntimeError("No collected rows with plans to resample; run the collector first.")
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(source), size)
+    factors = rng.lognormal(0.0, 0.3, size)
+
+    rows = []
+    for i, (j, factor) in enumerate(zip(picks, factors)):
+        row = source.iloc[j].to_dict()
+        plan = json.loads(row["plan_json"])
+        _jitter_plan(plan["Plan"] if isinstance(plan, dict) else plan[0]["Plan"], factor)
+        row["plan_json"] = json.dumps(plan)
+        row["query_name"] = f"{os.path.splitext(row['query_name'])[0]}_b{i:06d}.sql"
+        for col in ("estimated_cost", "estimated_rows", "actual_runtime_ms", "runtime_median_ms"):
+            if col in row and pd.notna(row[col]):
+                row[col] = float(row[col]) * factor
+        rows.append(row)
+    metrics_store.write_table(pd.DataFrame(rows), "query_metrics")
+    return size
+
+
+def db_reachable():
+    try:
+        import psycopg2
+        from config import DB_CONFIG
+        psycopg2.connect(connect_timeout=3, **DB_CONFIG).close()
+        return True
+    except Exception:
+        return False
+
+
+def stage_collect(size):
+    from run_queries_baseline import collect_results
+    from generate_workload import parse_schema, fk_edges, WorkloadGenerator, write_workload
+    from models.catalog import load_catalog
+
+    if not db_reachable():
+        return None
+    tables, declared = parse_schema()
+    out = os.path.join(ROOT, "queries_benchmark")
+    shutil.rmtree(out, ignore_errors=True)
+    write_workload(WorkloadGenerator(tables, fk_edges(tables, declared), load_catalog()), out, size)
+    # One timed run per query: this measures the harness, not the queries' variance
+    df = collect_results(warmup=0, runs=1, store=None, query_dir=out)
+    return len(df)
+
+
+def _training_frame():
+    import metrics_store
+    from models import lcm
+    from workload import with_query_text
+    return with_query_text(metrics_store.read_table("query_metrics", columns=lcm.TRAINING_COLUMNS, with_plans=True))
+
+
+def stage_featurize(size):
+    from models import lcm
+    return len(lcm.get_feature_matrix(_training_frame()))
+
+
+def stage_train_lcm(size):
+    from models import lcm
+    df = _training_frame()
+    lcm.train_and_save(df, overwrite=True)
+    return len(df)
+
+
+def stage_train_hybrid(size):
+    from models import hybrid
+    df = _training_frame()
+    hybrid.train_hybrid_selector(df)
+    return len(df)
+
+
+def stage_score(size):
+    import metrics_store
+    from models import lcm
+    from generate_plans import synthesize_candidates
+    from workload import with_query_text
+    scorer = lcm.PlanScorer(lcm.load_model())
+    n = 0
+    for chunk in metrics_store.iter_table("query_metrics", columns=lcm.TRAINING_COLUMNS, with_plans=True):
+        rows = with_query_text(chunk).to_dict("records")
+        groups = [synthesize_candidates(row) for row in rows]
+        scorer.choose_best_batch(groups, [row["query_text"] for row in rows])
+        n += sum(len(g) for g in groups)
+    return n
+
+
+def stage_generate_plans(size):
+    import generate_plans
+    sys.argv = ["generate_plans.py"]
+    generate_plans.main()
+    return size
+
+
+def stage_website(size):
+    import generate_website
+    generate_website.build_comparison()
+    return size
+
+
+def run_stage(stage, size, cores):
+    if cores and hasattr(os, "sched_setaffinity"):
+        available = sorted(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, available[:cores])
+    if stage == "prepare":
+        prepare_metrics(size)
+        return {"stage": stage}
+    start = time.perf_counter()
+    items = globals()[f"stage_{stage}"](size)
+    wall = time.perf_counter() - start
+    if items is None:
+        return {"stage": stage, "skipped": "database not reachable"}
+    return {"stage": stage, "wall_sec": wall, "peak_rss_mb": peak_rss_mb(),
+            "items": items, "throughput_per_sec": items / wall if wall > 0 else None}
+
+
+# ---- Parent side: sandboxes, history, baseline ----------------------------------------------
+
+def make_sandbox(base):
+    for item in COPY_ITEMS:
+        src = os.path.join(ROOT, item)
+        if os.path.isdir(src):
+            shutil.copytree(src, os.path.join(base, item), ignore=shutil.ignore_patterns("__pycache__"))
+        elif os.path.exists(src):
+            shutil.copy2(src, os.path.join(base, item))
+    os.makedirs(os.path.join(base, "results"), exist_ok=True)
+    for item in COPY_RESULTS:
+        src = os.path.join(ROOT, "results", item)
+        if os.path.isdir(src):
+            shutil.copytree(src, os.path.join(base, "results", item))
+        elif os.path.exists(src):
+            shutil.copy2(src, os.path.join(base, "results", item))
+    # Cardinality features only when the real project has a snapshot too
+    snapshot = os.path.join(ROOT, "results", "catalog_snapshot.json")
+    if os.path.exists(snapshot):
+        shutil.copy2(snapshot, os.path.join(base, "results"))
+
+
+def spawn_stage(sandbox, stage, size, cores):
+    env = dict(os.environ)
+    for var in THREAD_VARS:
+        env[var] = str(cores)
+    cmd = [sys.executable, os.path.join(sandbox, "scripts", "benchmark.py"),
+           "--run-stage", stage, "--size", str(size), "--cores", str(cores)]
+    proc = subprocess.run(cmd, cwd=sandbox, env=env, capture_output=True, text=True)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        print(proc.stdout[-2000:])
+        print(proc.stderr[-2000:])
+        return {"stage": stage, "error": f"exit status {proc.returncode}"}
+    return json.loads(lines[-1])
+
+
+def run_benchmarks(stages, sizes, cores_list):
+    results = []
+    for size in sizes:
+        for cores in cores_list:
+            sandbox = tempfile.mkdtemp(prefix="wek_bench_")
+            try:
+                make_sandbox(sandbox)
+                prep = spawn_stage(sandbox, "prepare", size, cores)
+                if "error" in prep:
+                    print(f"Could not prepare {size} rows; skipping size {size}.")
+                    break
+                for stage in stages:
+                    r = spawn_stage(sandbox, stage, size, cores)
+                    r.update(size=size, cores=cores)
+                    results.append(r)
+                    if "wall_sec" in r:
+                        print(f"{stage:<15} n={size:<7} cores={cores:<3} {r['wall_sec']:9.3f}s "
+                              f"{r['peak_rss_mb']:8.1f} MB  {r['throughput_per_sec']:10.1f}/s")
+                    else:
+                        print(f"{stage:<15} n={size:<7} cores={cores:<3} {r.get('skipped') or r.get('error')}")
+            finally:
+                shutil.rmtree(sandbox, ignore_errors=True)
+    return results
+
+
+def _key(r):
+    return f"{r['stage']}/{r['size']}/{r['cores']}"
+
+
+def append_history(results, out_dir):
+    path = os.path.join(out_dir, "history.json")
+    history = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            history = json.load(f)
+    history.append({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(),
+                    "cpu_count": os.cpu_count(), "results": results})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(history, f, indent=2)
+    return path
+
+
+def save_baseline(results, out_dir):
+    path = os.path.join(out_dir, "baseline.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"commit": git_commit(), "results": {_key(r): r for r in results if "wall_sec" in r}},
+                  f, indent=2)
+    return path
+
+
+def find_regressions(results, out_dir, threshold):
+    path = os.path.join(out_dir, "baseline.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for r in results:
+        base = baseline.get(_key(r))
+        if base is None or "wall_sec" not in r:
+            continue
+        for metric in ("wall_sec", "peak_rss_mb"):
+            if base[metric] > 0 and r[metric] > base[metric] * (1.0 + threshold):
+                regressions.append(f"{_key(r)} {metric}: {base[metric]:.3f} -> {r[metric]:.3f} "
+                                   f"(+{(r[metric] / base[metric] - 1.0) * 100:.0f}%)")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages at several workload sizes.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=BENCHMARK_SIZES, help="workload sizes (queries)")
+    parser.add_argument("--cores", nargs="+", type=int, default=BENCHMARK_CORES, help="core counts to pin to")
+    parser.add_argument("--threshold", type=float, default=BENCHMARK_REGRESSION_THRESHOLD,
+                        help="allowed relative growth of wall time / peak RSS over the baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    # Internal: run one stage in the current (sandbox) project and print its result as JSON
+    parser.add_argument("--run-stage", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.run_stage:
+        cores = args.cores[0] if args.cores else None
+        print(json.dumps(run_stage(args.run_stage, args.size, cores)))
+        return
+
+    # Always in pipeline order: later stages use the models the earlier ones trained
+    stages = [s for s in STAGES if s in args.stages]
+    results = run_benchmarks(stages, args.sizes, args.cores)
+    out_dir = _resolve(BENCHMARK_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    print(f"History: {append_history(results, out_dir)}")
+    if args.save_baseline:
+        print(f"Baseline: {save_baseline(results, out_dir)}")
+        return
+
+    regressions = find_regressions(results, out_dir, args.threshold)
+    if regressions is None:
+        print("No baseline stored yet (run with --save-baseline).")
+    elif regressions:
+        print(f"Regressions beyond {args.threshold * 100:.0f}%:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    else:
+        print(f"No regressions beyond {args.threshold * 100:.0f}% against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
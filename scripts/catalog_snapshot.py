@@ -0,0 +1,127 @@
+"""Bulk snapshot of the catalog statistics the featurizers use.
+
+Reads, in three queries, the size of every table and index (pg_class
+reltuples/relpages), the column statistics (pg_stats: null fraction,
+n_distinct, most common values and frequencies, histogram bounds,
+correlation) and the index definitions of the public schema, and writes them
+to CATALOG_SNAPSHOT with the schema/statistics version they belong to
+(result_cache.schema_version). models/catalog.py loads the file in memory.
+
+The collector refreshes the snapshot at the start of every run; it is only
+re-read from the database when the version changed (e.g. after ANALYZE).
+
+    python scripts/catalog_snapshot.py [--force]
+"""
+import os
+import json
+import time
+import argparse
+
+from config import CATALOG_SNAPSHOT
+from result_cache import schema_version
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+TABLES_SQL = """
+SELECT c.relname, c.relkind, c.reltuples, c.relpages
+  FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+ WHERE n.nspname = 'public' AND c.relkind IN ('r', 'm', 'p', 'i')
+"""
+
+STATS_SQL = """
+SELECT tablename, attname, null_frac, avg_width, n_distinct,
+       most_common_vals::text, most_common_freqs, histogram_bounds::text, correlation
+  FROM pg_stats
+ WHERE schemaname = 'public'
+"""
+
+INDEXES_SQL = """
+SELECT t.relname, i.relname, ix.indisunique, pg_get_indexdef(ix.indexrelid),
+       array_agg(a.attname ORDER BY k.ord) FILTER (WHERE a.attname IS NOT NULL)
+  FROM pg_index ix
+  JOIN pg_class t ON t.oid = ix.indrelid
+  JOIN pg_class i ON i.oid = ix.indexrelid
+  JOIN pg_namespace n ON n.oid = t.relnamespace
+  CROSS JOIN LATERAL unnest(ix.indkey::int2[]) WITH ORDINALITY AS k(attnum, ord)
+  LEFT JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+ WHERE n.nspname = 'public'
+ GROUP BY t.relname, i.relname, ix.indisunique, ix.indexrelid
+"""
+
+
+def snapshot_path(path=CATALOG_SNAPSHOT):
+    return path if os.path.isabs(path) else os.path.join(ROOT, path)
+
+
+def take_snapshot(cursor):
+    snapshot = {"version": schema_version(cursor), "taken_at": time.time(),
+                "tables": {}, "columns": {}, "indexes": {}}
+
+    cursor.execute(TABLES_SQL)
+    for relname, relkind, reltuples, relpages in cursor.fetchall():
+        snapshot["tables"][relname] = {"relkind": relkind, "reltuples": float(reltuples), "relpages": int(relpages)}
+
+    cursor.execute(STATS_SQL)
+    for table, column, null_frac, avg_width, n_distinct, mcv, mcf, hist, corr in cursor.fetchall():
+        snapshot["columns"][f"{table}.{column}"] = {
+            "null_frac": null_frac, "avg_width": avg_width, "n_distinct": n_distinct,
+            "most_common_vals": mcv, "most_common_freqs": list(mcf) if mcf is not None else None,
+            "histogram_bounds": hist, "correlation": corr,
+        }
+
+    cursor.execute(INDEXES_SQL)
+    for table, index, unique, definition, columns in cursor.fetchall():
+        snapshot["indexes"].setdefault(table, []).append(
+            {"name": index, "unique": unique, "definition": definition, "columns": list(columns or [])})
+    return snapshot
+
+
+def read_version(path=CATALOG_SNAPSHOT):
+    try:
+        with open(snapshot_path(path), "r", encoding="utf-8") as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(snapshot, path=CATALOG_SNAPSHOT):
+    path = snapshot_path(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+    return path
+
+
+def refresh(cursor, path=CATALOG_SNAPSHOT, force=False):
+    """Re-snapshot when the cached one is missing or belongs to another schema version.
+    Returns True when a new snapshot was written."""
+    if not force and read_version(path) == schema_version(cursor):
+        return False
+    snapshot = take_snapshot(cursor)
+    write_snapshot(snapshot, path)
+    print(f"Catalog snapshot: {len(snapshot['tables'])} relations, {len(snapshot['columns'])} column "
+          f"statistics, {sum(len(v) for v in snapshot['indexes'].values())} indexes -> {snapshot_path(path)}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot table/column/index statistics for the featurizers.")
+    parser.add_argument("--force", action="store_true", help="re-read the catalog even if the version is unchanged")
+    args = parser.parse_args()
+
+    from run_queries_baseline import get_connection
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            if not refresh(cursor, force=args.force):
+                print(f"Catalog snapshot at {snapshot_path()} is up to date.")
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,102 @@
+import os
+
+# The real NBA data set; scripts/generate_data.py refuses to load into it
+REAL_DATABASE = "nba_data"
 
 # This may have to change on your local machine based on your user and password to your local postgres
 DB_CONFIG = {
     "host": "localhost",
     "port": 5432,
-    "database": "nba_data",
+    "database": REAL_DATABASE,
     "user": "postgres",
     "password": "1234"
 }
 
+# The standard libpq variables override it, e.g. to run every script against a throwaway
+# database loaded by scripts/generate_data.py
+for _key, _env in (("host", "PGHOST"), ("port", "PGPORT"), ("database", "PGDATABASE"),
+                   ("user", "PGUSER"), ("password", "PGPASSWORD")):
+    if os.environ.get(_env):
+        DB_CONFIG[_key] = os.environ[_env]
+
 # Base paths
 # Useful for navigation in scripts and models
 QUERY_DIR = "queries"
-RESULTS_DIR = "results/query_metrics.csv"
\ No newline at end of file
+RESULTS_DIR = "results/query_metrics.csv"
+
+# Query collection
+# Number of queries executed concurrently; also the size of the connection pool
+COLLECT_WORKERS = 4
+# Categories whose queries are run one at a time, after the concurrent ones,
+# so that other queries competing for CPU/IO do not distort their timings
+ISOLATED_CATEGORIES = ("large",)
+
+# Repeated-trial timing
+# Each query is executed WARMUP_RUNS times (discarded) and then TIMED_RUNS times (recorded)
+WARMUP_RUNS = 1
+TIMED_RUNS = 5
+# What happens before every timed run:
+#   "warm"    - nothing, measures steady-state (cached) runtime
+#   "discard" - DISCARD ALL, drops session state such as cached plans and temp tables
+#   "hook"    - runs the COLD_CACHE_HOOK shell command, e.g. a script that drops the OS page
+#               cache; it must leave the server running since pooled connections are reused
+CACHE_MODE = "warm"
+COLD_CACHE_HOOK = None
+
+# Persistent result store (SQLite) used to skip unchanged queries and resume interrupted runs
+RESULT_STORE = "results/collection_cache.sqlite"
+
+# Bulk snapshot of table sizes, pg_stats and indexes used for cardinality features
+# (scripts/catalog_snapshot.py, loaded by models/catalog.py)
+CATALOG_SNAPSHOT = "results/catalog_snapshot.json"
+
+# Synthetic workload (scripts/generate_workload.py): output folder and joins per category
+GENERATED_QUERY_DIR = "queries_generated"
+GENERATED_JOIN_RANGES = {"small": (1, 2), "medium": (3, 5), "large": (6, 9)}
+
+# Persisted index of the query folders (scripts/workload.py); None disables persistence
+WORKLOAD_INDEX = "results/workload_index.json"
+
+# Instances collected per query template (literals stripped, see models/sql_features.py);
+# None runs every query. Generated workloads repeat templates with different constants,
+# and a few instances per template carry most of their signal
+TEMPLATE_SAMPLE_SIZE = None
+
+# Log ingestion (scripts/ingest_logs.py): rows built from auto_explain logs and
+# pg_stat_statements snapshots accumulate in INGESTED_TABLE and are merged into query_metrics;
+# INGEST_STATE records how far each file was read. Runtime statistics of an ingested row come
+# from its last INGEST_MAX_SAMPLES logged executions
+INGESTED_TABLE = "query_metrics_ingested"
+INGEST_STATE = "results/ingest_state.json"
+INGEST_MAX_SAMPLES = 100
+
+# Server-side time budgets (statement_timeout, in ms) for every EXPLAIN ANALYZE run.
+# A query that exceeds its budget is cancelled by postgres and recorded as a censored
+# sample (runtime >= budget). Per-query overrides are keyed by file name.
+CATEGORY_TIMEOUT_MS = {"small": 60_000, "medium": 300_000, "large": 900_000}
+QUERY_TIMEOUT_MS = {}
+
+# Planner settings used to enumerate real alternative plans for every query. Each entry is
+# applied with SET LOCAL inside a transaction before EXPLAIN; {} is the default plan.
+CANDIDATE_SETTINGS = [
+    {},
+    {"enable_hashjoin": "off"},
+    {"enable_nestloop": "off"},
+    {"enable_mergejoin": "off"},
+    {"enable_hashjoin": "off", "enable_mergejoin": "off"},
+    {"enable_seqscan": "off"},
+    # Keep the join order as written in the query text
+    {"join_collapse_limit": "1", "from_collapse_limit": "1"},
+]
+
+# Plan validation: a chosen variant whose measured median runtime is more than this
+# fraction slower than the baseline's is reported as a regression; one whose baseline is
+# more than this fraction slower than the variant, as an improvement
+VALIDATION_REGRESSION_TOLERANCE = 0.05
+
+# Pipeline benchmark (scripts/benchmark.py): workload sizes, core counts, where the
+# history/baseline JSON files go and the allowed slowdown before a run fails
+BENCHMARK_SIZES = [100, 1_000, 10_000, 100_000]
+BENCHMARK_CORES = [1, 4]
+BENCHMARK_DIR = "results/benchmarks"
+BENCHMARK_REGRESSION_THRESHOLD = 0.2
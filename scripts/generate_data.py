@@ -0,0 +1,310 @@
+"""Synthetic data for the tables.sql schema at a chosen scale factor.
+
+Fills every table of `tables.sql` with generated rows, keeping the key
+relationships the queries join on intact (every game_id / team id / player id
+in a child table exists in game / team / player, see generate_workload.KEY_RULES)
+and plausible skew: child rows pick their parents from a Zipf distribution,
+categorical columns use Zipf-distributed vocabularies, and the columns the
+queries filter on (season, attendance, points, jersey numbers, event types...)
+follow realistic ranges. Row counts are BASE_ROWS (roughly the real data set)
+times `--scale`; SF 0.01 loads in seconds, SF 1 is about the size of nba_data.
+
+Data is streamed into PostgreSQL with COPY in chunks, then ANALYZE runs.
+The target is a separate database (default `nba_synth`), never the real nba_data
+(even when PGDATABASE points the other scripts at the synthetic one).
+With `--cluster-dir` a throwaway cluster is created (initdb) and started
+(pg_ctl) there first; every script can then be pointed at it through the
+standard PGHOST/PGPORT/PGDATABASE/PGUSER variables (see config.py):
+
+    python scripts/generate_data.py --scale 0.01 --cluster-dir /tmp/wek_pg --port 55432
+    export PGHOST=localhost PGPORT=55432 PGDATABASE=nba_synth PGUSER=postgres
+    python scripts/run_queries_baseline.py
+    python scripts/generate_data.py --stop-cluster /tmp/wek_pg
+"""
+import io
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import DB_CONFIG, REAL_DATABASE
+from generate_workload import parse_schema, KEY_RULES, SCHEMA_PATH
+
+
+# Rows per table at scale factor 1 (close to the Kaggle NBA data set behind nba_data)
+BASE_ROWS = {
+    "team": 30, "team_details": 30, "team_history": 60,
+    "player": 4800, "common_player_info": 3600, "draft_combine_stats": 1600, "draft_history": 8000,
+    "game": 65000, "game_info": 58000, "game_summary": 58000, "line_score": 58000,
+    "officials": 70000, "other_stats": 28000, "inactive_players": 110000, "playbyplay": 13_500_000,
+}
+# Parents are generated first so children can reference their keys
+LOAD_ORDER = ["team", "player", "game"]
+CHUNK_ROWS = 200_000
+NULL_FRAC = 0.02
+ZIPF_A = 1.1
+# Milder skew for foreign keys: some games/teams/players are referenced far more, none dominates
+KEY_ZIPF_A = 0.6
+# Tables with at most one row per game
+ONE_PER_GAME = {"game_info", "game_summary", "line_score", "other_stats"}
+
+FIRST_TEAM_ID = 1610612737
+FIRST_SEASON, LAST_SEASON = 1996, 2022
+
+
+def _zipf_choice(rng, values, size, a=ZIPF_A):
+    # values[0] is the most frequent; frequency of rank r is proportional to 1 / r^a
+    values = np.asarray(values)
+    p = 1.0 / np.arange(1, len(values) + 1) ** a
+    return values[rng.choice(len(values), size=size, p=p / p.sum())]
+
+
+def _vocabulary(column, n_distinct, width):
+    # Short prefix from the column's initials so values stay distinct within VARCHAR(width)
+    prefix = "".join(w[0] for w in column.split("_"))
+    values = [f"{prefix}{i}" for i in range(n_distinct)]
+    return np.array([v[-width:] if width else v for v in values], dtype=object)
+
+
+def _timestamps(rng, n):
+    start = np.datetime64(f"{FIRST_SEASON}-10-01")
+    days = rng.integers(0, (LAST_SEASON - FIRST_SEASON + 1) * 365, size=n)
+    return pd.Series(start + days.astype("timedelta64[D]")).dt.strftime("%Y-%m-%d %H:%M:%S").to_numpy()
+
+
+# (column pattern, column types or None for any, generator(rng, n)) for the columns
+# queries filter and aggregate on
+_NUMBERS = ("INT", "INTEGER", "BIGINT", "SMALLINT", "FLOAT", "REAL", "NUMERIC", "DOUBLE")
+COLUMN_RULES = [
+    (re.compile(r"^season_id$"), _NUMBERS, lambda rng, n: 20000 + rng.integers(FIRST_SEASON, LAST_SEASON + 1, n)),
+    (re.compile(r"^(season|draft_year|from_year|to_year|year_founded|yearfounded|year_active_till)$"), None,
+     lambda rng, n: rng.integers(FIRST_SEASON, LAST_SEASON + 1, n)),
+    (re.compile(r"^attendance$"), _NUMBERS, lambda rng, n: np.clip(rng.normal(17000, 3000, n), 0, 25000).astype(int)),
+    (re.compile(r"^pts_ot"), _NUMBERS, lambda rng, n: np.where(rng.random(n) < 0.95, 0, rng.integers(2, 20, n))),
+    (re.compile(r"^pts_qtr"), _NUMBERS, lambda rng, n: np.clip(rng.normal(26, 5, n), 5, 50).round()),
+    (re.compile(r"^pts_(home|away)$"), _NUMBERS, lambda rng, n: np.clip(rng.normal(103, 13, n), 50, 170).round()),
+    (re.compile(r"^pts_"), _NUMBERS, lambda rng, n: np.clip(rng.normal(18, 8, n), 0, 80).round()),
+    (re.compile(r"_pct"), _NUMBERS, lambda rng, n: rng.uniform(0.25, 0.65, n).round(3)),
+    (re.compile(r"jersey"), None, lambda rng, n: _zipf_choice(rng, rng.permutation(100), n, 0.6)),
+    (re.compile(r"^eventmsgtype$"), _NUMBERS,
+     lambda rng, n: _zipf_choice(rng, [2, 1, 4, 6, 5, 3, 8, 9, 10, 12, 13, 7, 11, 18], n)),
+    (re.compile(r"^eventmsgactiontype$"), _NUMBERS, lambda rng, n: _zipf_choice(rng, np.arange(110), n)),
+    (re.compile(r"^period$"), _NUMBERS,
+     lambda rng, n: np.where(rng.random(n) < 0.97, rng.integers(1, 5, n), rng.integers(5, 8, n))),
+    (re.compile(r"^(wl_home|wl_away)$"), None, lambda rng, n: rng.choice(np.array(["W", "L"], dtype=object), n)),
+]
+
+
+def _column_values(rng, table, column, col_type, n):
+    base_type, _, width = col_type.partition("(")
+    for pattern, types, gen in COLUMN_RULES:
+        if pattern.search(column) and (types is None or base_type in types):
+            return gen(rng, n)
+    if base_type in ("INT", "INTEGER", "BIGINT", "SMALLINT"):
+        return _zipf_choice(rng, np.arange(1000), n, 0.8)
+    if base_type in _NUMBERS:
+        return rng.lognormal(2.0, 1.0, n).round(2)
+    if base_type == "BOOLEAN":
+        return rng.random(n) < 0.5
+    if base_type == "TIMESTAMP":
+        return _timestamps(rng, n)
+    if base_type == "CHAR":
+        return rng.choice(np.array(["Y", "N"], dtype=object), n, p=[0.7, 0.3])
+    # VARCHAR(n) / TEXT: Zipf-distributed vocabulary sized with the table
+    return _zipf_choice(rng, _vocabulary(column, max(10, min(n, 2000)), int(width.rstrip(")") or 0)), n)
+
+
+class DataGenerator:
+    def __init__(self, tables, scale=1.0, seed=0):
+        self.tables = tables
+        self.scale = scale
+        self.rng = np.random.default_rng(seed)
+        self.keys = {}
+
+    def rows(self, table):
+        if table in ("team", "team_details"):
+            return BASE_ROWS[table]  # there are 30 teams whatever the scale
+        n = max(1, int(round(BASE_ROWS.get(table, 1000) * self.scale)))
+        if table in ONE_PER_GAME:
+            n = min(n, self.rows("game"))
+        return n
+
+    def _reference(self, table, column):
+        for pattern, ref_table, ref_col in KEY_RULES:
+            if pattern.match(column) and (table, column) != (ref_table, ref_col) and ref_table in self.keys:
+                return self.keys[ref_table]
+        return None
+
+    def chunks(self, table):
+        """DataFrames of generated rows for `table`, CHUNK_ROWS at a time."""
+        columns = self.tables[table]
+        total = self.rows(table)
+        for start in range(0, total, CHUNK_ROWS):
+            n = min(CHUNK_ROWS, total - start)
+            data = {}
+            for col, typ in columns.items():
+                data[col] = self._key_column(table, col, start, n)
+                if data[col] is None:
+                    values = _column_values(self.rng, table, col, typ, n)
+                    if NULL_FRAC:
+                        values = pd.Series(values, dtype=object).mask(self.rng.random(n) < NULL_FRAC)
+                    data[col] = values
+            yield pd.DataFrame(data, columns=list(columns))
+
+    def _key_column(self, table, col, start, n):
+        # Primary keys of the parents, and the unique keys of team_details / team_history
+        if (table, col) == ("team", "id") or (table, col) == ("team_details", "team_id"):
+            return FIRST_TEAM_ID + np.arange(start, start + n)
+        if (table, col) == ("player", "id"):
+            return np.arange(start + 1, start + n + 1)
+        if (table, col) == ("game", "game_id"):
+            return np.array([f"00{20000000 + i}" for i in range(start, start + n)], dtype=object)
+        if (table, col) == ("team_history", "year_founded"):
+            return 1900 + np.arange(start, start + n)
+        ref = self._reference(table, col)
+        if ref is None:
+            return None
+        if table in ONE_PER_GAME and col == "game_id":
+            return ref[start:start + n]
+        # Parent keys were shuffled, so the most referenced parents are spread over the key range
+        return _zipf_choice(self.rng, ref, n, KEY_ZIPF_A)
+
+    def remember_keys(self, table, df):
+        key = {"team": "id", "player": "id", "game": "game_id"}.get(table)
+        if key is not None:
+            keys = df[key].to_numpy()
+            self.keys[table] = np.concatenate([self.keys[table], keys]) if table in self.keys else keys
+
+    def finish_keys(self, table):
+        if table in self.keys:
+            self.keys[table] = self.rng.permutation(self.keys[table])
+
+
+def copy_table(cursor, table, df):
+    buf = io.StringIO()
+    df.to_csv(buf, header=False, index=False)
+    buf.seek(0)
+    cols = ", ".join(df.columns)
+    cursor.copy_expert(f"COPY {table} ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def create_schema(conn, drop=False):
+    """Run tables.sql statement by statement; statements that do not apply to a fresh
+    schema (e.g. dropping constraints that never existed) are reported and skipped."""
+    tables, _ = parse_schema()
+    with conn.cursor() as cursor:
+        if drop:
+            for t in tables:
+                cursor.execute(f"DROP TABLE IF EXISTS {t} CASCADE")
+            cursor.execute("DROP TABLE IF EXISTS temp_other_stats CASCADE")
+        with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+            text = re.sub(r"--[^\n]*", "", f.read())
+        for stmt in (s.strip() for s in text.split(";")):
+            if not stmt:
+                continue
+            try:
+                cursor.execute(stmt)
+            except psycopg2.Error as e:
+                print(f"  skipped: {stmt.splitlines()[0]} ({e.pgerror.strip().splitlines()[0] if e.pgerror else e})")
+
+
+def load(conn, generator):
+    order = LOAD_ORDER + [t for t in generator.tables if t not in LOAD_ORDER]
+    with conn.cursor() as cursor:
+        for table in order:
+            start = time.perf_counter()
+            n = 0
+            for df in generator.chunks(table):
+                copy_table(cursor, table, df)
+                generator.remember_keys(table, df)
+                n += len(df)
+            generator.finish_keys(table)
+            print(f"  {table}: {n} rows in {time.perf_counter() - start:.1f}s")
+        start = time.perf_counter()
+        cursor.execute("ANALYZE")
+        print(f"  ANALYZE in {time.perf_counter() - start:.1f}s")
+
+
+def start_cluster(data_dir, port):
+    """initdb (first time only) and start a throwaway cluster listening on localhost:port."""
+    if not os.path.exists(os.path.join(data_dir, "PG_VERSION")):
+        subprocess.run(["initdb", "-D", data_dir, "-U", "postgres", "--auth=trust", "-E", "UTF8"],
+                       check=True, stdout=subprocess.DEVNULL)
+    subprocess.run(["pg_ctl", "-D", data_dir, "-l", os.path.join(data_dir, "server.log"), "-w",
+                    "-o", f"-p {port} -c listen_addresses=localhost -k {data_dir}", "start"],
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def stop_cluster(data_dir):
+    subprocess.run(["pg_ctl", "-D", data_dir, "-m", "fast", "-w", "stop"], check=True, stdout=subprocess.DEVNULL)
+
+
+def connect(database, host, port, user, password):
+    conn = psycopg2.connect(host=host, port=port, user=user, password=password, dbname="postgres")
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (database,))
+        if cursor.fetchone() is None:
+            cursor.execute(f'CREATE DATABASE "{database}"')
+    conn.close()
+    conn = psycopg2.connect(host=host, port=port, user=user, password=password, dbname=database)
+    conn.autocommit = True
+    return conn
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load scale-factor synthetic data into the tables.sql schema.")
+    parser.add_argument("--scale", type=float, default=0.01, help="scale factor (1 = about the real data set)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database", default="nba_synth", help="target database (created if missing)")
+    parser.add_argument("--drop", action="store_true", help="drop and recreate the schema's tables first")
+    parser.add_argument("--cluster-dir", help="create/start a throwaway cluster in this directory")
+    parser.add_argument("--port", type=int, default=55432, help="port of the throwaway cluster")
+    parser.add_argument("--stop-cluster", metavar="DIR", help="stop the throwaway cluster in DIR and exit")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.stop_cluster:
+        stop_cluster(args.stop_cluster)
+        print(f"Stopped cluster in {args.stop_cluster}")
+        return
+    if args.database == REAL_DATABASE and not args.cluster_dir:
+        raise SystemExit(f"Refusing to load synthetic data into {args.database}; choose another --database.")
+
+    if args.cluster_dir:
+        start_cluster(args.cluster_dir, args.port)
+        host, port, user, password = "localhost", args.port, "postgres", None
+    else:
+        host, port, user, password = DB_CONFIG["host"], DB_CONFIG["port"], DB_CONFIG["user"], DB_CONFIG["password"]
+
+    conn = connect(args.database, host, port, user, password)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM information_schema.tables WHERE table_schema = 'public'")
+            if cursor.fetchone()[0] and not args.drop:
+                raise SystemExit(f"{args.database} already has tables; pass --drop to recreate them.")
+        print(f"Creating schema in {args.database}")
+        create_schema(conn, drop=args.drop)
+        tables, _ = parse_schema()
+        print(f"Loading SF {args.scale}")
+        load(conn, DataGenerator(tables, scale=args.scale, seed=args.seed))
+    finally:
+        conn.close()
+
+    print(f"\nDone. Point the scripts at it with:\n"
+          f"  export PGHOST={host} PGPORT={port} PGDATABASE={args.database} PGUSER={user}")
+
+
+if __name__ == "__main__":
+    main()
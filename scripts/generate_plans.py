@@ -1,39 +1,55 @@
 """Generate candidate plans per query, score them with the LCM, and
 serialize the chosen plan for comparison with the baseline.
 
+Candidates are real alternative plans obtained by re-planning each query under
+different planner settings (see `plan_enumerator.py`); the chosen one is
+reproducible by re-applying its settings.
+
 This script does not modify the original data files — it writes outputs
-into `results/generated_plan_choices.csv`, `results/generated_plan_choices_rich.csv`,
-and `results/chosen_plans/`.
+into `results/generated_plan_choices.csv`, `results/generated_plan_choices_rich.csv`
+and `results/chosen_plans.jsonl` (one line per query: chosen candidate and its
+variant SQL). `--per-file` additionally writes `results/chosen_plans/` and
+`results/generated_sql_alternatives/`.
+
+Rows are streamed from query_metrics in batches of `--batch-size`; each batch is
+scored in one call and its outputs are written, and flushed, together.
 """
 import os
 import sys
+import csv
 import json
+import argparse
 
 ROOT = os.path.dirname(os.path.dirname(__file__))
 sys.path.insert(0, ROOT)
 
-import pandas as pd
+from models.lcm import PlanScorer, load_model, train_and_save, prediction_cache, TRAINING_COLUMNS, _summary
+from models import instrument
+from config import COLLECT_WORKERS
+import metrics_store
+from workload import with_query_text
 
-from models.lcm import PlanScorer, load_model, train_and_save
 
-
-DATA_CSV = os.path.join(ROOT, 'results', 'query_metrics.csv')
 OUT_CSV = os.path.join(ROOT, 'results', 'generated_plan_choices.csv')
 OUT_RICH = os.path.join(ROOT, 'results', 'generated_plan_choices_rich.csv')
 CHOSEN_DIR = os.path.join(ROOT, 'results', 'chosen_plans')
 OUT_SQL_DIR = os.path.join(ROOT, 'results', 'generated_sql_alternatives')
+OUT_JSONL = os.path.join(ROOT, 'results', 'chosen_plans.jsonl')
+BATCH_SIZE = 1000
 
 
 def synthesize_candidates(row):
-    """Create a small set of candidate plan summaries for a query.
+    """Create a small set of hypothetical candidate plan summaries for a query.
 
-    This is a lightweight enumerator that creates three candidates:
+    Offline fallback for `plan_enumerator.enumerate_workload` (used when the
+    database is unreachable). It creates three candidates:
     - the original (baseline) plan (if plan_json exists)
     - a cheaper-cost hypothetical plan (cost * 0.6)
     - a more expensive plan (cost * 1.3)
 
     Each candidate is a dict containing keys the PlanScorer expects
-    (join_count, estimated_cost, estimated_rows) and a short textual tag.
+    (join_count, estimated_cost, estimated_rows, plan_json) and a short textual tag.
+    The hypothetical variants reuse the baseline's plan tree.
     """
     candidates = []
     try:
@@ -45,13 +61,17 @@ def synthesize_candidates(row):
     except Exception:
         est_rows = 0.0
     join_count = int(row.get('join_count') or 0)
+    plan_json = row.get('plan_json')
+    if not isinstance(plan_json, str):
+        plan_json = None
 
     # Baseline candidate (best-effort extract from plan_json if available)
     base = {
         'tag': 'baseline',
         'join_count': join_count,
         'estimated_cost': est_cost,
-        'estimated_rows': est_rows
+        'estimated_rows': est_rows,
+        'plan_json': plan_json
     }
     candidates.append(base)
 
@@ -60,7 +80,8 @@ def synthesize_candidates(row):
         'tag': 'cheap_variant',
         'join_count': join_count,
         'estimated_cost': max(1.0, est_cost * 0.6),
-        'estimated_rows': max(1.0, est_rows * 0.9)
+        'estimated_rows': max(1.0, est_rows * 0.9),
+        'plan_json': plan_json
     }
     candidates.append(cheap)
 
@@ -69,121 +90,194 @@ def synthesize_candidates(row):
         'tag': 'expensive_variant',
         'join_count': max(0, join_count),
         'estimated_cost': est_cost * 1.3,
-        'estimated_rows': est_rows * 1.1
+        'estimated_rows': est_rows * 1.1,
+        'plan_json': plan_json
     }
     candidates.append(expensive)
 
     return candidates
 
 
-def main():
-    if not os.path.exists(DATA_CSV):
-        raise FileNotFoundError(f"Data CSV missing at {DATA_CSV}. Run query collection first.")
-
-    df = pd.read_csv(DATA_CSV)
-
-    # Ensure a model exists; if not, train quickly using the data we have
+def open_pool():
+    """Connection pool shared by every batch's plan enumeration, or None (with a note)
+    when the database cannot be reached and candidates are synthesized instead."""
     try:
-        m = load_model()
-    except Exception:
-        print("No LCM found — training a quick model from available data...")
-        train_and_save(DATA_CSV, overwrite=True)
-        m = load_model()
+        from run_queries_baseline import get_pool
+        return get_pool(COLLECT_WORKERS)
+    except Exception as e:
+        print(f"Could not enumerate plans through the database ({e}); using synthesized candidates.")
+        return None
+
+
+def build_candidates(rows, sql_texts, pool=None):
+    """Real candidates from the planner (see plan_enumerator) on the connections of
+    `pool`; without one (database unreachable), the synthesized candidates."""
+    if pool is None:
+        return [synthesize_candidates(row) for row in rows]
+    from plan_enumerator import enumerate_workload
+    enumerated = enumerate_workload([(sql, int(row.get('join_count') or 0))
+                                     for row, sql in zip(rows, sql_texts)], pool=pool)
+    # Queries that could not be planned keep at least their collected baseline plan
+    return [cands or synthesize_candidates(row)[:1] for row, cands in zip(rows, enumerated)]
+
+
+class ChoiceWriter:
+    """Buffered writers for all generate_plans outputs.
+
+    Files are opened once per run and written a whole batch at a time: the short
+    and rich CSVs, plus one JSONL line per query in `results/chosen_plans.jsonl`
+    holding the chosen candidate and its reproducible variant SQL. With
+    `per_file=True` the legacy `chosen_plans/<query>.json` and
+    `generated_sql_alternatives/<query>.lcm_variant.sql` files are written too.
+    """
+
+    SHORT_FIELDS = ['query_name', 'chosen_pred_ms', 'chosen_plan_summary']
+    RICH_FIELDS = ['query_name', 'chosen_pred_ms', 'baseline_actual_ms',
+                   'would_be_faster_than_baseline', 'chosen_tag', 'chosen_settings']
+
+    def __init__(self, per_file=False):
+        self.per_file = per_file
+        os.makedirs(os.path.dirname(OUT_CSV), exist_ok=True)
+        self._files = [open(path, 'w', newline='', encoding='utf-8', buffering=1 << 20)
+                       for path in (OUT_CSV, OUT_RICH, OUT_JSONL)]
+        short_fh, rich_fh, self._jsonl = self._files
+        self._short = csv.DictWriter(short_fh, fieldnames=self.SHORT_FIELDS)
+        self._rich = csv.DictWriter(rich_fh, fieldnames=self.RICH_FIELDS, lineterminator='\n')
+        self._short.writeheader()
+        self._rich.writeheader()
+        if per_file:
+            os.makedirs(CHOSEN_DIR, exist_ok=True)
+            os.makedirs(OUT_SQL_DIR, exist_ok=True)
 
-    scorer = PlanScorer(m)
-
-    # Prepare outputs
-    os.makedirs(os.path.dirname(OUT_CSV), exist_ok=True)
-    if os.path.exists(OUT_CSV):
-        os.remove(OUT_CSV)
-    if os.path.exists(OUT_RICH):
-        os.remove(OUT_RICH)
-    os.makedirs(CHOSEN_DIR, exist_ok=True)
-
-    # Iterate queries
-    for _, row in df.iterrows():
-        qname = row.get('query_name') or row.get('name') or 'unknown'
-        candidates = synthesize_candidates(row)
-        res = scorer.pick_and_serialize(qname, candidates, OUT_CSV, chosen_dir=CHOSEN_DIR)
-
-        # Compose rich row with baseline actual runtime and whether chosen plan
-        # is predicted to be faster than baseline (using baseline's actual_runtime_ms)
-        chosen_pred = res.get('chosen_pred_ms')
+    @instrument.timed("write.choices")
+    def write_batch(self, records):
+        short, rich, lines = [], [], []
+        for rec in records:
+            plan = rec['chosen_plan'] or {}
+            pred = rec['chosen_pred_ms']
+            short.append({
+                'query_name': rec['query_name'],
+                'chosen_pred_ms': pred if pred is not None else '',
+                'chosen_plan_summary': json.dumps(_summary(plan)) if rec['chosen_plan'] is not None else '',
+            })
+            rich.append({
+                'query_name': rec['query_name'],
+                'chosen_pred_ms': pred,
+                'baseline_actual_ms': rec['baseline_actual_ms'],
+                'would_be_faster_than_baseline': (pred is not None and rec['baseline_actual_ms'] is not None
+                                                  and pred < rec['baseline_actual_ms']),
+                'chosen_tag': plan.get('tag'),
+                'chosen_settings': json.dumps(plan.get('settings') or {}),
+            })
+            lines.append(json.dumps({'query_name': rec['query_name'], 'chosen_pred_ms': pred,
+                                     'chosen_plan': rec['chosen_plan'], 'variant_sql': rec['variant_sql']}))
+            if self.per_file:
+                self._write_files(rec)
+
+        self._short.writerows(short)
+        self._rich.writerows(rich)
+        if lines:
+            self._jsonl.write('\n'.join(lines) + '\n')
+        for fh in self._files:
+            fh.flush()
+
+    def _write_files(self, rec):
+        safe_name = rec['query_name'].replace('/', '_').replace('\\', '_')
+        if rec['chosen_plan'] is not None:
+            with open(os.path.join(CHOSEN_DIR, f"{safe_name}.json"), 'w', encoding='utf-8') as f:
+                json.dump(rec['chosen_plan'], f, indent=2)
+        with open(os.path.join(OUT_SQL_DIR, f"{safe_name}.lcm_variant.sql"), 'w', encoding='utf-8') as f:
+            f.write(rec['variant_sql'])
+
+    def close(self):
+        for fh in self._files:
+            fh.close()
+
+
+def variant_text(qname, chosen_plan, chosen_pred, orig_sql):
+    """SQL that reproduces the LCM-chosen candidate by re-applying the planner
+    settings it was enumerated with."""
+    if orig_sql is None:
+        # no original SQL found; keep a note with the chosen plan summary
+        return (f"-- Original SQL for {qname} not found in queries/; LCM chosen plan summary:\n"
+                f"{json.dumps(_summary(chosen_plan), indent=2)}\n")
+    from plan_enumerator import variant_sql
+    header = f"-- LCM suggested variant for {qname}\n-- tag: {chosen_plan.get('tag')}\n-- chosen_pred_ms: {chosen_pred}\n\n"
+    return header + variant_sql(orig_sql, chosen_plan)
+
+
+def process_batch(scorer, chunk, pool=None):
+    """Enumerate (on `pool`, see open_pool) and score the candidates of one chunk of
+    query_metrics rows in a single batch; returns one output record per row."""
+    rows = with_query_text(chunk).to_dict('records')
+    names = [row.get('query_name') or row.get('name') or 'unknown' for row in rows]
+    sql_texts = [row['query_text'] if isinstance(row['query_text'], str) else None for row in rows]
+    with instrument.span("enumerate_candidates"):
+        candidates = build_candidates(rows, sql_texts, pool)
+    choices = scorer.choose_best_batch(candidates, sql_texts)
+
+    records = []
+    for row, qname, orig_sql, (best, best_pred) in zip(rows, names, sql_texts, choices):
         try:
             baseline_actual = float(row.get('actual_runtime_ms'))
         except Exception:
             baseline_actual = None
-
-        rich = {
+        records.append({
             'query_name': qname,
-            'chosen_pred_ms': chosen_pred,
+            'chosen_plan': best,
+            'chosen_pred_ms': best_pred,
             'baseline_actual_ms': baseline_actual,
-            'would_be_faster_than_baseline': (chosen_pred is not None and baseline_actual is not None and chosen_pred < baseline_actual)
-        }
+            'variant_sql': variant_text(qname, best or {}, best_pred, orig_sql),
+        })
+    return records
 
-        # append row to rich CSV
-        import pandas as _pd
-        _df = _pd.DataFrame([rich])
-        if os.path.exists(OUT_RICH):
-            _df.to_csv(OUT_RICH, mode='a', header=False, index=False)
-        else:
-            _df.to_csv(OUT_RICH, index=False)
 
-        print(f"Processed {qname}: chosen_pred_ms={chosen_pred}")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Choose a plan per query with the LCM and write the choices.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="query_metrics rows read, scored and written per batch")
+    parser.add_argument("--per-file", action="store_true",
+                        help="also write chosen_plans/<query>.json and generated_sql_alternatives/*.sql")
+    parser.add_argument("--no-prediction-cache", action="store_true",
+                        help="score every candidate instead of reusing predictions of equal plan fingerprints")
+    instrument.add_profile_argument(parser)
+    return parser.parse_args()
 
-        # Create an SQL variant file representing the LCM-chosen candidate.
-        chosen_plan = res.get('chosen_plan')
-        try:
-            os.makedirs(OUT_SQL_DIR, exist_ok=True)
-            # locate original SQL file in queries/ folders
-            orig_path = None
-            for sub in ('small', 'medium', 'large'):
-                p = os.path.join(ROOT, 'queries', sub, qname)
-                if os.path.exists(p):
-                    orig_path = p
-                    break
-
-            def create_variant_sql(orig_sql_text, chosen, qname):
-                # Header comment describing the LCM suggestion
-                header = f"-- LCM suggested variant for {qname}\n-- tag: {chosen.get('tag')}\n-- chosen_pred_ms: {res.get('chosen_pred_ms')}\n\n"
-                # Naive heuristic: try to reorder JOIN clauses if present
-                import re
-                m = re.search(r"FROM\s+(.*?)(WHERE|GROUP|ORDER|LIMIT|$)", orig_sql_text, flags=re.IGNORECASE | re.S)
-                if not m:
-                    return header + orig_sql_text
-                from_block = m.group(1)
-                tail = orig_sql_text[m.end(1):]
-                # split by JOIN keywords
-                parts = re.split(r"\bJOIN\b", from_block, flags=re.IGNORECASE)
-                if len(parts) <= 1:
-                    return header + orig_sql_text
-                # trim and reconstruct
-                parts = [p.strip() for p in parts if p.strip()]
-                # If cheap_variant, reverse join order to encourage different join order
-                if chosen.get('tag') == 'cheap_variant':
-                    parts = list(reversed(parts))
-                new_from = (' JOIN ').join(parts)
-                # rebuild SQL
-                new_sql = re.sub(re.escape(from_block), new_from, orig_sql_text, count=1)
-                return header + new_sql
-
-            if orig_path:
-                with open(orig_path, 'r', encoding='utf-8') as f:
-                    orig_sql = f.read()
-                variant_sql = create_variant_sql(orig_sql, chosen_plan or {}, qname)
-            else:
-                # no original SQL found; make a small SQL file containing a note
-                variant_sql = f"-- Original SQL for {qname} not found in queries/; LCM chosen plan summary:\n{json.dumps(chosen_plan, indent=2)}\n"
-
-            safe_name = qname.replace('/', '_').replace('\\', '_')
-            out_sql_path = os.path.join(OUT_SQL_DIR, f"{safe_name}.lcm_variant.sql")
-            with open(out_sql_path, 'w', encoding='utf-8') as f:
-                f.write(variant_sql)
-        except Exception:
-            # do not fail the whole run for SQL writing errors; just continue
-            pass
 
-    print(f"Wrote generated plan choices to {OUT_CSV} and rich CSV to {OUT_RICH}")
+def main():
+    args = parse_args()
+    instrument.configure(args.profile)
+    if not metrics_store.exists('query_metrics'):
+        raise FileNotFoundError("Query metrics missing under results/. Run query collection first.")
+
+    # Ensure a model exists; if not, train quickly using the data we have
+    try:
+        m = load_model()
+    except Exception:
+        print("No LCM found — training a quick model from available data...")
+        train_and_save(with_query_text(metrics_store.read_table('query_metrics', columns=TRAINING_COLUMNS,
+                                                                with_plans=True)), overwrite=True)
+        m = load_model()
+
+    scorer = PlanScorer(m, cache=None if args.no_prediction_cache else prediction_cache())
+    writer = ChoiceWriter(per_file=args.per_file)
+    pool = open_pool()
+    processed = 0
+    try:
+        for chunk in metrics_store.iter_table('query_metrics', columns=TRAINING_COLUMNS,
+                                              with_plans=True, batch_size=args.batch_size):
+            writer.write_batch(process_batch(scorer, chunk, pool))
+            processed += len(chunk)
+            print(f"Processed {processed} queries")
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.closeall()
+
+    print(f"Wrote generated plan choices to {OUT_CSV}, rich CSV to {OUT_RICH} and chosen plans to {OUT_JSONL}")
+    if scorer.cache is not None:
+        st = scorer.cache.stats()
+        print(f"Prediction cache: {st['hits']} hits, {st['misses']} misses, {st['entries']} entries")
 
 
 if __name__ == '__main__':
@@ -1,28 +1,41 @@
-"""Generate per-query comparison between Baseline, LCM and Hybrid and produce a static HTML report."""
+"""Generate per-query comparison between Baseline, LCM and Hybrid and produce a static HTML report.
+
+index.html only inlines the summary; the per-query rows and their plans are
+written in pages of PAGE_SIZE queries under results/website/data/ and loaded
+by the page on demand, so the report opens in the same time for any workload size.
+"""
 import os
 import sys
 import json
+import shutil
+import numpy as np
 import pandas as pd
 
 # Ensure project root is importable
 ROOT = os.path.dirname(os.path.dirname(__file__))
 sys.path.insert(0, ROOT)
 
-from models import lcm as lcm_mod, hybrid as hybrid_mod
+from models import lcm as lcm_mod, hybrid as hybrid_mod, instrument
+import metrics_store
+from workload import with_query_text
+from summarize_results import comparison_summary, SUMMARY_PATH
 
 
-DATA_CSV = os.path.join(ROOT, "results", "query_metrics.csv")
-OUT_CSV = os.path.join(ROOT, "results", "query_metrics_comparison.csv")
 OUT_DIR = os.path.join(ROOT, "results", "website")
 OUT_HTML = os.path.join(OUT_DIR, "index.html")
+DATA_DIR = os.path.join(OUT_DIR, "data")
+PAGE_SIZE = 500
+# Per-query columns shown in the report (plans go to their own files)
+ROW_COLUMNS = ["query_name", "category", "actual_runtime_ms", "pred_baseline_ms", "pred_lcm_ms",
+               "pred_hybrid_ms", "chosen_pred_ms", "would_be_faster_than_baseline", "closest_model"]
 os.makedirs(OUT_DIR, exist_ok=True)
 
 
 def build_comparison():
-    if not os.path.exists(DATA_CSV):
-        raise FileNotFoundError(f"Data CSV not found at {DATA_CSV}. Run data collection first.")
+    if not metrics_store.exists("query_metrics"):
+        raise FileNotFoundError("Query metrics not found under results/. Run data collection first.")
 
-    df = pd.read_csv(DATA_CSV)
+    df = with_query_text(metrics_store.read_table("query_metrics", columns=lcm_mod.TRAINING_COLUMNS, with_plans=True))
 
     # Load models
     # Baseline and selector are loaded via hybrid.load_hybrid(); it will also try to load LCM
@@ -44,8 +57,8 @@ def build_comparison():
     except Exception:
         X_feat = df[["join_count", "estimated_cost", "estimated_rows"]].fillna(0)
 
-    lcm_pred = lcm_model.predict(X_feat)
-    hybrid_pred = hybrid_mod.predict_hybrid(df)
+    lcm_pred = lcm_model.predict(lcm_mod.align_features(lcm_model, X_feat))
+    hybrid_pred = hybrid_mod.predict_hybrid(df, X_feat)
 
     # Build comparison DataFrame
     comp = df.copy()
@@ -54,24 +67,24 @@ def build_comparison():
     comp["pred_hybrid_ms"] = hybrid_pred
 
     # Absolute errors
-    comp["err_baseline_ms"] = (comp["pred_baseline_ms"] - comp["actual_runtime_ms"]).abs()
-    comp["err_lcm_ms"] = (comp["pred_lcm_ms"] - comp["actual_runtime_ms"]).abs()
-    comp["err_hybrid_ms"] = (comp["pred_hybrid_ms"] - comp["actual_runtime_ms"]).abs()
+    # Timed-out (censored) queries only count predictions below their budget
+    censored = lcm_mod.get_censored(comp)
+    comp["err_baseline_ms"] = lcm_mod.censored_abs_error(comp["pred_baseline_ms"], comp["actual_runtime_ms"], censored)
+    comp["err_lcm_ms"] = lcm_mod.censored_abs_error(comp["pred_lcm_ms"], comp["actual_runtime_ms"], censored)
+    comp["err_hybrid_ms"] = lcm_mod.censored_abs_error(comp["pred_hybrid_ms"], comp["actual_runtime_ms"], censored)
 
     # Which model was closest? (ties pick the model with lowest name by alphabetical order)
-    def winner_row(r):
-        errs = {"Baseline": r.err_baseline_ms, "LCM": r.err_lcm_ms, "Hybrid": r.err_hybrid_ms}
-        return min(errs.items(), key=lambda x: (x[1], x[0]))[0]
-
-    comp["closest_model"] = comp.apply(winner_row, axis=1)
+    names = np.array(["Baseline", "Hybrid", "LCM"])
+    errs = comp[["err_baseline_ms", "err_hybrid_ms", "err_lcm_ms"]].to_numpy(dtype=np.float64)
+    comp["closest_model"] = names[np.argmin(np.nan_to_num(errs, nan=np.inf), axis=1)]
 
     # Try to merge chosen plan predictions produced by scripts/generate_plans.py
     rich_choices = os.path.join(ROOT, 'results', 'generated_plan_choices_rich.csv')
     if os.path.exists(rich_choices):
       try:
-        rc = pd.read_csv(rich_choices)
+        rc = pd.read_csv(rich_choices, usecols=['query_name', 'chosen_pred_ms', 'would_be_faster_than_baseline'])
         # merge on query_name
-        comp = comp.merge(rc[['query_name', 'chosen_pred_ms', 'would_be_faster_than_baseline']], on='query_name', how='left')
+        comp = comp.merge(rc, on='query_name', how='left')
       except Exception:
         comp['chosen_pred_ms'] = None
         comp['would_be_faster_than_baseline'] = False
@@ -79,56 +92,50 @@ def build_comparison():
       comp['chosen_pred_ms'] = None
       comp['would_be_faster_than_baseline'] = False
 
-    # Summary metrics
-    summary = {
-        "mae_baseline": comp["err_baseline_ms"].mean(),
-        "mae_lcm": comp["err_lcm_ms"].mean(),
-        "mae_hybrid": comp["err_hybrid_ms"].mean(),
-      "winner_counts": comp["closest_model"].value_counts().to_dict()
-    }
-
-    # Plan-quality metrics: use chosen_pred_ms as the LCM's chosen-plan predicted runtime
-    # Average chosen predicted runtime (where available)
-    try:
-      chosen_mean = comp['chosen_pred_ms'].dropna().astype(float).mean()
-    except Exception:
-      chosen_mean = None
-
-    # Count where the LCM chosen-plan prediction is (predicted) faster than the
-    # baseline actual runtime
-    try:
-      lcm_better_count = int(comp[comp['would_be_faster_than_baseline'] == True].shape[0])
-    except Exception:
-      lcm_better_count = 0
-
-    # Count where Hybrid predicted runtime is less than baseline actual runtime
-    try:
-      hybrid_better_count = int((comp['pred_hybrid_ms'] < comp['actual_runtime_ms']).sum())
-    except Exception:
-      hybrid_better_count = 0
-
-    # Add plan-quality metrics into summary
-    summary['chosen_pred_mean_ms'] = chosen_mean
-    summary['lcm_predicted_better_count'] = lcm_better_count
-    summary['hybrid_predicted_better_count'] = hybrid_better_count
-
-    comp.to_csv(OUT_CSV, index=False)
-    print(f"Wrote comparison CSV to {OUT_CSV}")
-
-    # Write a self-contained HTML report embedding the JSON data
-    rows = comp.to_dict(orient="records")
-    html = render_html(rows, summary)
-    with open(OUT_HTML, "w", encoding="utf-8") as f:
-        f.write(html)
-    print(f"Wrote website to {OUT_HTML}")
-
-
-def render_html(rows, summary):
-    # Escape JSON
-    data_json = json.dumps(rows)
+    # Summary metrics (MAE, plan-quality counts, per category) in one pass
+    summary = comparison_summary(comp)
+    summary["winner_counts"] = {k: int(v) for k, v in comp["closest_model"].value_counts().items()}
+
+    out_path = metrics_store.write_table(comp, "query_metrics_comparison")
+    print(f"Wrote comparison table to {out_path}")
+    with open(SUMMARY_PATH, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    # Small index.html plus paged per-query data and plans it loads on demand
+    with instrument.span("write.website"):
+        pages = write_pages(comp)
+        with open(OUT_HTML, "w", encoding="utf-8") as f:
+            f.write(render_html(summary, pages))
+    print(f"Wrote website to {OUT_HTML} ({len(comp)} queries in {pages} pages under {DATA_DIR})")
+
+
+def write_pages(comp, page_size=PAGE_SIZE):
+    """Write data/rows_NNNN.js and data/plans_NNNN.js (JSONP, so the report also works
+    from file://) for every page of `page_size` queries; returns the page count."""
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+    os.makedirs(DATA_DIR, exist_ok=True)
+    table = comp[[c for c in ROW_COLUMNS if c in comp.columns]]
+    plans = comp["plan_json"] if "plan_json" in comp.columns else None
+    n_pages = max(1, -(-len(comp) // page_size))
+    for page in range(n_pages):
+        lo, hi = page * page_size, (page + 1) * page_size
+        with open(os.path.join(DATA_DIR, f"rows_{page:04d}.js"), "w", encoding="utf-8") as f:
+            f.write(f"reportRows({page}, {table.iloc[lo:hi].to_json(orient='records')});\n")
+        if plans is None:
+            continue
+        # Plans are already JSON text: concatenate them instead of parsing and re-encoding
+        entries = [f"{json.dumps(name)}: {plan}"
+                   for name, plan in zip(comp["query_name"].iloc[lo:hi], plans.iloc[lo:hi])
+                   if isinstance(plan, str) and plan]
+        with open(os.path.join(DATA_DIR, f"plans_{page:04d}.js"), "w", encoding="utf-8") as f:
+            f.write(f"reportPlans({page}, {{{', '.join(entries)}}});\n")
+    return n_pages
+
+
+def render_html(summary, pages):
     summary_json = json.dumps(summary)
 
-    # Minimal HTML with embedded data and Chart.js for simple plotting
+    # Minimal HTML with the summary inline; per-query rows and plans are loaded page by page
     html_template = """
 <!doctype html>
 <html>
@@ -136,11 +143,12 @@ def render_html(rows, summary):
   <meta charset="utf-8" />
   <title>Query Runtime Prediction Comparison</title>
   <style>
-    body {{ font-family: Arial, sans-serif; margin: 20px; }}
-    table {{ border-collapse: collapse; width: 100%; margin-top: 12px; }}
-    th, td {{ border: 1px solid #ddd; padding: 8px; font-size: 13px; }}
-    th {{ background: #f4f4f4; }}
-    .small {{ font-size: 12px; color: #555; }}
+    body { font-family: Arial, sans-serif; margin: 20px; }
+    table { border-collapse: collapse; width: 100%; margin-top: 12px; }
+    th, td { border: 1px solid #ddd; padding: 8px; font-size: 13px; }
+    th { background: #f4f4f4; }
+    .small { font-size: 12px; color: #555; }
+    pre { background: #f8f8f8; padding: 8px; max-height: 400px; overflow: auto; font-size: 11px; }
   </style>
 </head>
 <body>
@@ -154,6 +162,11 @@ def render_html(rows, summary):
   <canvas id="maeChart" width="600" height="250"></canvas>
 
   <h2>Per-query results</h2>
+  <div class="small">
+    <button id="prev">&laquo; prev</button>
+    <span id="pageInfo"></span>
+    <button id="next">next &raquo;</button>
+  </div>
   <table id="results">
     <thead>
       <tr>
@@ -166,15 +179,19 @@ def render_html(rows, summary):
         <th>chosen_pred_ms</th>
         <th>lcm_would_be_faster</th>
         <th>closest_model</th>
+        <th>plan</th>
       </tr>
     </thead>
     <tbody></tbody>
   </table>
+  <pre id="plan" hidden></pre>
 
     <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
   <script>
-    const rows = __DATA_JSON__;
     const summary = __SUMMARY_JSON__;
+    const pageCount = __PAGE_COUNT__;
+    const pages = {}, planPages = {};
+    let current = 0;
 
     // Fill summary
     const sDiv = document.getElementById('summary');
@@ -182,26 +199,72 @@ def render_html(rows, summary):
     if (summary.chosen_pred_mean_ms != null) {
       planLine = `<p class='small'><strong>LCM chosen-plan predicted mean</strong>: ${summary.chosen_pred_mean_ms.toFixed(2)} ms; <strong>LCM predicted better count</strong>: ${summary.lcm_predicted_better_count}; <strong>Hybrid predicted better count</strong>: ${summary.hybrid_predicted_better_count}.</p>`;
     }
-    sDiv.innerHTML = `<p class='small'><strong>MAE</strong> — Baseline: ${summary.mae_baseline.toFixed(2)} ms; LCM: ${summary.mae_lcm.toFixed(2)} ms; Hybrid: ${summary.mae_hybrid.toFixed(2)} ms.</p>`
+    sDiv.innerHTML = `<p class='small'><strong>Queries</strong>: ${summary.n_queries}; <strong>MAE</strong> — Baseline: ${summary.mae_baseline.toFixed(2)} ms; LCM: ${summary.mae_lcm.toFixed(2)} ms; Hybrid: ${summary.mae_hybrid.toFixed(2)} ms.</p>`
       + `<p class='small'><strong>Winner counts</strong> — ` + Object.entries(summary.winner_counts).map(kv => `${kv[0]}: ${kv[1]}`).join(', ') + `</p>`
       + planLine;
 
-    // Fill table
-    const tbody = document.querySelector('#results tbody');
-    rows.forEach(r => {
-      const tr = document.createElement('tr');
-      tr.innerHTML = `
+    // Pages are JSONP files: each calls reportRows/reportPlans when its <script> loads
+    function load(src) {
+      const s = document.createElement('script');
+      s.src = src;
+      document.body.appendChild(s);
+    }
+    function pageFile(kind, page) {
+      return `data/${kind}_${String(page).padStart(4, '0')}.js`;
+    }
+    function reportRows(page, rows) {
+      pages[page] = rows;
+      if (page === current) render();
+    }
+    function reportPlans(page, plans) {
+      planPages[page] = plans;
+      if (pendingPlan && pendingPlan.page === page) showPlan(pendingPlan.page, pendingPlan.name);
+    }
+
+    const fmt = v => v == null ? '' : Number(v).toFixed(3);
+    function render() {
+      document.getElementById('pageInfo').textContent = `page ${current + 1} of ${pageCount}`;
+      const tbody = document.querySelector('#results tbody');
+      tbody.innerHTML = '';
+      (pages[current] || []).forEach(r => {
+        const tr = document.createElement('tr');
+        tr.innerHTML = `
         <td>${r.query_name}</td>
         <td>${r.category}</td>
-        <td>${Number(r.actual_runtime_ms).toFixed(3)}</td>
-        <td>${Number(r.pred_baseline_ms).toFixed(3)}</td>
-        <td>${Number(r.pred_lcm_ms).toFixed(3)}</td>
-        <td>${Number(r.pred_hybrid_ms).toFixed(3)}</td>
-        <td>${r.chosen_pred_ms != null ? Number(r.chosen_pred_ms).toFixed(3) : ''}</td>
+        <td>${fmt(r.actual_runtime_ms)}</td>
+        <td>${fmt(r.pred_baseline_ms)}</td>
+        <td>${fmt(r.pred_lcm_ms)}</td>
+        <td>${fmt(r.pred_hybrid_ms)}</td>
+        <td>${fmt(r.chosen_pred_ms)}</td>
         <td>${r.would_be_faster_than_baseline ? 'yes' : 'no'}</td>
-        <td>${r.closest_model}</td>`;
-      tbody.appendChild(tr);
-    });
+        <td>${r.closest_model}</td>
+        <td><a href="#plan">show</a></td>`;
+        tr.querySelector('a').onclick = () => showPlan(current, r.query_name);
+        tbody.appendChild(tr);
+      });
+    }
+    function goTo(page) {
+      current = Math.max(0, Math.min(pageCount - 1, page));
+      if (pages[current]) render(); else load(pageFile('rows', current));
+    }
+
+    let pendingPlan = null;
+    function showPlan(page, name) {
+      const pre = document.getElementById('plan');
+      if (!planPages[page]) {
+        pendingPlan = {page, name};
+        load(pageFile('plans', page));
+        return;
+      }
+      pendingPlan = null;
+      const plan = planPages[page][name];
+      pre.textContent = plan ? `${name}\n` + JSON.stringify(plan, null, 2) : `${name}: no plan recorded`;
+      pre.hidden = false;
+    }
+
+    document.getElementById('prev').onclick = () => goTo(current - 1);
+    document.getElementById('next').onclick = () => goTo(current + 1);
+    goTo(0);
 
     // MAE chart
     const ctx = document.getElementById('maeChart').getContext('2d');
@@ -223,7 +286,7 @@ def render_html(rows, summary):
 """
 
     # Replace placeholders with JSON content
-    return html_template.replace("__DATA_JSON__", data_json).replace("__SUMMARY_JSON__", summary_json)
+    return html_template.replace("__SUMMARY_JSON__", summary_json).replace("__PAGE_COUNT__", str(pages))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,272 @@
+"""Synthetic join workload generator.
+
+Parses `tables.sql`, builds the foreign-key graph of the schema and writes
+random, valid select-project-join queries in the layout the collector reads:
+
+    <out>/small/gen_small_q0001.sql, <out>/medium/..., <out>/large/...
+
+Only two foreign keys are declared in `tables.sql`, so the graph also contains
+the implicit ones the hand-written queries join on (KEY_RULES): `game_id` ->
+game, team id columns -> team, player/person id columns -> player.
+
+Per query the generator controls:
+- the join count, drawn from GENERATED_JOIN_RANGES[category]; each join adds a
+  table adjacent to the ones already chosen, and with probability
+  `--cycle-prob` one extra key predicate closes a cycle in the join graph
+- filter selectivity: with a catalog snapshot (scripts/catalog_snapshot.py)
+  range filters are placed on pg_stats histogram bounds so each one keeps
+  about the requested fraction of its table; without one, filters are
+  IS NOT NULL checks
+- aggregates (MIN/MAX/AVG/COUNT in the select list) and, with
+  `--group-by-prob`, a GROUP BY on a low-cardinality column
+
+Run the collector on the result with:
+
+    python scripts/generate_workload.py --count 1000
+    python scripts/run_queries_baseline.py --query-dir queries_generated
+"""
+import os
+import re
+import sys
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import GENERATED_QUERY_DIR, GENERATED_JOIN_RANGES
+from models.catalog import load_catalog
+
+
+SCHEMA_PATH = os.path.join(ROOT, "tables.sql")
+
+# Implicit foreign keys: (column pattern, referenced table, referenced column)
+KEY_RULES = [
+    (re.compile(r"^game_id$"), "game", "game_id"),
+    (re.compile(r"^(team_id|team_id_home|team_id_away|home_team_id|visitor_team_id|player\d_team_id)$"), "team", "id"),
+    (re.compile(r"^(player_id|person_id|player\d_id)$"), "player", "id"),
+]
+NUMERIC_TYPES = {"INT", "INTEGER", "BIGINT", "SMALLINT", "FLOAT", "REAL", "NUMERIC", "DOUBLE"}
+AGGREGATES = ["MIN", "MAX", "AVG", "COUNT"]
+
+_CREATE_RE = re.compile(r"CREATE\s+TABLE\s+(\w+)\s*\((.*?)\);", re.I | re.S)
+_ALTER_TYPE_RE = re.compile(r"ALTER\s+TABLE\s+(?:public\.)?(\w+)(.*?);", re.I | re.S)
+_COLUMN_TYPE_RE = re.compile(r"ALTER\s+COLUMN\s+(\w+)\s+TYPE\s+(\w+)", re.I)
+
+
+def parse_schema(path=SCHEMA_PATH):
+    """{table: {column: TYPE or TYPE(n)}} and the declared (table, column, ref_table, ref_column) keys."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = re.sub(r"--[^\n]*", "", f.read())
+    tables, declared = {}, []
+    for name, body in _CREATE_RE.findall(text):
+        if re.match(r"\s*LIKE\b", body, re.I):
+            continue
+        columns = {}
+        for line in body.split(","):
+            words = line.split()
+            if len(words) < 2 or words[0].upper() in ("PRIMARY", "FOREIGN", "CONSTRAINT", "UNIQUE"):
+                continue
+            col = words[0].lower()
+            columns[col] = re.match(r"\w+(\(\d+\))?", words[1]).group().upper()
+            ref = re.search(r"REFERENCES\s+(\w+)\s*\((\w+)\)", line, re.I)
+            if ref:
+                declared.append((name.lower(), col, ref.group(1).lower(), ref.group(2).lower()))
+        tables[name.lower()] = columns
+    # Later ALTER COLUMN ... TYPE statements change the column types
+    for name, body in _ALTER_TYPE_RE.findall(text):
+        for col, typ in _COLUMN_TYPE_RE.findall(body):
+            if name.lower() in tables and col.lower() in tables[name.lower()]:
+                tables[name.lower()][col.lower()] = typ.upper()
+    return tables, declared
+
+
+def fk_edges(tables, declared):
+    """Undirected join edges (t1, c1, t2, c2) of the declared and implicit keys."""
+    edges = set(declared)
+    for table, columns in tables.items():
+        for col in columns:
+            for pattern, ref_table, ref_col in KEY_RULES:
+                if pattern.match(col) and ref_table in tables and ref_col in tables[ref_table] \
+                        and (table, col) != (ref_table, ref_col):
+                    edges.add((table, col, ref_table, ref_col))
+    return sorted(edges)
+
+
+def _alias(table, used):
+    base = "".join(w[0] for w in table.split("_"))
+    alias, i = base, 2
+    while alias in used:
+        alias, i = f"{base}{i}", i + 1
+    return alias
+
+
+def _histogram(catalog, table, column):
+    stats = catalog.columns.get(f"{table}.{column}") if catalog else None
+    bounds = (stats or {}).get("histogram_bounds")
+    if not bounds:
+        return []
+    values = []
+    for v in bounds.strip("{}").split(","):
+        try:
+            values.append(float(v.strip('"')))
+        except ValueError:
+            return []
+    return values
+
+
+def _literal(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class WorkloadGenerator:
+    def __init__(self, tables, edges, catalog=None, seed=0, cycle_prob=0.2, group_by_prob=0.2,
+                 selectivity=(0.01, 0.5), filters=(1, 3), aggregates=(1, 4)):
+        self.tables = tables
+        self.catalog = catalog
+        self.rng = random.Random(seed)
+        self.cycle_prob = cycle_prob
+        self.group_by_prob = group_by_prob
+        self.selectivity = selectivity
+        self.filters = filters
+        self.aggregates = aggregates
+        self.adjacent = {}
+        for t1, c1, t2, c2 in edges:
+            self.adjacent.setdefault(t1, []).append((c1, t2, c2))
+            self.adjacent.setdefault(t2, []).append((c2, t1, c1))
+        self.key_columns = {(t, c) for t1, c1, t2, c2 in edges for t, c in ((t1, c1), (t2, c2))}
+
+    def _join_tree(self, n_joins):
+        # Random connected walk over the key graph: each join adds one new table
+        start = self.rng.choice(sorted(self.adjacent))
+        chosen = [start]
+        joins = []
+        while len(joins) < n_joins:
+            frontier = [(t, c, t2, c2) for t in chosen for c, t2, c2 in self.adjacent[t] if t2 not in chosen]
+            if not frontier:
+                break
+            t, c, t2, c2 = self.rng.choice(frontier)
+            chosen.append(t2)
+            joins.append((t, c, t2, c2))
+        # Sometimes one extra predicate between tables already joined: a cyclic join graph
+        extra = [(t, c, t2, c2) for t in chosen for c, t2, c2 in self.adjacent[t]
+                 if t2 in chosen and (t, c, t2, c2) not in joins and (t2, c2, t, c) not in joins and t < t2]
+        if extra and self.rng.random() < self.cycle_prob:
+            joins.append(self.rng.choice(extra))
+        return chosen, joins
+
+    def _filter(self, alias, table):
+        numeric = [c for c, typ in self.tables[table].items()
+                   if typ in NUMERIC_TYPES and (table, c) not in self.key_columns]
+        target = self.rng.uniform(*self.selectivity)
+        for col in self.rng.sample(numeric, len(numeric)):
+            bounds = _histogram(self.catalog, table, col)
+            if len(bounds) >= 3:
+                # Histogram buckets hold equal fractions of the non-MCV rows
+                value = bounds[min(int((1.0 - target) * (len(bounds) - 1)), len(bounds) - 1)]
+                return f"{alias}.{col} > {_literal(value)}", target
+        col = self.rng.choice(sorted(self.tables[table]))
+        return f"{alias}.{col} IS NOT NULL", None
+
+    def _group_column(self, aliases):
+        if not self.catalog:
+            return None
+        options = [(a, c) for a, t in aliases.items() for c in self.tables[t]
+                   if 1 < self.catalog.n_distinct(t, c) <= 100]
+        return self.rng.choice(options) if options else None
+
+    def query(self, n_joins):
+        chosen, joins = self._join_tree(n_joins)
+        aliases = {}
+        for t in chosen:
+            aliases[_alias(t, aliases)] = t
+        alias_of = {t: a for a, t in aliases.items()}
+
+        predicates = [f"{alias_of[t]}.{c} = {alias_of[t2]}.{c2}" for t, c, t2, c2 in joins]
+        selectivities = []
+        for a in self.rng.sample(list(aliases), min(len(aliases), self.rng.randint(*self.filters))):
+            pred, sel = self._filter(a, aliases[a])
+            predicates.append(pred)
+            selectivities.append(sel)
+
+        select = []
+        for i in range(self.rng.randint(*self.aggregates)):
+            a = self.rng.choice(list(aliases))
+            func = self.rng.choice(AGGREGATES)
+            if func == "COUNT":
+                select.append(f"COUNT(*) AS agg_{i}")
+                continue
+            # MIN/MAX take any ordered type (not boolean), AVG only numbers
+            columns = [c for c, typ in self.tables[aliases[a]].items()
+                       if typ in NUMERIC_TYPES or (func in ("MIN", "MAX") and typ != "BOOLEAN")]
+            select.append(f"{func}({a}.{self.rng.choice(columns)}) AS agg_{i}")
+
+        group = self._group_column(aliases) if self.rng.random() < self.group_by_prob else None
+        if group:
+            select.insert(0, f"{group[0]}.{group[1]}")
+
+        sql = "SELECT " + ",\n       ".join(select)
+        sql += "\nFROM " + ",\n     ".join(f"{t} AS {a}" for a, t in aliases.items())
+        if predicates:
+            sql += "\nWHERE " + "\n  AND ".join(predicates)
+        if group:
+            sql += f"\nGROUP BY {group[0]}.{group[1]}"
+        sels = ", ".join(f"{s:.3f}" for s in selectivities if s is not None) or "n/a"
+        header = f"-- generated: joins={len(chosen) - 1}, join_predicates={len(joins)}, filter_selectivity=[{sels}]\n"
+        return header + sql + ";\n"
+
+
+def write_workload(generator, out_dir, count, categories=GENERATED_JOIN_RANGES):
+    """Write `count` queries spread evenly over `categories`; returns {category: n}."""
+    written = {}
+    per_category = -(-count // len(categories))
+    for category, (low, high) in categories.items():
+        folder = os.path.join(out_dir, category)
+        os.makedirs(folder, exist_ok=True)
+        seen = set()
+        n = 0
+        attempts = 0
+        while n < per_category and attempts < per_category * 20:
+            attempts += 1
+            text = generator.query(generator.rng.randint(low, high))
+            if text in seen:
+                continue
+            seen.add(text)
+            n += 1
+            with open(os.path.join(folder, f"gen_{category}_q{n:04d}.sql"), "w", encoding="utf-8") as f:
+                f.write(text)
+        written[category] = n
+    return written
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a synthetic join workload from the schema's key graph.")
+    parser.add_argument("--count", type=int, default=1000, help="total queries, split evenly over the categories")
+    parser.add_argument("--out", default=GENERATED_QUERY_DIR, help="output workload folder")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cycle-prob", type=float, default=0.2,
+                        help="probability that a query gets one extra key predicate closing a join cycle")
+    parser.add_argument("--group-by-prob", type=float, default=0.2)
+    parser.add_argument("--min-selectivity", type=float, default=0.01)
+    parser.add_argument("--max-selectivity", type=float, default=0.5)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    tables, declared = parse_schema()
+    edges = fk_edges(tables, declared)
+    catalog = load_catalog()
+    if catalog is None:
+        print("No catalog snapshot (run scripts/catalog_snapshot.py): filters will not be selectivity-controlled.")
+    generator = WorkloadGenerator(tables, edges, catalog, seed=args.seed, cycle_prob=args.cycle_prob,
+                                  group_by_prob=args.group_by_prob,
+                                  selectivity=(args.min_selectivity, args.max_selectivity))
+    out = args.out if os.path.isabs(args.out) else os.path.join(ROOT, args.out)
+    written = write_workload(generator, out, args.count)
+    print(f"Key graph: {len(tables)} tables, {len(edges)} edges")
+    print(f"Wrote {sum(written.values())} queries to {out} ({', '.join(f'{c}: {n}' for c, n in written.items())})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""Build query_metrics rows from PostgreSQL logs instead of re-running the queries.
+
+Two kinds of local files are read:
+
+- auto_explain logs (auto_explain.log_format = json, with log_analyze = on for
+  actual rows and times) from the stderr or jsonlog (*.json) log destinations.
+  Every logged execution carries the query text and its plan with the
+  planner's estimates and the actual time and rows.
+- pg_stat_statements snapshots: CSV dumps of the view taken periodically, e.g.
+
+      \\copy (SELECT * FROM pg_stat_statements) TO 'pgss_20240501T1200.csv' CSV HEADER
+
+  Snapshots are diffed per statement in file-name order; the calls and time
+  between them are summed per query template (models/sql_features.py) and
+  attached to the rows of that template as `calls` and `statement_mean_ms`.
+
+Files are streamed line by line: memory follows the number of distinct
+(query, plan) pairs, not the size of the logs. Executions of the same query
+text whose plans share a plan fingerprint (models/prediction_cache.py) become
+one row, whose runtime statistics come from its last INGEST_MAX_SAMPLES
+executions. Rows accumulate in INGESTED_TABLE and INGEST_STATE records how far
+every log was read and which snapshots were diffed, so a re-run only reads what
+was appended since (a rotated or truncated log is read again from the start).
+Finally the rows are merged into query_metrics, replacing the previously
+ingested rows and skipping queries the collector measured itself.
+
+    python scripts/ingest_logs.py --log /var/log/postgresql/*.log --pgss snapshots/*.csv
+"""
+import os
+import re
+import sys
+import csv
+import glob
+import json
+import argparse
+from collections import deque
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models import sql_features, instrument
+from models.prediction_cache import plan_fingerprint
+from models.lcm import get_censored
+from config import INGESTED_TABLE, INGEST_STATE, INGEST_MAX_SAMPLES, GENERATED_JOIN_RANGES
+from result_cache import query_hash
+from run_queries_baseline import summarize_samples, CATEGORIES
+import metrics_store
+
+
+SOURCE = "auto_explain"
+
+_ENTRY_RE = re.compile(r"duration: ([\d.]+) ms\s+plan:\s*(.*)$", re.S)
+_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+csv.field_size_limit(2 ** 31 - 1)
+
+
+def _resolve(path):
+    return path if os.path.isabs(path) else os.path.join(ROOT, path)
+
+
+def expand(patterns):
+    """Files matching the given paths/globs; a directory stands for the files in it."""
+    files = []
+    for pattern in patterns or ():
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if os.path.isdir(path):
+                files += sorted(os.path.join(path, f) for f in os.listdir(path)
+                                if os.path.isfile(os.path.join(path, f)))
+            elif os.path.isfile(path):
+                files.append(path)
+            else:
+                print(f"Skipping {path}: not found")
+    return [os.path.abspath(f) for f in files]
+
+
+# Join count -> collector category, using the generator's join ranges (0 joins is small)
+def category_for(joins):
+    for category, (low, high) in GENERATED_JOIN_RANGES.items():
+        if joins <= high:
+            return category
+    return CATEGORIES[-1]
+
+
+def is_select(query):
+    return sql_features.query_template(query).startswith(("select", "with"))
+
+
+def load_state(path=INGEST_STATE):
+    """Progress of earlier runs; a fresh state when `path` is None or unreadable."""
+    state = {}
+    if path:
+        try:
+            with open(_resolve(path), "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            pass
+    for key in ("logs", "statements", "templates"):
+        state.setdefault(key, {})
+    state.setdefault("snapshots", [])
+    return state
+
+
+def save_state(state, path=INGEST_STATE):
+    path = _resolve(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+class Ingestor:
+    """Accumulates logged executions into one row per (query_hash, plan fingerprint)."""
+
+    def __init__(self, max_samples=INGEST_MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.rows = {}
+        self.samples = {}
+        self.entries = 0
+        self.skipped = 0
+
+    def load(self, df):
+        """Resume from the rows of an earlier run (INGESTED_TABLE read with its plans)."""
+        for row in df.to_dict("records"):
+            key = (row["query_hash"], row["plan_fingerprint"])
+            self.rows[key] = row
+            self.samples[key] = deque(json.loads(row["runtime_samples_ms"]), maxlen=self.max_samples)
+
+    def add(self, duration, entry):
+        query = entry.get("Query Text")
+        plan = entry.get("Plan")
+        if not isinstance(query, str) or not isinstance(plan, dict) or not is_select(query):
+            self.skipped += 1
+            return
+        self.entries += 1
+        query = query.strip()
+        explain = {k: v for k, v in entry.items() if k != "Query Text"}
+        joins = sql_features.template_features(query)["n_joins"]
+        estimates = {"join_count": joins, "estimated_cost": plan.get("Total Cost"),
+                     "estimated_rows": plan.get("Plan Rows")}
+        qhash = query_hash(query)
+        fingerprint = plan_fingerprint(dict(estimates, plan_json=explain))
+        key = (qhash, fingerprint)
+
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = {
+                "query_name": f"log_{qhash[:12]}_{fingerprint[:6]}",
+                "category": category_for(joins),
+                "query_hash": qhash,
+                "query_template": sql_features.template_fingerprint(query),
+                "query_text": query,
+                "executions": 0,
+            }
+            self.samples[key] = deque(maxlen=self.max_samples)
+        # Estimates and plan of the latest execution; its time is one more sample
+        row.update(estimates, actual_rows=plan.get("Actual Rows"), plan_json=json.dumps(explain))
+        row["executions"] += 1
+        self.samples[key].append(float(plan.get("Actual Total Time", duration)))
+
+    def frame(self, templates=None):
+        """The rows in query_metrics layout, with the pg_stat_statements totals of their template."""
+        templates = templates or {}
+        out = []
+        for key, row in self.rows.items():
+            samples = list(self.samples[key])
+            stats = summarize_samples(samples)
+            calls, total_ms, _ = templates.get(row["query_template"], (0, 0.0, 0))
+            out.append({
+                "query_name": row["query_name"],
+                "category": row["category"],
+                "query_hash": row["query_hash"],
+                "query_template": row["query_template"],
+                "query_text": row["query_text"],
+                "estimated_cost": row["estimated_cost"],
+                "estimated_rows": row["estimated_rows"],
+                "actual_runtime_ms": stats["median"],
+                "actual_rows": row["actual_rows"],
+                "join_count": row["join_count"],
+                "execution_time_sec": stats["median"] / 1000.0,   # server-side only, no client round trip
+                "runtime_median_ms": stats["median"],
+                "runtime_p95_ms": stats["p95"],
+                "runtime_stddev_ms": stats["stddev"],
+                "runtime_samples_ms": json.dumps(samples),
+                "warmup_runs": 0,
+                "timed_runs": len(samples),
+                "cache_mode": "production",
+                "timeout_ms": None,
+                "censored": False,
+                "plan_json": row["plan_json"],
+                "source": SOURCE,
+                "plan_fingerprint": key[1],
+                "executions": row["executions"],
+                "calls": calls or None,
+                "statement_mean_ms": total_ms / calls if calls else None,
+            })
+        order = {c: i for i, c in enumerate(CATEGORIES)}
+        out.sort(key=lambda r: (order.get(r["category"], len(order)), r["query_name"]))
+        return pd.DataFrame(out)
+
+
+def _depth(text):
+    # Brace balance of one line of JSON, ignoring braces inside strings
+    text = _STRING_RE.sub("", text)
+    return text.count("{") - text.count("}")
+
+
+def _add_entry(ingestor, duration, body):
+    try:
+        entry = json.loads(body)
+    except ValueError:
+        ingestor.skipped += 1
+        return
+    if isinstance(entry, dict):
+        ingestor.add(duration, entry)
+
+
+@instrument.timed("ingest.log")
+def read_log(path, offset, ingestor):
+    """Feed every complete auto_explain entry after byte `offset` of `path` to the ingestor;
+    returns the offset up to which the file was consumed (an entry still being written is
+    left for the next run)."""
+    jsonlog = path.endswith(".json")
+    done = offset
+    with open(path, "rb") as f:
+        f.seek(offset)
+        duration, parts, depth, opened = None, None, 0, False
+        for line in iter(f.readline, b""):
+            if not line.endswith(b"\n"):
+                break
+            text = line.decode("utf-8", "replace")
+            if jsonlog:
+                # One JSON object per line, the plan is inside its message
+                try:
+                    record = json.loads(text)
+                except ValueError:
+                    record = None
+                m = _ENTRY_RE.search(record.get("message") or "") if isinstance(record, dict) else None
+                if m:
+                    _add_entry(ingestor, float(m.group(1)), m.group(2))
+                done = f.tell()
+                continue
+
+            # stderr: "... duration: 1.234 ms  plan:" followed by the pretty-printed JSON
+            if parts is None:
+                m = _ENTRY_RE.search(text)
+                if not m:
+                    done = f.tell()
+                    continue
+                duration, parts, depth, opened = float(m.group(1)), [], 0, False
+                text = m.group(2)
+            parts.append(text)
+            depth += _depth(text)
+            opened = opened or "{" in text
+            if opened and depth <= 0:
+                _add_entry(ingestor, duration, "".join(parts))
+                parts = None
+                done = f.tell()
+    return done
+
+
+def ingest_logs(paths, state, ingestor):
+    logs = state["logs"]
+    for path in paths:
+        st = os.stat(path)
+        seen = logs.get(path)
+        offset = seen["offset"] if seen and seen["inode"] == st.st_ino and seen["offset"] <= st.st_size else 0
+        if offset == st.st_size:
+            continue
+        before = ingestor.entries
+        logs[path] = {"inode": st.st_ino, "offset": read_log(path, offset, ingestor)}
+        print(f"{os.path.basename(path)}: {ingestor.entries - before} plans from byte {offset}")
+
+
+@instrument.timed("ingest.snapshot")
+def ingest_snapshot(path, state):
+    """Add the calls and time since the previous snapshot of every statement to its template."""
+    statements, templates = state["statements"], state["templates"]
+    changed = 0
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for rec in csv.DictReader(f):
+            query = rec.get("query") or ""
+            if not query or not is_select(query):
+                continue
+            key = ":".join(rec.get(c) or "" for c in ("userid", "dbid", "queryid")) or query_hash(query)
+            total = rec.get("total_exec_time") or rec.get("total_time") or 0
+            current = [int(float(rec.get("calls") or 0)), float(total), int(float(rec.get("rows") or 0))]
+            previous = statements.get(key)
+            # Counters only grow until pg_stat_statements_reset(): then the snapshot is the delta
+            if previous is None or current[0] < previous[0]:
+                delta = current
+            else:
+                delta = [c - p for c, p in zip(current, previous)]
+            statements[key] = current
+            if delta[0] <= 0:
+                continue
+            fp = sql_features.template_fingerprint(query)
+            acc = templates.get(fp, [0, 0.0, 0])
+            templates[fp] = [a + d for a, d in zip(acc, delta)]
+            changed += 1
+    state["snapshots"].append(path)
+    print(f"{os.path.basename(path)}: {changed} statements executed since the previous snapshot")
+
+
+def _with_columns_of(frame, other):
+    """`frame` plus the columns only `other` has, typed like them: False for flags
+    (a collected row is an exact label), NaN for numbers, None otherwise."""
+    frame = frame.copy()
+    for col in other.columns.difference(frame.columns, sort=False):
+        if pd.api.types.is_bool_dtype(other[col]):
+            frame[col] = False
+        elif pd.api.types.is_numeric_dtype(other[col]):
+            frame[col] = float("nan")
+        else:
+            frame[col] = None
+    return frame
+
+
+def merge_into(ingested, table="query_metrics"):
+    """Replace the ingested rows of `table` with `ingested`; queries collected by
+    run_queries_baseline keep their measured row. Returns (rows written, rows skipped)."""
+    if not metrics_store.exists(table):
+        metrics_store.write_table(ingested, table)
+        return len(ingested), 0
+    metrics = metrics_store.read_table(table, with_plans=True)
+    if "source" in metrics.columns:
+        metrics = metrics[metrics["source"] != SOURCE]
+    new = ingested[~ingested["query_hash"].isin(metrics.get("query_hash", pd.Series(dtype=object)))]
+    metrics = metrics.drop(columns=["plan_hash"], errors="ignore")
+    merged = pd.concat([_with_columns_of(metrics, new), _with_columns_of(new, metrics)], ignore_index=True)
+    if "censored" in merged.columns:
+        merged["censored"] = merged["censored"].fillna(False).astype(bool)
+    metrics_store.write_table(merged, table)
+    # Round trip: every row must read back with the censoring it was written with
+    stored = get_censored(metrics_store.read_table(table, columns=["censored"]))
+    if not (stored == get_censored(merged)).all():
+        raise RuntimeError(f"{table}: censored flags changed when written; labels would be corrupted")
+    return len(new), len(ingested) - len(new)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build query_metrics rows from auto_explain logs and "
+                                                 "pg_stat_statements snapshots without re-running queries.")
+    parser.add_argument("--log", nargs="*", default=[],
+                        help="auto_explain log files, globs or folders (stderr format, or jsonlog *.json)")
+    parser.add_argument("--pgss", nargs="*", default=[],
+                        help="pg_stat_statements CSV snapshots, diffed in file-name order")
+    parser.add_argument("--table", default="query_metrics",
+                        help="table the ingested rows are merged into")
+    parser.add_argument("--no-merge", action="store_true",
+                        help=f"only update {INGESTED_TABLE}, leave the merge target untouched")
+    parser.add_argument("--reset", action="store_true",
+                        help="forget earlier runs and read every file from the start")
+    instrument.add_profile_argument(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    instrument.configure(args.profile)
+    state = load_state(None if args.reset else INGEST_STATE)
+    ingestor = Ingestor()
+    if not args.reset and metrics_store.exists(INGESTED_TABLE):
+        ingestor.load(metrics_store.read_table(INGESTED_TABLE, with_plans=True))
+
+    ingest_logs(expand(args.log), state, ingestor)
+    for path in expand(args.pgss):
+        if path not in state["snapshots"]:
+            ingest_snapshot(path, state)
+
+    df = ingestor.frame(state["templates"])
+    print(f"{ingestor.entries} new plans ({ingestor.skipped} entries skipped), "
+          f"{len(df)} distinct query/plan rows")
+    if df.empty:
+        save_state(state)
+        return
+    path = metrics_store.write_table(df, INGESTED_TABLE)
+    print(f"Ingested rows saved to {path}")
+    if not args.no_merge:
+        written, skipped = merge_into(df, args.table)
+        print(f"Merged {written} rows into {args.table} ({skipped} already collected by the baseline run)")
+    # Only once the rows are stored: a failed run re-reads the same bytes next time
+    save_state(state)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Columnar storage for the result tables.
+
+Tables such as `query_metrics` and `query_metrics_comparison` are stored as
+Parquet files under `results/` with typed numeric columns. The multi-KB
+`plan_json` text is not stored in them: each row keeps a `plan_hash` and the
+plans live once per hash in a content-addressed blob dataset
+(`results/plans/part-*.parquet`), appended to as new plans appear.
+
+Readers ask only for the columns they need (`read_table(name, columns=...)`)
+and for the plans only when they use them (`with_plans=True`), so load time
+and memory follow the projection, not the corpus size.
+
+pyarrow is optional: without it, or for tables that only exist as the legacy
+`results/<name>.csv`, the same calls read and write CSV.
+"""
+import os
+import sys
+import glob
+import uuid
+import hashlib
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.dataset as pads
+except ImportError:
+    pa = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models import instrument
+
+RESULTS = os.path.join(ROOT, 'results')
+PLANS_DIR = os.path.join(RESULTS, 'plans')
+
+
+def table_paths(name):
+    return os.path.join(RESULTS, f"{name}.parquet"), os.path.join(RESULTS, f"{name}.csv")
+
+
+def exists(name):
+    return any(os.path.exists(p) for p in table_paths(name))
+
+
+def plan_hash(plan_json):
+    return hashlib.sha1(plan_json.encode('utf-8')).hexdigest()
+
+
+def _stored_hashes():
+    if not os.path.isdir(PLANS_DIR) or not glob.glob(os.path.join(PLANS_DIR, '*.parquet')):
+        return set()
+    return set(pads.dataset(PLANS_DIR, format='parquet').to_table(columns=['plan_hash'])
+               .column('plan_hash').to_pylist())
+
+
+def write_plans(plans):
+    """Add {plan_hash: plan_json} blobs that are not stored yet as a new part file."""
+    stored = _stored_hashes()
+    new = {h: p for h, p in plans.items() if h not in stored}
+    if not new:
+        return 0
+    os.makedirs(PLANS_DIR, exist_ok=True)
+    part = pa.table({'plan_hash': list(new.keys()), 'plan_json': list(new.values())})
+    pq.write_table(part, os.path.join(PLANS_DIR, f"part-{uuid.uuid4().hex}.parquet"))
+    return len(new)
+
+
+def read_plans(hashes):
+    """Return {plan_hash: plan_json} for the requested hashes only."""
+    hashes = [h for h in set(hashes) if isinstance(h, str)]
+    if not hashes or not os.path.isdir(PLANS_DIR):
+        return {}
+    ds = pads.dataset(PLANS_DIR, format='parquet')
+    tbl = ds.to_table(filter=pads.field('plan_hash').isin(hashes))
+    return dict(zip(tbl.column('plan_hash').to_pylist(), tbl.column('plan_json').to_pylist()))
+
+
+def _missing(v):
+    return v is None or (pd.api.types.is_scalar(v) and pd.isna(v))
+
+
+def _storable(col):
+    """An object column as Parquet stores it. Missing values stay missing (None);
+    flag and number columns that only became object through their NaNs keep their
+    values; anything else structured (JSON, lists) is stored as its string."""
+    present = col[~col.map(_missing)]
+    if present.empty:
+        return col.map(lambda v: None)
+    if present.map(pd.api.types.is_bool).all():
+        return col.map(lambda v: None if _missing(v) else bool(v))
+    if present.map(pd.api.types.is_number).all():
+        return pd.to_numeric(col.map(lambda v: None if _missing(v) else v))
+    return col.map(lambda v: None if _missing(v) else v if isinstance(v, str) else str(v))
+
+
+@instrument.timed("write.table")
+def write_table(df, name, csv=False):
+    """Store `df` as table `name`; `plan_json` goes to the blob store as `plan_hash`.
+
+    Falls back to `results/<name>.csv` when pyarrow is missing; `csv=True` also
+    writes the legacy CSV (with the plans inlined) next to the Parquet file.
+    """
+    parquet_path, csv_path = table_paths(name)
+    os.makedirs(RESULTS, exist_ok=True)
+    if pa is None or csv:
+        df.to_csv(csv_path, index=False)
+        if pa is None:
+            return csv_path
+
+    out = df.copy()
+    if 'plan_json' in out.columns:
+        plans = out['plan_json'].where(out['plan_json'].map(lambda p: isinstance(p, str)), None)
+        out['plan_hash'] = plans.map(lambda p: plan_hash(p) if p is not None else None)
+        write_plans({h: p for h, p in zip(out['plan_hash'], plans) if h is not None})
+        out = out.drop(columns=['plan_json'])
+    for col in out.columns[out.dtypes == object]:
+        out[col] = _storable(out[col])
+    out.to_parquet(parquet_path, index=False)
+    return parquet_path
+
+
+def _parquet_columns(parquet_path, columns, with_plans):
+    if columns is None:
+        return None
+    available = set(pq.read_schema(parquet_path).names)
+    wanted = [c for c in columns if c in available]
+    if with_plans and 'plan_hash' in available and 'plan_hash' not in wanted:
+        wanted.append('plan_hash')
+    return wanted
+
+
+def _csv_usecols(csv_path, columns, with_plans):
+    if columns is None:
+        return None
+    header = pd.read_csv(csv_path, nrows=0).columns
+    wanted = list(columns) + (['plan_json'] if with_plans else [])
+    return [c for c in header if c in wanted]
+
+
+@instrument.timed("read.plans")
+def _attach_plans(df):
+    if 'plan_hash' in df.columns:
+        blobs = read_plans(df['plan_hash'])
+        df['plan_json'] = df['plan_hash'].map(blobs)
+    return df
+
+
+@instrument.timed("read.table")
+def read_table(name, columns=None, with_plans=False):
+    """Read table `name`, projecting to `columns` (None = all stored columns).
+
+    `with_plans=True` adds a `plan_json` column resolved from the blob store.
+    Requested columns that the table does not have are simply absent.
+    """
+    parquet_path, csv_path = table_paths(name)
+    if pa is not None and os.path.exists(parquet_path):
+        df = pd.read_parquet(parquet_path, columns=_parquet_columns(parquet_path, columns, with_plans))
+        return _attach_plans(df) if with_plans else df
+
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"Table {name} not found under {RESULTS}. Run the step that produces it first.")
+    return pd.read_csv(csv_path, usecols=_csv_usecols(csv_path, columns, with_plans))
+
+
+def iter_table(name, columns=None, with_plans=False, batch_size=1000):
+    """Like `read_table`, but yields DataFrames of at most `batch_size` rows.
+
+    Only one batch (and, with `with_plans=True`, only that batch's plans) is
+    held in memory at a time.
+    """
+    parquet_path, csv_path = table_paths(name)
+    if pa is not None and os.path.exists(parquet_path):
+        pf = pq.ParquetFile(parquet_path)
+        for batch in pf.iter_batches(batch_size=batch_size,
+                                     columns=_parquet_columns(parquet_path, columns, with_plans)):
+            df = batch.to_pandas()
+            yield _attach_plans(df) if with_plans else df
+        return
+
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"Table {name} not found under {RESULTS}. Run the step that produces it first.")
+    yield from pd.read_csv(csv_path, usecols=_csv_usecols(csv_path, columns, with_plans), chunksize=batch_size)
@@ -0,0 +1,107 @@
+"""Enumerate real alternative plans for a query through planner settings.
+
+For every entry of CANDIDATE_SETTINGS the settings are applied with SET LOCAL
+inside a transaction, the query is planned with EXPLAIN (FORMAT JSON) and the
+transaction is rolled back. Plans with the same tree shape are kept once, so
+each candidate is a plan postgres can actually execute; re-applying its
+`settings` reproduces it.
+"""
+import os
+import sys
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2 import sql
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import CANDIDATE_SETTINGS, COLLECT_WORKERS
+from run_queries_baseline import get_pool
+from models.plan_features import plan_shape_hash
+
+
+# SET LOCAL the given planner settings; must run inside a transaction
+def apply_settings(cursor, settings):
+    for name, value in settings.items():
+        cursor.execute(sql.SQL("SET LOCAL {} = %s").format(sql.Identifier(name)), (str(value),))
+
+
+def settings_tag(settings):
+    if not settings:
+        return "baseline"
+    return "+".join(f"{k}={v}" for k, v in sorted(settings.items()))
+
+
+# Plan the query once per settings entry on one connection, dropping duplicate plan shapes
+def enumerate_candidates(conn, query, join_count=0, settings_list=CANDIDATE_SETTINGS):
+    candidates = []
+    seen = set()
+    with conn.cursor() as cursor:
+        for settings in settings_list:
+            try:
+                apply_settings(cursor, settings)
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {query}")
+                plan = cursor.fetchone()[0][0]
+            finally:
+                # Settings were SET LOCAL: rolling back restores the defaults
+                conn.rollback()
+
+            shape = plan_shape_hash(plan)
+            if shape in seen:
+                continue
+            seen.add(shape)
+            candidates.append({
+                'tag': settings_tag(settings),
+                'settings': dict(settings),
+                'plan_shape': shape,
+                'join_count': join_count,
+                'estimated_cost': plan["Plan"]["Total Cost"],
+                'estimated_rows': plan["Plan"]["Plan Rows"],
+                'plan_json': json.dumps(plan)
+            })
+    return candidates
+
+
+def enumerate_workload(queries, workers=COLLECT_WORKERS, settings_list=CANDIDATE_SETTINGS, pool=None):
+    """Enumerate candidates for a list of (query_text, join_count) pairs in parallel.
+
+    Each worker borrows a connection from a bounded pool: `pool` when the caller
+    keeps one open across batches, otherwise one opened and closed for this call.
+    Returns one candidate list per input query, in input order (empty when the
+    query could not be planned).
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = get_pool(workers)
+
+    def task(item):
+        query, join_count = item
+        if not query:
+            return []
+        conn = pool.getconn()
+        try:
+            return enumerate_candidates(conn, query, join_count, settings_list)
+        except Exception as e:
+            print(f"Error enumerating plans: {e}")
+            return []
+        finally:
+            pool.putconn(conn)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            return list(executor.map(task, queries))
+    finally:
+        if own_pool:
+            pool.closeall()
+
+
+# SQL script that reproduces a candidate by re-applying its planner settings
+def variant_sql(query, candidate):
+    settings = candidate.get('settings') or {}
+    if not settings:
+        return query.strip() + "\n"
+    lines = ["BEGIN;"]
+    lines += [f"SET LOCAL {k} = '{v}';" for k, v in sorted(settings.items())]
+    lines += [query.strip().rstrip(";") + ";", "COMMIT;"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,298 @@
+"""Long-lived runtime prediction server.
+
+Loads the LCM (and the hybrid selector, if trained) once and answers
+predictions over local HTTP or a Unix socket. Concurrent requests are
+micro-batched: the batching thread collects whatever arrived within
+`--max-wait-us` (up to `--max-batch` rows) and runs a single `predict` call.
+
+Endpoints:
+    POST /predict  {"plans": [...]}     EXPLAIN JSON plans or candidate dicts
+                   optional "query": SQL of the planned query, for the query-text
+                   features and join_count as training defines it (per plan:
+                   "Query Text" as auto_explain logs it, or "query_text" in a
+                   candidate dict); without it join_count counts the plan's joins
+                   {"features": [[...]]} rows in the order given by GET /info
+                   optional "model": "lcm" (default) or "hybrid"
+                   -> {"predictions_ms": [...]}
+    GET  /info     feature names and loaded models
+    GET  /stats    request latency percentiles and batch statistics
+
+Example:
+    python scripts/prediction_server.py --port 8765
+    curl -s localhost:8765/predict -d '{"plans": [{"Plan": {...}}]}'
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import socketserver
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models import lcm, hybrid, sql_features
+from models.plan_features import featurize_plan, PLAN_FEATURE_NAMES, JOIN_TYPES
+
+
+_JOIN_COLUMNS = [PLAN_FEATURE_NAMES.index(f"plan_{t.lower().replace(' ', '_')}_count") for t in sorted(JOIN_TYPES)]
+
+
+def candidate_from_plan(item, query=None):
+    """Candidate dict (join_count, estimated_cost, estimated_rows, plan_json) from either
+    a candidate dict or a raw EXPLAIN JSON plan.
+
+    join_count is defined as in training (sql_features.count_joins of the query text)
+    whenever the SQL is known; only without it is it the number of join nodes in the plan.
+    """
+    if isinstance(item, list):
+        item = item[0] if item else {}
+    if "Plan" not in item:
+        return item
+    root = item["Plan"]
+    if query:
+        join_count = float(sql_features.count_joins(query))
+    else:
+        join_count = float(featurize_plan(item)[_JOIN_COLUMNS].sum())
+    return {
+        'join_count': join_count,
+        'estimated_cost': root.get("Total Cost", 0.0),
+        'estimated_rows': root.get("Plan Rows", 0.0),
+        'plan_json': item,
+    }
+
+
+def query_of(item, default=None):
+    """SQL a plan item carries (auto_explain's "Query Text" or a candidate's query_text)."""
+    if isinstance(item, list):
+        item = item[0] if item else {}
+    return item.get("Query Text") or item.get("query_text") or default
+
+
+def _names(names, limit=5):
+    return ", ".join(names[:limit]) + (", ..." if len(names) > limit else "")
+
+
+class MicroBatcher:
+    """Collects feature rows from concurrent callers and predicts them in one call."""
+
+    def __init__(self, predict_fn, max_batch=256, max_wait_us=200):
+        self._predict = predict_fn
+        self._max_batch = max_batch
+        self._max_wait = max_wait_us / 1e6
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.rows = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, X):
+        job = {'X': X, 'done': threading.Event(), 'result': None, 'error': None}
+        self._queue.put(job)
+        job['done'].wait()
+        if job['error'] is not None:
+            raise job['error']
+        return job['result']
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            n = len(jobs[0]['X'])
+            deadline = time.perf_counter() + self._max_wait
+            while n < self._max_batch:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    job = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                n += len(job['X'])
+
+            try:
+                preds = self._predict(np.vstack([j['X'] for j in jobs]))
+                self.batches += 1
+                self.rows += n
+                start = 0
+                for j in jobs:
+                    j['result'] = preds[start:start + len(j['X'])]
+                    start += len(j['X'])
+            except Exception as e:
+                for j in jobs:
+                    j['error'] = e
+            for j in jobs:
+                j['done'].set()
+
+
+class PredictionService:
+    """Models loaded once, one micro-batcher per model, and latency bookkeeping.
+
+    Requests are kept as plain NumPy rows in the LCM's feature order end to end;
+    the compact model artifacts (models/*.cmf) predict on them without pandas.
+    """
+
+    def __init__(self, max_batch=256, max_wait_us=200):
+        self.scorer = lcm.PlanScorer()
+        self.lcm = self.scorer.ensure_model()
+        self.feature_names = list(getattr(self.lcm, "feature_names_in_", lcm.CANDIDATE_FEATURES))
+        unknown = [n for n in self.feature_names if n not in lcm.CANDIDATE_FEATURES]
+        if unknown:
+            raise ValueError(f"The LCM was trained on {len(unknown)} features this code does not produce "
+                             f"({_names(unknown)}); retrain it with scripts/train_and_eval.py")
+        # Columns of the full candidate array the LCM was trained on
+        self._columns = [lcm.CANDIDATE_FEATURES.index(n) for n in self.feature_names]
+        self._cost_column = self.feature_names.index('estimated_cost')
+        try:
+            _, _, self.selector = hybrid.load_hybrid()
+        except FileNotFoundError:
+            self.selector = None
+        if self.selector is not None:
+            # Requests are featurized in the LCM's layout: the selector must use a subset of it
+            names = list(getattr(self.selector, "feature_names_in_", self.feature_names))
+            missing = [n for n in names if n not in self.feature_names]
+            if missing:
+                raise ValueError(f"The hybrid selector and the LCM were trained on different feature sets "
+                                 f"({len(missing)} selector-only features: {_names(missing)}); "
+                                 "retrain both with scripts/train_and_eval.py")
+            self._selector_columns = [self.feature_names.index(n) for n in names]
+
+        self.batchers = {'lcm': MicroBatcher(self._predict_lcm, max_batch, max_wait_us)}
+        if self.selector is not None:
+            self.batchers['hybrid'] = MicroBatcher(self._predict_hybrid, max_batch, max_wait_us)
+        self._latencies = deque(maxlen=10000)
+        self._lock = threading.Lock()
+        self.hybrid_branches = {'lcm': 0, 'baseline': 0}
+
+    def _predict_lcm(self, X):
+        return self.lcm.predict(X)
+
+    def _predict_hybrid(self, X):
+        # Selector first; the forest only runs on the rows routed to it
+        choose_lcm = self.selector.predict(X[:, self._selector_columns]) == 1
+        out = X[:, self._cost_column].astype(np.float64)
+        if choose_lcm.any():
+            out[choose_lcm] = self.lcm.predict(X[choose_lcm])
+        n_lcm = int(choose_lcm.sum())
+        with self._lock:
+            self.hybrid_branches['lcm'] += n_lcm
+            self.hybrid_branches['baseline'] += len(out) - n_lcm
+        return out
+
+    def features(self, payload):
+        if 'features' in payload:
+            return np.asarray(payload['features'], dtype=np.float64).reshape(-1, len(self.feature_names))
+        plans = payload.get('plans', [])
+        queries = [query_of(p, payload.get('query')) for p in plans]
+        candidates = [candidate_from_plan(p, q) for p, q in zip(plans, queries)]
+        return self.scorer._candidate_array(candidates, queries)[:, self._columns]
+
+    def predict(self, payload):
+        start = time.perf_counter()
+        model = payload.get('model', 'lcm')
+        if model not in self.batchers:
+            raise ValueError(f"Unknown or unavailable model: {model}")
+        X = self.features(payload)
+        preds = self.batchers[model].submit(X) if len(X) else np.empty(0)
+        with self._lock:
+            self._latencies.append(time.perf_counter() - start)
+        return [float(p) for p in preds]
+
+    def stats(self):
+        with self._lock:
+            lat = np.array(self._latencies) * 1000.0
+        out = {'requests': int(len(lat))}
+        if len(lat):
+            out.update({f'p{q}_ms': float(np.percentile(lat, q)) for q in (50, 95, 99)})
+        out['batches'] = {name: {'batches': b.batches, 'rows': b.rows,
+                                 'avg_batch_rows': b.rows / b.batches if b.batches else 0.0}
+                          for name, b in self.batchers.items()}
+        if self.selector is not None:
+            with self._lock:
+                out['hybrid_branches'] = dict(self.hybrid_branches)
+        return out
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, code, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self._reply(200, service.stats())
+            elif self.path == '/info':
+                self._reply(200, {'feature_names': service.feature_names, 'models': list(service.batchers)})
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self._reply(404, {'error': 'not found'})
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                self._reply(200, {'predictions_ms': service.predict(payload)})
+            except Exception as e:
+                self._reply(400, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            # Per-request logging would dominate sub-millisecond latencies
+            pass
+
+    return Handler
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve LCM runtime predictions with models kept in memory.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--max-batch", type=int, default=256, help="max rows per predict call")
+    parser.add_argument("--max-wait-us", type=int, default=200,
+                        help="how long the batcher waits for more requests before predicting")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        service = PredictionService(max_batch=args.max_batch, max_wait_us=args.max_wait_us)
+    except ValueError as e:
+        sys.exit(f"Cannot start the prediction server: {e}")
+    handler = make_handler(service)
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = ThreadingUnixHTTPServer(args.socket, handler)
+        where = args.socket
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), handler)
+        where = f"http://{args.host}:{args.port}"
+    print(f"Serving predictions on {where} (models: {', '.join(service.batchers)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Persistent store of collected query results.
+
+Rows are keyed by the hash of the query text and by a version string that
+captures the database schema/statistics and the measurement settings. The
+collector looks rows up before executing a query and writes every finished
+row immediately, so unchanged queries are skipped and an interrupted run
+resumes where it stopped.
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+
+# Fingerprint of the public schema: column definitions plus the planner statistics of every
+# table and index (reltuples/relpages change after ANALYZE or a data reload)
+SCHEMA_VERSION_SQL = """
+SELECT md5(
+    (SELECT coalesce(string_agg(table_name || '.' || column_name || ':' || data_type, ','
+                                ORDER BY table_name, ordinal_position), '')
+       FROM information_schema.columns WHERE table_schema = 'public')
+    || '|' ||
+    (SELECT coalesce(string_agg(c.relname || ':' || c.relkind || ':' || c.reltuples::bigint || ':' || c.relpages, ','
+                                ORDER BY c.relname), '')
+       FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+      WHERE n.nspname = 'public' AND c.relkind IN ('r', 'i', 'm', 'p'))
+)
+"""
+
+
+def query_hash(query):
+    return hashlib.sha256(query.strip().encode("utf-8")).hexdigest()
+
+
+def schema_version(cursor):
+    cursor.execute(SCHEMA_VERSION_SQL)
+    return cursor.fetchone()[0]
+
+
+def collection_version(cursor, warmup, runs, cache_mode):
+    # Results are only reusable when both the database and the way we measured are unchanged
+    return f"{schema_version(cursor)}:{warmup}x{runs}:{cache_mode}"
+
+
+class ResultStore:
+    """SQLite-backed cache of collector rows keyed by (query_hash, version)."""
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                query_hash TEXT NOT NULL,
+                version TEXT NOT NULL,
+                query_name TEXT,
+                category TEXT,
+                collected_at REAL,
+                row_json TEXT NOT NULL,
+                PRIMARY KEY (query_hash, version)
+            )""")
+        self._conn.commit()
+
+    def get(self, qhash, version):
+        cur = self._conn.execute(
+            "SELECT row_json FROM results WHERE query_hash = ? AND version = ?", (qhash, version))
+        hit = cur.fetchone()
+        return json.loads(hit[0]) if hit else None
+
+    def put(self, qhash, version, row):
+        # Committed per row so finished work survives a crash or Ctrl-C
+        self._conn.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+            (qhash, version, row.get("query_name"), row.get("category"), time.time(), json.dumps(row)))
+        self._conn.commit()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
@@ -1,96 +1,359 @@
 #run_queries_baseline.py
 import os
+import sys
 import json
 import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import psycopg2
+import psycopg2.errors
+from psycopg2.pool import ThreadedConnectionPool
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
-from config import DB_CONFIG, QUERY_DIR, RESULTS_DIR
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models import sql_features, instrument
+from config import DB_CONFIG, QUERY_DIR, RESULTS_DIR, COLLECT_WORKERS, ISOLATED_CATEGORIES
+from config import WARMUP_RUNS, TIMED_RUNS, CACHE_MODE, COLD_CACHE_HOOK, RESULT_STORE
+from config import CATEGORY_TIMEOUT_MS, QUERY_TIMEOUT_MS, TEMPLATE_SAMPLE_SIZE
+from result_cache import ResultStore, query_hash, collection_version
+from metrics_store import write_table
+from workload import load_workload
+from catalog_snapshot import refresh as refresh_catalog
 
 # This script serves as the traditional/baseline part of the project
 
+CATEGORIES = ["small", "medium", "large"]
+
+
 #Connect to database
 # Double check you configured the config to work on your end for your local database
 def get_connection():
     return psycopg2.connect(**DB_CONFIG)
 
 
-# Run EXPLAIN: this obtains postgres's estimated plan, before running anything. e.g predicted total cost and row count
-# Then EXPLAIN ANALYZE:  execute the given query and collect actual runtime and rows processed
+# Bounded pool shared by the collector workers: never opens more than `workers` connections
+def get_pool(workers):
+    return ThreadedConnectionPool(1, max(1, workers), **DB_CONFIG)
+
+
+# Run EXPLAIN ANALYZE once: the JSON plan it returns carries both postgres's estimates
+# (predicted total cost and row count) and the actual runtime and rows processed,
+# so the query is planned and executed a single time
 def get_query_stats(cursor, query):
+    with instrument.span("postgres.explain_analyze"):
+        cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}")
+        plan = cursor.fetchone()[0][0]
+    root = plan["Plan"]
 
-    # Explain: Estimated
-    cursor.execute(f"EXPLAIN (FORMAT JSON) {query}")
-    plan_est = cursor.fetchone()[0][0]
-    est_cost = plan_est["Plan"]["Total Cost"]
-    est_rows = plan_est["Plan"]["Plan Rows"]
+    est_cost = root["Total Cost"]
+    est_rows = root["Plan Rows"]
+    act_runtime = root["Actual Total Time"]
+    act_rows = root["Actual Rows"]
 
-    # EXPLAIN ANAKLYZE: Actual results
-    cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}")
-    plan_act = cursor.fetchone()[0][0]
-    act_runtime = plan_act["Plan"]["Actual Total Time"]
-    act_rows = plan_act["Plan"]["Actual Rows"]
+    with instrument.span("json.dump_plan"):
+        plan_json = json.dumps(plan)
+    return est_cost, est_rows, act_runtime, act_rows, plan_json
 
-    return est_cost, est_rows, act_runtime, act_rows, json.dumps(plan_act)
 
+# Planner estimates only (no execution), used for queries that did not finish within their budget
+def get_query_estimates(cursor, query):
+    with instrument.span("postgres.explain"):
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {query}")
+        plan = cursor.fetchone()[0][0]
+    root = plan["Plan"]
+    with instrument.span("json.dump_plan"):
+        plan_json = json.dumps(plan)
+    return root["Total Cost"], root["Plan Rows"], plan_json
 
-# Function to count joins, extra to feed into the ML you're making
-def count_joins(query):
-    return query.upper().count("JOIN") + query.upper().count(",")
 
+# Time budget of a query: per-query override first, then its category's budget (None = unlimited)
+def get_timeout_ms(category, qf):
+    return QUERY_TIMEOUT_MS.get(qf, CATEGORY_TIMEOUT_MS.get(category))
 
-# Main data collection 
-def collect_results():
-    results = []
-    conn = get_connection()
-    cursor = conn.cursor()
 
-    # Iterate through all queries in all the folders
-    for category in ["small", "medium", "large"]:
-        path = os.path.join(QUERY_DIR, category)
-        if not os.path.exists(path):
-            continue
-        query_files = [f for f in os.listdir(path) if f.endswith(".sql")]
+# Server-side budget of the following statements on this session (None/0 = unlimited)
+def set_timeout(cursor, timeout_ms):
+    cursor.execute("SET statement_timeout = %s", (int(timeout_ms or 0),))
+
+
+# Reset caches before a timed run according to `cache_mode` (see CACHE_MODE in config.py).
+# DISCARD ALL also resets statement_timeout, so the query's budget is set again after it
+def reset_cache(cursor, cache_mode, timeout_ms=None):
+    if cache_mode == "discard":
+        cursor.execute("DISCARD ALL")
+        set_timeout(cursor, timeout_ms)
+    elif cache_mode == "hook":
+        if not COLD_CACHE_HOOK:
+            raise ValueError("CACHE_MODE 'hook' requires COLD_CACHE_HOOK to be set in config.py")
+        subprocess.run(COLD_CACHE_HOOK, shell=True, check=True)
+    elif cache_mode != "warm":
+        raise ValueError(f"Unknown cache mode: {cache_mode}")
+
+
+# Robust statistics over the timed runs of one query
+def summarize_samples(samples):
+    arr = np.asarray(samples, dtype=float)
+    return {
+        "median": float(np.median(arr)),
+        "p95": float(np.percentile(arr, 95)),
+        "stddev": float(arr.std(ddof=1)) if len(arr) > 1 else 0.0,
+    }
+
+
+# Repeated-trial measurement: `warmup` untimed runs, then `runs` timed runs.
+# The server-side `Actual Total Time` of every timed run is kept as a sample, and the
+# client-side wall time of each round trip is measured with perf_counter_ns
+def measure_query(cursor, query, warmup=WARMUP_RUNS, runs=TIMED_RUNS, cache_mode=CACHE_MODE, timeout_ms=None):
+    for _ in range(warmup):
+        get_query_stats(cursor, query)
+
+    samples = []
+    wall_ns = []
+    for _ in range(max(1, runs)):
+        reset_cache(cursor, cache_mode, timeout_ms)
+        start = time.perf_counter_ns()
+        est_cost, est_rows, act_runtime, act_rows, plan_json = get_query_stats(cursor, query)
+        wall_ns.append(time.perf_counter_ns() - start)
+        samples.append(act_runtime)
+
+    return {
+        "estimated_cost": est_cost,
+        "estimated_rows": est_rows,
+        "actual_rows": act_rows,
+        "plan_json": plan_json,
+        "samples": samples,
+        "stats": summarize_samples(samples),
+        "wall_sec": float(np.median(wall_ns)) / 1e9,
+    }
+
 
-        for qf in tqdm(query_files, desc=f"Running {category} queries"):
-            query_path = os.path.join(path, qf)
-            with open(query_path, "r") as f:
-                query = f.read().strip()
+# Function to count joins, extra to feed into the ML you're making.
+# Joins performed by the query (base relations per SELECT block minus one), from the
+# tokenized SQL so commas in the select list or in IN (...) lists are not counted
+def count_joins(query):
+    return sql_features.count_joins(query)
+
+
+# (name, text) of every .sql file of one category folder, from the shared workload index
+def load_queries(category, query_dir=QUERY_DIR):
+    return [(q["name"], q["text"]) for q in load_workload(query_dir).by_category(category)]
 
+
+# Execute one query on a pooled connection and build its result row.
+# The query's budget is enforced server-side through statement_timeout; a cancelled query
+# becomes a censored row whose runtime is the budget (the true runtime is at least that).
+# The connection is in the `running` set (if given) while the query executes, so that it can be cancelled
+def run_query(pool, category, qf, query, warmup=WARMUP_RUNS, runs=TIMED_RUNS, cache_mode=CACHE_MODE,
+              running=None):
+    timeout_ms = get_timeout_ms(category, qf)
+    conn = pool.getconn()
+    if running is not None:
+        running.add(conn)
+    try:
+        # Autocommit: each run is its own statement and DISCARD ALL may not run inside a transaction
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            set_timeout(cursor, timeout_ms)
             try:
-                start = time.time()
-                est_cost, est_rows, act_runtime, act_rows, plan_json = get_query_stats(cursor, query)
-                duration = time.time() - start
-
-                # Store relevant data for both ML training and baseline analysis
-                results.append({
-                    "query_name": qf,
-                    "category": category,
-                    "estimated_cost": est_cost,      # Postgres's internal cost estimate
+                m = measure_query(cursor, query, warmup=warmup, runs=runs, cache_mode=cache_mode,
+                                  timeout_ms=timeout_ms)
+                censored = False
+            except psycopg2.errors.QueryCanceled:
+                # Without a budget the cancel came from elsewhere (e.g. pg_cancel_backend): not a censored label
+                if not timeout_ms:
+                    raise
+                set_timeout(cursor, None)
+                est_cost, est_rows, plan_json = get_query_estimates(cursor, query)
+                m = {
+                    "estimated_cost": est_cost,
                     "estimated_rows": est_rows,
-                    "actual_runtime_ms": act_runtime,  # Measured runtime
-                    "actual_rows": act_rows,
-                    "join_count": count_joins(query),
-                    "execution_time_sec": duration,
-                    "plan_json": plan_json            # Full execution plan
-                })
-
-            #Error log
-            except Exception as e:
-                print(f"Error running {qf}: {e}")
+                    "actual_rows": None,
+                    "plan_json": plan_json,
+                    "samples": [],
+                    "stats": {"median": float(timeout_ms), "p95": float(timeout_ms), "stddev": 0.0},
+                    "wall_sec": timeout_ms / 1000.0,
+                }
+                censored = True
+    finally:
+        if running is not None:
+            running.discard(conn)
+        pool.putconn(conn)
+
+    stats = m["stats"]
+    # Store relevant data for both ML training and baseline analysis
+    return {
+        "query_name": qf,
+        "category": category,
+        "query_hash": query_hash(query),
+        "query_template": sql_features.template_fingerprint(query),
+        "query_text": query,                   # SQL, for the query-text features
+        "estimated_cost": m["estimated_cost"],      # Postgres's internal cost estimate
+        "estimated_rows": m["estimated_rows"],
+        "actual_runtime_ms": stats["median"],  # Measured runtime (median of the timed runs)
+        "actual_rows": m["actual_rows"],
+        "join_count": count_joins(query),
+        "execution_time_sec": m["wall_sec"],   # Median client-side round trip
+        "runtime_median_ms": stats["median"],
+        "runtime_p95_ms": stats["p95"],
+        "runtime_stddev_ms": stats["stddev"],
+        "runtime_samples_ms": json.dumps(m["samples"]),
+        "warmup_runs": warmup,
+        "timed_runs": len(m["samples"]),
+        "cache_mode": cache_mode,
+        "timeout_ms": timeout_ms,
+        "censored": censored,                  # True: runtime >= timeout_ms, not an exact label
+        "plan_json": m["plan_json"]            # Full execution plan (last timed run)
+    }
+
+
+# Main data collection
+# Queries of each category run on a worker pool of `workers` threads; categories listed in
+# `isolated` (by default the heavy large/ queries) run one at a time after everything else.
+# With a `store`, queries whose text and database version are unchanged are served from it
+# and each finished row is written to it right away, so an interrupted run can be resumed.
+# With `per_template`, only that many queries of each query template (same SQL up to its
+# literals) are run, picked reproducibly by `seed`
+def collect_results(workers=COLLECT_WORKERS, isolated=ISOLATED_CATEGORIES,
+                    warmup=WARMUP_RUNS, runs=TIMED_RUNS, cache_mode=CACHE_MODE,
+                    store=None, force=False, query_dir=QUERY_DIR,
+                    per_template=TEMPLATE_SAMPLE_SIZE, seed=0):
+    results = []
+    measure = dict(warmup=warmup, runs=runs, cache_mode=cache_mode)
+    workload = load_workload(query_dir)
+    selected = workload.sample(per_template, seed=seed)
+    if per_template is not None:
+        print(f"Template sampling: {len(selected)} of {len(workload.queries)} queries "
+              f"({len(workload.templates())} templates, at most {per_template} each)")
+    pool = get_pool(workers)
+
+    # One bulk catalog snapshot per schema/statistics version for the featurizers
+    version = None
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cursor:
+            refresh_catalog(cursor)
+            if store is not None:
+                version = collection_version(cursor, warmup, runs, cache_mode)
+        conn.rollback()
+    finally:
+        pool.putconn(conn)
+
+    # Split a category into rows already in the store and queries that still need to run
+    def pending_queries(category):
+        todo = []
+        for qf, query in load_queries(category, query_dir):
+            if qf not in selected:
                 continue
+            cached = None
+            if store is not None and not force:
+                cached = store.get(query_hash(query), version)
+                # A censored row is only final while the budget that cut it short still applies
+                if cached is not None and cached.get("censored"):
+                    budget = get_timeout_ms(category, qf)
+                    if not budget or budget > (cached.get("timeout_ms") or 0):
+                        cached = None
+            if cached is not None:
+                cached.update(query_name=qf, category=category, query_text=query,
+                              query_template=sql_features.template_fingerprint(query))
+                results.append(cached)
+            else:
+                todo.append((qf, query))
+        return todo
+
+    def finish(row):
+        results.append(row)
+        if store is not None:
+            store.put(row["query_hash"], version, row)
+
+    try:
+        concurrent = [c for c in CATEGORIES if c not in isolated]
+        alone = [c for c in CATEGORIES if c in isolated]
+
+        executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        running = set()
+        try:
+            for category in concurrent:
+                queries = pending_queries(category)
+                futures = {executor.submit(run_query, pool, category, qf, query, running=running, **measure): qf for qf, query in queries}
+                for fut in tqdm(as_completed(futures), total=len(futures), desc=f"Running {category} queries"):
+                    try:
+                        finish(fut.result())
+                    #Error log
+                    except Exception as e:
+                        print(f"Error running {futures[fut]}: {e}")
+        except KeyboardInterrupt:
+            # Cancel the statements still executing; their rows are never collected
+            for conn in list(running):
+                conn.cancel()
+            raise
+        finally:
+            # Drop the queued queries but wait for the workers: the pool is closed below
+            # and must not be closed under a connection still in use
+            executor.shutdown(wait=True, cancel_futures=True)
 
-    conn.close()
+        for category in alone:
+            for qf, query in tqdm(pending_queries(category), desc=f"Running {category} queries (isolated)"):
+                try:
+                    finish(run_query(pool, category, qf, query, **measure))
+                except Exception as e:
+                    print(f"Error running {qf}: {e}")
+    except KeyboardInterrupt:
+        print(f"\nInterrupted — {len(results)} finished queries kept; run again to resume.")
+    finally:
+        pool.closeall()
+
+    # Keep the output order stable regardless of completion order
+    order = {c: i for i, c in enumerate(CATEGORIES)}
+    results.sort(key=lambda r: (order[r["category"]], r["query_name"]))
     return pd.DataFrame(results)
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the query workload and collect baseline metrics.")
+    parser.add_argument("--workers", type=int, default=COLLECT_WORKERS,
+                        help="number of queries executed concurrently (connection pool size)")
+    parser.add_argument("--no-isolation", action="store_true",
+                        help="run every category concurrently, including the isolated ones")
+    parser.add_argument("--warmup", type=int, default=WARMUP_RUNS, help="untimed warmup runs per query")
+    parser.add_argument("--runs", type=int, default=TIMED_RUNS, help="timed runs per query")
+    parser.add_argument("--cache-mode", choices=["warm", "discard", "hook"], default=CACHE_MODE,
+                        help="cache reset performed before every timed run")
+    parser.add_argument("--force", action="store_true",
+                        help="re-run every query even if an up-to-date result is stored")
+    parser.add_argument("--no-store", action="store_true",
+                        help="do not read or write the persistent result store")
+    parser.add_argument("--query-dir", default=QUERY_DIR,
+                        help="workload folder with small/medium/large subfolders (e.g. the output of generate_workload.py)")
+    parser.add_argument("--per-template", type=int, default=TEMPLATE_SAMPLE_SIZE,
+                        help="run at most this many queries per query template (default: all)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the per-template sample")
+    parser.add_argument("--csv", action="store_true",
+                        help=f"also write the legacy CSV with inlined plans to {RESULTS_DIR}")
+    instrument.add_profile_argument(parser)
+    return parser.parse_args()
+
+
 #Run and save results to csv for you to use
 def main():
-    df = collect_results()
-    os.makedirs(os.path.dirname(RESULTS_DIR), exist_ok=True)
-    df.to_csv(RESULTS_DIR, index=False)
-    print(f"\nResults saved to {RESULTS_DIR}")
+    args = parse_args()
+    instrument.configure(args.profile)
+    isolated = () if args.no_isolation else ISOLATED_CATEGORIES
+    store = None if args.no_store else ResultStore(RESULT_STORE)
+    try:
+        df = collect_results(workers=args.workers, isolated=isolated,
+                             warmup=args.warmup, runs=args.runs, cache_mode=args.cache_mode,
+                             store=store, force=args.force, query_dir=args.query_dir,
+                             per_template=args.per_template, seed=args.seed)
+    finally:
+        if store is not None:
+            store.close()
+    path = write_table(df, "query_metrics", csv=args.csv)
+    print(f"\nResults saved to {path}")
 
 if __name__ == "__main__":
     main()
-
@@ -1,91 +1,149 @@
+import os
+import json
 import pandas as pd
 import numpy as np
+from metrics_store import read_table, table_paths
 
-# Load the metrics comparison CSV
-df = pd.read_csv('results/query_metrics_comparison.csv')
-
-print("=" * 80)
-print("HYBRID QUERY COST MODEL EVALUATION - RESULTS SUMMARY")
-print("=" * 80)
-print()
-
-# Overall Statistics
-print("1. DATASET OVERVIEW")
-print("-" * 80)
-print(f"Total Queries Evaluated: {len(df)}")
-print(f"Query Distribution:")
-print(f"  - Small (1-3 joins): {len(df[df['category'] == 'small'])} queries")
-print(f"  - Medium (4-6 joins): {len(df[df['category'] == 'medium'])} queries")
-print(f"  - Large (7+ joins): {len(df[df['category'] == 'large'])} queries")
-print()
-
-# Model Accuracy Metrics
-print("2. MODEL ACCURACY (Mean Absolute Error in milliseconds)")
-print("-" * 80)
-mae_baseline = (df['err_baseline_ms']).mean()
-mae_lcm = (df['err_lcm_ms']).mean()
-mae_hybrid = (df['err_hybrid_ms']).mean()
-
-print(f"Baseline Model (PostgreSQL Cost):  {mae_baseline:,.2f} ms")
-print(f"LCM Model (ML-based):              {mae_lcm:,.2f} ms")
-print(f"Hybrid Model (Selector-based):     {mae_hybrid:,.2f} ms")
-print()
-
-# Improvement percentages
-baseline_vs_lcm = ((mae_baseline - mae_lcm) / mae_baseline) * 100
-baseline_vs_hybrid = ((mae_baseline - mae_hybrid) / mae_baseline) * 100
-lcm_vs_hybrid = ((mae_lcm - mae_hybrid) / mae_lcm) * 100
-
-print("Relative Improvements:")
-print(f"  LCM vs Baseline:      {baseline_vs_lcm:+.1f}% (↓ {mae_baseline - mae_lcm:,.2f} ms)")
-print(f"  Hybrid vs Baseline:   {baseline_vs_hybrid:+.1f}% (↓ {mae_baseline - mae_hybrid:,.2f} ms)")
-print(f"  Hybrid vs LCM:        {lcm_vs_hybrid:+.1f}% (↓ {mae_lcm - mae_hybrid:,.2f} ms)")
-print()
-
-# Plan Quality Metrics
-print("3. PLAN QUALITY ANALYSIS")
-print("-" * 80)
-lcm_better = (df['would_be_faster_than_baseline']).sum()
-hybrid_better = (df['pred_hybrid_ms'] < df['actual_runtime_ms']).sum()
-neither = len(df) - lcm_better - hybrid_better
-
-print(f"LCM Predicted Faster: {lcm_better:2d} queries ({lcm_better/len(df)*100:5.1f}%)")
-print(f"Hybrid Predicted Faster: {hybrid_better:2d} queries ({hybrid_better/len(df)*100:5.1f}%)")
-print(f"Neither Predicted Faster: {neither:2d} queries ({neither/len(df)*100:5.1f}%)")
-print()
-print(f"LCM Chosen-Plan Predicted Mean:    {df['chosen_pred_ms'].mean():,.2f} ms")
-print(f"Actual Query Runtime Mean:         {df['actual_runtime_ms'].mean():,.2f} ms")
-print()
-
-# Category Breakdown
-print("4. PERFORMANCE BY QUERY CATEGORY")
-print("-" * 80)
-for cat in ['small', 'medium', 'large']:
-    cat_df = df[df['category'] == cat]
-    cat_mae_baseline = cat_df['err_baseline_ms'].mean()
-    cat_mae_lcm = cat_df['err_lcm_ms'].mean()
-    cat_mae_hybrid = cat_df['err_hybrid_ms'].mean()
-    cat_improvement = ((cat_mae_baseline - cat_mae_hybrid) / cat_mae_baseline) * 100
-    
-    print(f"{cat.upper()} Queries ({len(cat_df)} queries):")
-    print(f"  MAE Baseline:  {cat_mae_baseline:8,.2f} ms")
-    print(f"  MAE Hybrid:    {cat_mae_hybrid:8,.2f} ms  (improvement: {cat_improvement:+6.1f}%)")
+CATEGORIES = ['small', 'medium', 'large']
+# Aggregates written by generate_website.py next to the comparison table; used instead of
+# re-reading the table while it is at least as new as the table
+SUMMARY_PATH = os.path.join(os.path.dirname(table_paths('query_metrics_comparison')[0]), 'comparison_summary.json')
+SUMMARY_COLUMNS = ['category', 'actual_runtime_ms', 'pred_hybrid_ms', 'chosen_pred_ms',
+                   'err_baseline_ms', 'err_lcm_ms', 'err_hybrid_ms', 'would_be_faster_than_baseline']
+
+
+def comparison_summary(df):
+    """All aggregates of the comparison table the reports print, in one vectorized pass."""
+    errs = ['err_baseline_ms', 'err_lcm_ms', 'err_hybrid_ms']
+    by_cat = df.groupby('category')[errs].agg(['size', 'mean'])
+    categories = {
+        cat: {'n': int(by_cat.loc[cat, ('err_baseline_ms', 'size')]),
+              'mae_baseline': float(by_cat.loc[cat, ('err_baseline_ms', 'mean')]),
+              'mae_lcm': float(by_cat.loc[cat, ('err_lcm_ms', 'mean')]),
+              'mae_hybrid': float(by_cat.loc[cat, ('err_hybrid_ms', 'mean')])}
+        for cat in by_cat.index}
+    chosen = pd.to_numeric(df['chosen_pred_ms'], errors='coerce') if 'chosen_pred_ms' in df else pd.Series(dtype=float)
+    faster = df['would_be_faster_than_baseline'] if 'would_be_faster_than_baseline' in df else pd.Series(dtype=bool)
+    return {
+        'n_queries': int(len(df)),
+        'mae_baseline': float(df['err_baseline_ms'].mean()),
+        'mae_lcm': float(df['err_lcm_ms'].mean()),
+        'mae_hybrid': float(df['err_hybrid_ms'].mean()),
+        'chosen_pred_mean_ms': float(chosen.mean()) if chosen.notna().any() else None,
+        'actual_mean_ms': float(df['actual_runtime_ms'].mean()),
+        'lcm_predicted_better_count': int((faster == True).sum()),
+        'hybrid_predicted_better_count': int((df['pred_hybrid_ms'] < df['actual_runtime_ms']).sum()),
+        'categories': categories,
+    }
+
+
+def load_summary():
+    table = next((p for p in table_paths('query_metrics_comparison') if os.path.exists(p)), None)
+    if os.path.exists(SUMMARY_PATH) and (table is None or os.path.getmtime(SUMMARY_PATH) >= os.path.getmtime(table)):
+        with open(SUMMARY_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    # Load only the comparison columns this summary uses
+    return comparison_summary(read_table('query_metrics_comparison', columns=SUMMARY_COLUMNS))
+
+
+def main():
+    s = load_summary()
+    n = s['n_queries']
+    empty = {'n': 0, 'mae_baseline': float('nan'), 'mae_lcm': float('nan'), 'mae_hybrid': float('nan')}
+    cats = {cat: s['categories'].get(cat, empty) for cat in CATEGORIES}
+
+    print("=" * 80)
+    print("HYBRID QUERY COST MODEL EVALUATION - RESULTS SUMMARY")
+    print("=" * 80)
+    print()
+
+    # Overall Statistics
+    print("1. DATASET OVERVIEW")
+    print("-" * 80)
+    print(f"Total Queries Evaluated: {n}")
+    print(f"Query Distribution:")
+    print(f"  - Small (1-3 joins): {cats['small']['n']} queries")
+    print(f"  - Medium (4-6 joins): {cats['medium']['n']} queries")
+    print(f"  - Large (7+ joins): {cats['large']['n']} queries")
+    print()
+
+    # Model Accuracy Metrics
+    print("2. MODEL ACCURACY (Mean Absolute Error in milliseconds)")
+    print("-" * 80)
+    mae_baseline = s['mae_baseline']
+    mae_lcm = s['mae_lcm']
+    mae_hybrid = s['mae_hybrid']
+
+    print(f"Baseline Model (PostgreSQL Cost):  {mae_baseline:,.2f} ms")
+    print(f"LCM Model (ML-based):              {mae_lcm:,.2f} ms")
+    print(f"Hybrid Model (Selector-based):     {mae_hybrid:,.2f} ms")
+    print()
+
+    # Improvement percentages
+    baseline_vs_lcm = ((mae_baseline - mae_lcm) / mae_baseline) * 100
+    baseline_vs_hybrid = ((mae_baseline - mae_hybrid) / mae_baseline) * 100
+    lcm_vs_hybrid = ((mae_lcm - mae_hybrid) / mae_lcm) * 100
+
+    print("Relative Improvements:")
+    print(f"  LCM vs Baseline:      {baseline_vs_lcm:+.1f}% (↓ {mae_baseline - mae_lcm:,.2f} ms)")
+    print(f"  Hybrid vs Baseline:   {baseline_vs_hybrid:+.1f}% (↓ {mae_baseline - mae_hybrid:,.2f} ms)")
+    print(f"  Hybrid vs LCM:        {lcm_vs_hybrid:+.1f}% (↓ {mae_lcm - mae_hybrid:,.2f} ms)")
     print()
 
-# Key Findings
-print("5. KEY FINDINGS")
-print("-" * 80)
-print(f"✓ Hybrid model achieves {baseline_vs_hybrid:.1f}% better accuracy than baseline")
-print(f"✓ LCM provides faster plan predictions than baseline in {lcm_better} queries")
-print(f"✓ Hybrid successfully selects best model for {(lcm_better + hybrid_better)} of {len(df)} queries")
-print(f"✓ Large queries benefit most from ML-based predictions (improved runtime accuracy)")
-print(f"✓ Plan diversity: Hybrid model adapts between cost-based and ML-based approaches")
-print()
-
-print("=" * 80)
-print("CONCLUSION")
-print("=" * 80)
-print("""
+    # Plan Quality Metrics
+    print("3. PLAN QUALITY ANALYSIS")
+    print("-" * 80)
+    lcm_better = s['lcm_predicted_better_count']
+    hybrid_better = s['hybrid_predicted_better_count']
+    neither = n - lcm_better - hybrid_better
+
+    print(f"LCM Predicted Faster: {lcm_better:2d} queries ({lcm_better/n*100:5.1f}%)")
+    print(f"Hybrid Predicted Faster: {hybrid_better:2d} queries ({hybrid_better/n*100:5.1f}%)")
+    print(f"Neither Predicted Faster: {neither:2d} queries ({neither/n*100:5.1f}%)")
+    print()
+    chosen_mean = s['chosen_pred_mean_ms'] if s['chosen_pred_mean_ms'] is not None else float('nan')
+    print(f"LCM Chosen-Plan Predicted Mean:    {chosen_mean:,.2f} ms")
+    print(f"Actual Query Runtime Mean:         {s['actual_mean_ms']:,.2f} ms")
+    print()
+
+    # Measured plan quality from executing the chosen plans (scripts/validate_plans.py)
+    if os.path.exists('results/plan_validation.csv'):
+        val = pd.read_csv('results/plan_validation.csv')
+        print("3b. MEASURED PLAN QUALITY (executed chosen plans)")
+        print("-" * 80)
+        print(f"Queries Validated:       {len(val)}")
+        print(f"Geometric Mean Speedup:  {np.exp(np.log(val['speedup'].dropna()).mean()):.3f}x")
+        print(f"Measured Improvements:   {int(val['is_improvement'].sum())} queries")
+        print(f"Measured Regressions:    {int(val['is_regression'].sum())} queries")
+        print()
+
+    # Category Breakdown
+    print("4. PERFORMANCE BY QUERY CATEGORY")
+    print("-" * 80)
+    for cat in CATEGORIES:
+        cat_mae_baseline = cats[cat]['mae_baseline']
+        cat_mae_hybrid = cats[cat]['mae_hybrid']
+        cat_improvement = ((cat_mae_baseline - cat_mae_hybrid) / cat_mae_baseline) * 100
+
+        print(f"{cat.upper()} Queries ({cats[cat]['n']} queries):")
+        print(f"  MAE Baseline:  {cat_mae_baseline:8,.2f} ms")
+        print(f"  MAE Hybrid:    {cat_mae_hybrid:8,.2f} ms  (improvement: {cat_improvement:+6.1f}%)")
+        print()
+
+    # Key Findings
+    print("5. KEY FINDINGS")
+    print("-" * 80)
+    print(f"✓ Hybrid model achieves {baseline_vs_hybrid:.1f}% better accuracy than baseline")
+    print(f"✓ LCM provides faster plan predictions than baseline in {lcm_better} queries")
+    print(f"✓ Hybrid successfully selects best model for {(lcm_better + hybrid_better)} of {n} queries")
+    print(f"✓ Large queries benefit most from ML-based predictions (improved runtime accuracy)")
+    print(f"✓ Plan diversity: Hybrid model adapts between cost-based and ML-based approaches")
+    print()
+
+    print("=" * 80)
+    print("CONCLUSION")
+    print("=" * 80)
+    print("""
 The hybrid query cost model successfully combines PostgreSQL's cost-based planner
 with machine learning predictions through a per-query selector. By dynamically
 choosing between the baseline model and LCM, the hybrid approach:
@@ -98,3 +156,7 @@ choosing between the baseline model and LCM, the hybrid approach:
 This validates the hybrid approach as a practical solution for improved query
 cost estimation in real-world database systems.
 """)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Closed-loop validation of the plans chosen by `generate_plans.py`.
+
+For every query the baseline plan and the LCM-chosen variant (reproduced by
+re-applying the planner settings it was enumerated with) are executed with the
+same repeated-trial timing as the collector. The measured medians give the real
+per-query speedup; variants that are slower than the baseline beyond
+VALIDATION_REGRESSION_TOLERANCE are flagged as regressions.
+
+Writes `results/plan_validation.csv`.
+"""
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+import psycopg2.errors
+from psycopg2 import sql
+from tqdm import tqdm
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import WARMUP_RUNS, TIMED_RUNS, CACHE_MODE, VALIDATION_REGRESSION_TOLERANCE
+from run_queries_baseline import get_connection, measure_query, get_timeout_ms, set_timeout
+from workload import load_workload
+import metrics_store
+
+
+CHOICES_CSV = os.path.join(ROOT, 'results', 'generated_plan_choices_rich.csv')
+OUT_CSV = os.path.join(ROOT, 'results', 'plan_validation.csv')
+
+
+def time_plan(conn, category, qname, query, settings, warmup=WARMUP_RUNS, runs=TIMED_RUNS, cache_mode=CACHE_MODE):
+    """Median/p95 runtime (ms) of `query` planned under `settings`.
+
+    Settings are applied for the session (the connection is in autocommit so
+    DISCARD ALL can run between trials) and reset afterwards. A run that hits
+    the query's statement_timeout is returned as censored at the budget.
+    """
+    timeout_ms = get_timeout_ms(category, qname)
+    with conn.cursor() as cursor:
+        set_timeout(cursor, timeout_ms)
+        try:
+            for name, value in settings.items():
+                cursor.execute(sql.SQL("SET {} = %s").format(sql.Identifier(name)), (str(value),))
+            # DISCARD ALL would also drop the planner settings, so it is not used here
+            mode = "warm" if cache_mode == "discard" else cache_mode
+            m = measure_query(cursor, query, warmup=warmup, runs=runs, cache_mode=mode, timeout_ms=timeout_ms)
+            stats = m["stats"]
+            return {"median": stats["median"], "p95": stats["p95"], "censored": False}
+        except psycopg2.errors.QueryCanceled:
+            if not timeout_ms:
+                raise
+            return {"median": float(timeout_ms), "p95": float(timeout_ms), "censored": True}
+        finally:
+            cursor.execute("RESET ALL")
+
+
+def validate(choices, metrics, warmup=WARMUP_RUNS, runs=TIMED_RUNS, cache_mode=CACHE_MODE,
+             tolerance=VALIDATION_REGRESSION_TOLERANCE):
+    categories = dict(zip(metrics['query_name'], metrics['category']))
+    workload = load_workload()
+    conn = get_connection()
+    conn.autocommit = True
+    results = []
+    try:
+        for _, row in tqdm(list(choices.iterrows()), desc="Validating chosen plans"):
+            qname = row['query_name']
+            query = workload.sql(qname)
+            if query is None:
+                print(f"Skipping {qname}: original SQL not found in queries/")
+                continue
+            category = categories.get(qname)
+            raw = row.get('chosen_settings')
+            settings = json.loads(raw) if isinstance(raw, str) and raw else {}
+
+            try:
+                base = time_plan(conn, category, qname, query, {}, warmup, runs, cache_mode)
+                # The baseline itself was chosen: nothing else to execute
+                variant = time_plan(conn, category, qname, query, settings, warmup, runs, cache_mode) if settings else base
+            except Exception as e:
+                print(f"Error validating {qname}: {e}")
+                continue
+
+            speedup = base["median"] / variant["median"] if variant["median"] > 0 else np.nan
+            results.append({
+                'query_name': qname,
+                'category': category,
+                'chosen_tag': row.get('chosen_tag'),
+                'chosen_settings': json.dumps(settings),
+                'chosen_pred_ms': row.get('chosen_pred_ms'),
+                'baseline_median_ms': base["median"],
+                'baseline_p95_ms': base["p95"],
+                'baseline_censored': base["censored"],
+                'variant_median_ms': variant["median"],
+                'variant_p95_ms': variant["p95"],
+                'variant_censored': variant["censored"],
+                'speedup': speedup,
+                'is_regression': bool(variant["median"] > base["median"] * (1.0 + tolerance)),
+                'is_improvement': bool(base["median"] > variant["median"] * (1.0 + tolerance)),
+            })
+    finally:
+        conn.close()
+    return pd.DataFrame(results)
+
+
+def print_summary(res):
+    if res.empty:
+        print("No plans validated.")
+        return
+    speedups = res['speedup'].dropna()
+    print(f"Validated {len(res)} queries")
+    print(f"  Geometric mean speedup: {np.exp(np.log(speedups).mean()):.3f}x")
+    print(f"  Improvements: {int(res['is_improvement'].sum())}, regressions: {int(res['is_regression'].sum())}")
+    saved = (res['baseline_median_ms'] - res['variant_median_ms']).sum()
+    print(f"  Total median runtime saved: {saved:,.2f} ms")
+    worst = res.sort_values('speedup').head(5)
+    for _, r in worst[worst['is_regression']].iterrows():
+        print(f"  Regression {r['query_name']}: {r['baseline_median_ms']:.2f} ms -> {r['variant_median_ms']:.2f} ms ({r['chosen_tag']})")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Execute the LCM-chosen plans and measure real speedups.")
+    parser.add_argument("--warmup", type=int, default=WARMUP_RUNS, help="untimed warmup runs per plan")
+    parser.add_argument("--runs", type=int, default=TIMED_RUNS, help="timed runs per plan")
+    parser.add_argument("--cache-mode", choices=["warm", "hook"], default="warm" if CACHE_MODE == "discard" else CACHE_MODE,
+                        help="cache reset performed before every timed run")
+    parser.add_argument("--tolerance", type=float, default=VALIDATION_REGRESSION_TOLERANCE,
+                        help="relative slowdown above which a variant counts as a regression")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not os.path.exists(CHOICES_CSV):
+        raise FileNotFoundError(f"Chosen plans missing at {CHOICES_CSV}. Run generate_plans.py first.")
+    choices = pd.read_csv(CHOICES_CSV)
+    metrics = metrics_store.read_table('query_metrics', columns=['query_name', 'category'])
+
+    res = validate(choices, metrics, warmup=args.warmup, runs=args.runs,
+                   cache_mode=args.cache_mode, tolerance=args.tolerance)
+    res.to_csv(OUT_CSV, index=False)
+    print_summary(res)
+    print(f"Wrote plan validation to {OUT_CSV}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""Shared workload loader.
+
+Scans the query folders once and keeps an in-memory index of every query:
+
+    name -> {name, category, path, text, hash, template, tables, join_predicates, filters}
+
+`tables` maps each alias to its table, `join_predicates` lists the predicates
+between two or more aliases and `filters` every other conjunct (parsed by
+models/sql_features.py). `template` is the fingerprint of the query with its
+literals stripped (sql_features.template_fingerprint): queries that differ
+only in constants share it, and `sample(n)` picks at most n of them. The
+index can be persisted (WORKLOAD_INDEX in config.py); on the next run only
+files whose size or modification time changed are read and parsed again.
+
+Scripts look queries up here instead of walking `queries/` themselves:
+
+    wl = load_workload()
+    wl.sql("medium_q3.sql"), wl.category("medium_q3.sql"), wl.by_category("large")
+    wl.templates(), wl.sample(per_template=2)
+    with_query_text(df)   # SQL of metrics rows collected before rows carried it
+"""
+import os
+import sys
+import json
+import random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import QUERY_DIR, WORKLOAD_INDEX
+from result_cache import query_hash
+from models.sql_features import sql_features, template_fingerprint
+
+_INDEX_VERSION = 3
+
+
+def _resolve(path):
+    return path if os.path.isabs(path) else os.path.join(ROOT, path)
+
+
+def parse_metadata(text):
+    """Tables (alias -> table), join predicates and filters of a query."""
+    f = sql_features(text)
+    return {"template": template_fingerprint(text), "tables": dict(f["tables"]),
+            "join_predicates": list(f["join_predicates"]), "filters": list(f["filters"])}
+
+
+class Workload:
+    """Index of the queries under one query directory."""
+
+    def __init__(self, query_dir, queries):
+        self.query_dir = query_dir
+        self.queries = queries
+
+    def __contains__(self, name):
+        return name in self.queries
+
+    def __len__(self):
+        return len(self.queries)
+
+    def get(self, name):
+        return self.queries.get(name)
+
+    def sql(self, name):
+        """Query text of `name`, or None when it is not part of the workload."""
+        q = self.queries.get(name)
+        return q["text"] if q else None
+
+    def category(self, name):
+        q = self.queries.get(name)
+        return q["category"] if q else None
+
+    def categories(self):
+        return sorted({q["category"] for q in self.queries.values()})
+
+    def by_category(self, category):
+        """Entries of one category folder, sorted by file name."""
+        return sorted((q for q in self.queries.values() if q["category"] == category),
+                      key=lambda q: q["name"])
+
+    def templates(self):
+        """{template fingerprint: sorted query names}."""
+        groups = {}
+        for name in sorted(self.queries):
+            groups.setdefault(self.queries[name]["template"], []).append(name)
+        return groups
+
+    def sample(self, per_template, seed=0):
+        """Names of at most `per_template` queries of every template (all of them when
+        `per_template` is None), drawn reproducibly for a given `seed`."""
+        if per_template is None:
+            return set(self.queries)
+        rng = random.Random(seed)
+        chosen = set()
+        for names in self.templates().values():
+            chosen.update(names if len(names) <= per_template else rng.sample(names, per_template))
+        return chosen
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": _INDEX_VERSION, "query_dir": self.query_dir, "queries": self.queries}, f)
+        os.replace(tmp, path)
+
+
+def _read_index(path, query_dir):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if saved.get("version") != _INDEX_VERSION or saved.get("query_dir") != query_dir:
+        return {}
+    return {q["path"]: q for q in saved.get("queries", {}).values()}
+
+
+def scan(query_dir=QUERY_DIR, index_path=WORKLOAD_INDEX):
+    """Walk `query_dir/<category>/*.sql` once and build the index.
+
+    Entries of a persisted index at `index_path` are reused for files whose
+    size and mtime are unchanged; the refreshed index is written back.
+    """
+    query_dir = _resolve(query_dir)
+    index_path = _resolve(index_path) if index_path else None
+    previous = _read_index(index_path, query_dir) if index_path else {}
+
+    queries = {}
+    changed = False
+    if os.path.isdir(query_dir):
+        for category in sorted(e.name for e in os.scandir(query_dir) if e.is_dir()):
+            for entry in sorted(os.scandir(os.path.join(query_dir, category)), key=lambda e: e.name):
+                if not entry.name.endswith(".sql") or not entry.is_file():
+                    continue
+                st = entry.stat()
+                q = previous.get(entry.path)
+                if q is None or q["mtime_ns"] != st.st_mtime_ns or q["size"] != st.st_size:
+                    with open(entry.path, "r", encoding="utf-8") as f:
+                        text = f.read().strip()
+                    q = {"name": entry.name, "category": category, "path": entry.path,
+                         "mtime_ns": st.st_mtime_ns, "size": st.st_size,
+                         "text": text, "hash": query_hash(text), **parse_metadata(text)}
+                    changed = True
+                if entry.name in queries:
+                    print(f"Warning: {entry.name} exists in several categories; using {queries[entry.name]['path']}")
+                    continue
+                queries[entry.name] = q
+
+    workload = Workload(query_dir, queries)
+    if index_path and (changed or len(queries) != len(previous)):
+        workload.save(index_path)
+    return workload
+
+
+_loaded = {}
+
+
+def index_path_for(query_dir):
+    # WORKLOAD_INDEX belongs to QUERY_DIR; any other workload folder gets its own file next to it
+    if not WORKLOAD_INDEX or _resolve(query_dir) == _resolve(QUERY_DIR):
+        return WORKLOAD_INDEX
+    base, ext = os.path.splitext(WORKLOAD_INDEX)
+    return f"{base}-{os.path.basename(os.path.normpath(query_dir))}{ext}"
+
+
+def load_workload(query_dir=QUERY_DIR, refresh=False):
+    """Process-wide shared index of `query_dir`; scanned on first use only."""
+    key = _resolve(query_dir)
+    if refresh or key not in _loaded:
+        _loaded[key] = scan(query_dir, index_path_for(query_dir))
+    return _loaded[key]
+
+
+def with_query_text(df, query_dir=QUERY_DIR):
+    """`df` with a `query_text` column for the SQL features: rows that do not carry their
+    SQL (tables collected before the collector stored it) get it from the workload by name."""
+    workload = load_workload(query_dir)
+    looked_up = df["query_name"].map(workload.sql) if "query_name" in df.columns else None
+    if "query_text" not in df.columns:
+        df["query_text"] = looked_up
+    elif looked_up is not None:
+        df["query_text"] = df["query_text"].where(df["query_text"].map(lambda q: isinstance(q, str)), looked_up)
+    return df